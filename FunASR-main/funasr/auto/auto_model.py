@@ -6,6 +6,8 @@
 import json
 import time
 import copy
+import queue
+import threading
 import torch
 import random
 import string
@@ -108,6 +110,19 @@ def prepare_data_iterator(data_in, input_len=None, data_type=None, key=None):
     return key_list, data_list
 
 
+def new_batch_stats():
+    # speech and padded: samples of the vad segments in the asr batches, without and with padding
+    return {"batches": 0, "segments": 0, "speech": 0, "padded": 0, "time": 0.0}
+
+
+def log_batch_stats(batch_stats):
+    logging.info(
+        f"asr batches: {batch_stats['segments']} segments in {batch_stats['batches']} batches, "
+        f"padding efficiency {batch_stats['speech'] / max(batch_stats['padded'], 1):0.3f}, "
+        f"{batch_stats['segments'] / max(batch_stats['time'], 1e-6):0.1f} segments/s"
+    )
+
+
 class AutoModel:
 
     def __init__(self, **kwargs):
@@ -171,6 +186,7 @@ class AutoModel:
         self.spk_model = spk_model
         self.spk_kwargs = spk_kwargs
         self.model_path = kwargs.get("model_path")
+        self.batch_stats = new_batch_stats()
 
     @staticmethod
     def build_model(**kwargs):
@@ -396,13 +412,23 @@ class AutoModel:
                 torch.cuda.empty_cache()
         return asr_result_list
 
-    def inference_with_vad(self, input, input_len=None, **cfg):
+    def inference_with_vad(self, input, input_len=None, key=None, **cfg):
+        # key names the recordings only, it is kept out of cfg, which is merged into the model
+        # kwargs and passed on to the per-segment and punc inference
         kwargs = self.kwargs
+        if cfg.get("pipeline", kwargs.get("pipeline", False)):
+            return self.inference_with_vad_pipeline(input, input_len=input_len, key=key, **cfg)
+
         # step.1: compute the vad model
         deep_update(self.vad_kwargs, cfg)
         beg_vad = time.time()
         res = self.inference(
-            input, input_len=input_len, model=self.vad_model, kwargs=self.vad_kwargs, **cfg
+            input,
+            input_len=input_len,
+            model=self.vad_model,
+            kwargs=self.vad_kwargs,
+            key=key,
+            **cfg,
         )
         end_vad = time.time()
 
@@ -414,11 +440,11 @@ class AutoModel:
                 )
 
         # step.2 compute asr model
-        model = self.model
         deep_update(kwargs, cfg)
-        batch_size = max(int(kwargs.get("batch_size_s", 300)) * 1000, 1)
-        batch_size_threshold_ms = int(kwargs.get("batch_size_threshold_s", 60)) * 1000
-        kwargs["batch_size"] = batch_size
+        kwargs["batch_size"] = max(int(kwargs.get("batch_size_s", 300)) * 1000, 1)
+        # the vad segments of pool_inputs inputs are batched together
+        pool_inputs = max(int(kwargs.get("pool_inputs", 1)), 1)
+        self.batch_stats = new_batch_stats()
 
         key_list, data_list = prepare_data_iterator(
             input, input_len=input_len, data_type=kwargs.get("data_type", None)
@@ -432,221 +458,41 @@ class AutoModel:
             if not kwargs.get("disable_pbar", False)
             else None
         )
-        for i in range(len(res)):
-            key = res[i]["key"]
-            vadsegments = res[i]["value"]
-            input_i = data_list[i]
-            fs = kwargs["frontend"].fs if hasattr(kwargs["frontend"], "fs") else 16000
-            speech = load_audio_text_image_video(input_i, fs=fs, audio_fs=kwargs.get("fs", 16000))
-            speech_lengths = len(speech)
-            n = len(vadsegments)
-            data_with_index = [(vadsegments[i], i) for i in range(n)]
-            sorted_data = sorted(data_with_index, key=lambda x: x[0][1] - x[0][0])
-            results_sorted = []
-
-            if not len(sorted_data):
-                results_ret_list.append({"key": key, "text": "", "timestamp": []})
-                logging.info("decoding, utt: {}, empty speech".format(key))
-                continue
-
-            if len(sorted_data) > 0 and len(sorted_data[0]) > 0:
-                batch_size = max(batch_size, sorted_data[0][0][1] - sorted_data[0][0][0])
-
-            if kwargs["device"] == "cpu":
-                batch_size = 0
-
-            beg_idx = 0
+        for beg_idx in range(0, len(res), pool_inputs):
+            recordings = []
+            for i in range(beg_idx, min(len(res), beg_idx + pool_inputs)):
+                input_i = data_list[i]
+                fs = kwargs["frontend"].fs if hasattr(kwargs["frontend"], "fs") else 16000
+                speech = load_audio_text_image_video(
+                    input_i, fs=fs, audio_fs=kwargs.get("fs", 16000)
+                )
+                recordings.append((res[i]["key"], speech, res[i]["value"]))
             beg_asr_total = time.time()
-            time_speech_total_per_sample = speech_lengths / 16000
+            time_speech_total_per_sample = sum(len(speech) for _, speech, _ in recordings) / 16000
             time_speech_total_all_samples += time_speech_total_per_sample
 
-            # pbar_sample = tqdm(colour="blue", total=n, dynamic_ncols=True)
-
-            all_segments = []
-            max_len_in_batch = 0
-            end_idx = 1
-            for j, _ in enumerate(range(0, n)):
-                # pbar_sample.update(1)
-                sample_length = sorted_data[j][0][1] - sorted_data[j][0][0]
-                potential_batch_length = max(max_len_in_batch, sample_length) * (j + 1 - beg_idx)
-                # batch_size_ms_cum += sorted_data[j][0][1] - sorted_data[j][0][0]
-                if (
-                    j < n - 1
-                    and sample_length < batch_size_threshold_ms
-                    and potential_batch_length < batch_size
-                ):
-                    max_len_in_batch = max(max_len_in_batch, sample_length)
-                    end_idx += 1
+            restored_list = self.inference_segments_pooled(recordings, kwargs=kwargs, **cfg)
+            for (key, speech, vadsegments), restored_data in zip(recordings, restored_list):
+                if restored_data is None:
+                    results_ret_list.append({"key": key, "text": "", "timestamp": []})
                     continue
-
-                speech_j, speech_lengths_j = slice_padding_audio_samples(
-                    speech, speech_lengths, sorted_data[beg_idx:end_idx]
-                )
-                results = self.inference(
-                    speech_j, input_len=None, model=model, kwargs=kwargs, **cfg
-                )
+                all_segments = []
                 if self.spk_model is not None:
-                    # compose vad segments: [[start_time_sec, end_time_sec, speech], [...]]
-                    for _b in range(len(speech_j)):
-                        vad_segments = [
-                            [
-                                sorted_data[beg_idx:end_idx][_b][0][0] / 1000.0,
-                                sorted_data[beg_idx:end_idx][_b][0][1] / 1000.0,
-                                np.array(speech_j[_b]),
-                            ]
-                        ]
-                        segments = sv_chunk(vad_segments)
-                        all_segments.extend(segments)
-                        speech_b = [i[2] for i in segments]
-                        spk_res = self.inference(
-                            speech_b, input_len=None, model=self.spk_model, kwargs=kwargs, **cfg
-                        )
-                        results[_b]["spk_embedding"] = spk_res[0]["spk_embedding"]
-                beg_idx = end_idx
-                end_idx += 1
-                max_len_in_batch = sample_length
-                if len(results) < 1:
-                    continue
-                results_sorted.extend(results)
-
-            # end_asr_total = time.time()
-            # time_escape_total_per_sample = end_asr_total - beg_asr_total
-            # pbar_sample.update(1)
-            # pbar_sample.set_description(f"rtf_avg_per_sample: {time_escape_total_per_sample / time_speech_total_per_sample:0.3f}, "
-            #                      f"time_speech_total_per_sample: {time_speech_total_per_sample: 0.3f}, "
-            #                      f"time_escape_total_per_sample: {time_escape_total_per_sample:0.3f}")
+                    all_segments = self.inference_spk_segments(
+                        speech, vadsegments, restored_data, kwargs=kwargs, **cfg
+                    )
 
-            if len(results_sorted) != n:
-                results_ret_list.append({"key": key, "text": "", "timestamp": []})
-                logging.info("decoding, utt: {}, empty result".format(key))
-                continue
-            restored_data = [0] * n
-            for j in range(n):
-                index = sorted_data[j][1]
-                restored_data[index] = results_sorted[j]
-            result = {}
-
-            # results combine for texts, timestamps, speaker embeddings and others
-            # TODO: rewrite for clean code
-            for j in range(n):
-                for k, v in restored_data[j].items():
-                    if k.startswith("timestamp"):
-                        if k not in result:
-                            result[k] = []
-                        for t in restored_data[j][k]:
-                            t[0] += vadsegments[j][0]
-                            t[1] += vadsegments[j][0]
-                        result[k].extend(restored_data[j][k])
-                    elif k == "spk_embedding":
-                        if k not in result:
-                            result[k] = restored_data[j][k]
-                        else:
-                            result[k] = torch.cat([result[k], restored_data[j][k]], dim=0)
-                    elif "text" in k:
-                        if k not in result:
-                            result[k] = restored_data[j][k]
-                        else:
-                            result[k] += " " + restored_data[j][k]
-                    else:
-                        if k not in result:
-                            result[k] = restored_data[j][k]
-                        else:
-                            result[k] += restored_data[j][k]
-
-            if not len(result["text"].strip()):
-                continue
-            return_raw_text = kwargs.get("return_raw_text", False)
-            # step.3 compute punc model
-            raw_text = None
-            if self.punc_model is not None:
-                deep_update(self.punc_kwargs, cfg)
-                punc_res = self.inference(
-                    result["text"], model=self.punc_model, kwargs=self.punc_kwargs, **cfg
+                # step.3 compute punc model
+                result = self.postprocess_segments(
+                    key, restored_data, vadsegments, all_segments, kwargs=kwargs, **cfg
                 )
-                raw_text = copy.copy(result["text"])
-                if return_raw_text:
-                    result["raw_text"] = raw_text
-                result["text"] = punc_res[0]["text"]
-
-            # speaker embedding cluster after resorted
-            if self.spk_model is not None and kwargs.get("return_spk_res", True):
-                if raw_text is None:
-                    logging.error("Missing punc_model, which is required by spk_model.")
-                all_segments = sorted(all_segments, key=lambda x: x[0])
-                spk_embedding = result["spk_embedding"]
-                labels = self.cb_model(
-                    spk_embedding.cpu(), oracle_num=kwargs.get("preset_spk_num", None)
-                )
-                # del result['spk_embedding']
-                sv_output = postprocess(all_segments, None, labels, spk_embedding.cpu())
-                if self.spk_mode == "vad_segment":  # recover sentence_list
-                    sentence_list = []
-                    for rest, vadsegment in zip(restored_data, vadsegments):
-                        if "timestamp" not in rest:
-                            logging.error(
-                                "Only 'iic/speech_paraformer-large-vad-punc_asr_nat-zh-cn-16k-common-vocab8404-pytorch' \
-                                           and 'iic/speech_seaco_paraformer_large_asr_nat-zh-cn-16k-common-vocab8404-pytorch'\
-                                           can predict timestamp, and speaker diarization relies on timestamps."
-                            )
-                        sentence_list.append(
-                            {
-                                "start": vadsegment[0],
-                                "end": vadsegment[1],
-                                "sentence": rest["text"],
-                                "timestamp": rest["timestamp"],
-                            }
-                        )
-                elif self.spk_mode == "punc_segment":
-                    if "timestamp" not in result:
-                        logging.error(
-                            "Only 'iic/speech_paraformer-large-vad-punc_asr_nat-zh-cn-16k-common-vocab8404-pytorch' \
-                                       and 'iic/speech_seaco_paraformer_large_asr_nat-zh-cn-16k-common-vocab8404-pytorch'\
-                                       can predict timestamp, and speaker diarization relies on timestamps."
-                        )
-                    if kwargs.get("en_post_proc", False):
-                        sentence_list = timestamp_sentence_en(
-                            punc_res[0]["punc_array"],
-                            result["timestamp"],
-                            raw_text,
-                            return_raw_text=return_raw_text,
-                        )
-                    else:
-                        sentence_list = timestamp_sentence(
-                            punc_res[0]["punc_array"],
-                            result["timestamp"],
-                            raw_text,
-                            return_raw_text=return_raw_text,
-                        )
-                distribute_spk(sentence_list, sv_output)
-                result["sentence_info"] = sentence_list
-            elif kwargs.get("sentence_timestamp", False):
-                if not len(result["text"].strip()):
-                    sentence_list = []
-                else:
-                    if kwargs.get("en_post_proc", False):
-                        sentence_list = timestamp_sentence_en(
-                            punc_res[0]["punc_array"],
-                            result["timestamp"],
-                            raw_text,
-                            return_raw_text=return_raw_text,
-                        )
-                    else:
-                        sentence_list = timestamp_sentence(
-                            punc_res[0]["punc_array"],
-                            result["timestamp"],
-                            raw_text,
-                            return_raw_text=return_raw_text,
-                        )
-                result["sentence_info"] = sentence_list
-            if "spk_embedding" in result:
-                del result["spk_embedding"]
-
-            result["key"] = key
-            results_ret_list.append(result)
+                if result is None:
+                    continue
+                results_ret_list.append(result)
             end_asr_total = time.time()
             time_escape_total_per_sample = end_asr_total - beg_asr_total
             if pbar_total:
-                pbar_total.update(1)
+                pbar_total.update(len(recordings))
                 pbar_total.set_description(
                     f"rtf_avg: {time_escape_total_per_sample / time_speech_total_per_sample:0.3f}, "
                     f"time_speech: {time_speech_total_per_sample: 0.3f}, "
@@ -658,8 +504,412 @@ class AutoModel:
         # print(f"rtf_avg_all: {time_escape_total_all_samples / time_speech_total_all_samples:0.3f}, "
         #                      f"time_speech_all: {time_speech_total_all_samples: 0.3f}, "
         #                      f"time_escape_all: {time_escape_total_all_samples:0.3f}")
+        log_batch_stats(self.batch_stats)
         return results_ret_list
 
+    def inference_with_vad_pipeline(self, input, input_len=None, key=None, **cfg):
+        """
+        inference_with_vad as a pipeline: audio decoding, vad, asr, speaker embedding and
+        punc/speaker clustering run in their own threads, connected by bounded queues of
+        pipeline_queue_size recordings, so that decoding and vad of the next recordings overlap
+        the asr of the current one. Per stage counters are logged and kept in self.pipeline_stats.
+        """
+        kwargs = self.kwargs
+        deep_update(self.vad_kwargs, cfg)
+        deep_update(kwargs, cfg)
+        kwargs["batch_size"] = max(int(kwargs.get("batch_size_s", 300)) * 1000, 1)
+        # the speaker model runs with the asr kwargs, which inference() updates, in another thread
+        spk_kwargs = copy.copy(kwargs)
+        queue_size = max(int(kwargs.get("pipeline_queue_size", 4)), 1)
+        pool_inputs = max(int(kwargs.get("pool_inputs", 1)), 1)
+        self.batch_stats = new_batch_stats()
+        fs = kwargs["frontend"].fs if hasattr(kwargs["frontend"], "fs") else 16000
+        vad_fs = getattr(self.vad_kwargs.get("frontend", None), "fs", 16000)
+
+        key_list, data_list = prepare_data_iterator(
+            input, input_len=input_len, data_type=kwargs.get("data_type", None), key=key
+        )
+        results = {}
+        pbar_total = (
+            tqdm(colour="red", total=len(data_list), dynamic_ncols=True)
+            if not kwargs.get("disable_pbar", False)
+            else None
+        )
+
+        def decode(item):
+            index, (key, input_i) = item
+            speech = load_audio_text_image_video(input_i, fs=fs, audio_fs=kwargs.get("fs", 16000))
+            return {"index": index, "key": key, "input": input_i, "speech": speech}
+
+        def vad(item):
+            # the decoded audio is reused unless the vad model wants another sample rate
+            data_in = item["speech"] if vad_fs == fs else item["input"]
+            res = self.inference(
+                data_in, model=self.vad_model, kwargs=self.vad_kwargs, key=item["key"], **cfg
+            )
+            item["vadsegments"] = res[0]["value"]
+            if cfg.get("merge_vad", False):
+                item["vadsegments"] = merge_vad(
+                    item["vadsegments"], kwargs.get("merge_length_s", 15) * 1000
+                )
+            return item
+
+        def asr(items):
+            restored_list = self.inference_segments_pooled(
+                [(item["key"], item["speech"], item["vadsegments"]) for item in items],
+                kwargs=kwargs,
+                **cfg,
+            )
+            for item, restored_data in zip(items, restored_list):
+                item["restored_data"] = restored_data
+            return items
+
+        def spk(item):
+            item["all_segments"] = []
+            if item["restored_data"] is not None:
+                item["all_segments"] = self.inference_spk_segments(
+                    item["speech"],
+                    item["vadsegments"],
+                    item["restored_data"],
+                    kwargs=spk_kwargs,
+                    **cfg,
+                )
+            return item
+
+        def punc(item):
+            if item["restored_data"] is None:
+                results[item["index"]] = {"key": item["key"], "text": "", "timestamp": []}
+            else:
+                result = self.postprocess_segments(
+                    item["key"],
+                    item["restored_data"],
+                    item["vadsegments"],
+                    item.get("all_segments", []),
+                    kwargs=kwargs,
+                    **cfg,
+                )
+                if result is not None:
+                    results[item["index"]] = result
+            return item
+
+        # (name, fn, group): a stage with a group takes lists of up to group recordings
+        stages = [("decode", decode, None), ("vad", vad, None), ("asr", asr, pool_inputs)]
+        if self.spk_model is not None:
+            stages.append(("spk", spk, None))
+        stages.append(("punc", punc, None))
+        stats = {name: {"items": 0, "audio": 0.0, "time": 0.0} for name, _, _ in stages}
+        stop = threading.Event()
+        errors = []
+
+        def grouped(items, group):
+            items_group = []
+            for item in items:
+                items_group.append(item)
+                if len(items_group) == group:
+                    yield items_group
+                    items_group = []
+            if items_group:
+                yield items_group
+
+        def run_stage(name, fn, group, queue_in, queue_out):
+            if queue_in is None:
+                items = enumerate(zip(key_list, data_list))
+            else:
+                items = iter(queue_in.get, None)
+            if group is not None:
+                items = grouped(items, group)
+            try:
+                for item in items:
+                    if stop.is_set():
+                        # keep draining, the stage before may be blocked on a full queue
+                        if queue_in is None:
+                            break
+                        continue
+                    time1 = time.perf_counter()
+                    try:
+                        outputs = fn(item) if group is not None else [fn(item)]
+                    except Exception as e:
+                        logging.error(f"pipeline stage {name} failed: {e}")
+                        errors.append(e)
+                        stop.set()
+                        continue
+                    stats[name]["time"] += time.perf_counter() - time1
+                    stats[name]["items"] += len(outputs)
+                    stats[name]["audio"] += sum(len(output["speech"]) for output in outputs) / fs
+                    if queue_out is not None:
+                        for output in outputs:
+                            queue_out.put(output)
+                    elif pbar_total:
+                        pbar_total.update(len(outputs))
+                        pbar_total.set_description(
+                            ", ".join(
+                                f"{k}: {v['audio'] / max(v['time'], 1e-6):0.1f}x"
+                                for k, v in stats.items()
+                            )
+                        )
+            finally:
+                if queue_out is not None:
+                    queue_out.put(None)
+
+        queues = [None] + [queue.Queue(maxsize=queue_size) for _ in stages[1:]] + [None]
+        threads = [
+            threading.Thread(
+                target=run_stage, args=(name, fn, group, queues[i], queues[i + 1]), daemon=True
+            )
+            for i, (name, fn, group) in enumerate(stages)
+        ]
+        beg_total = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        end_total = time.perf_counter()
+        if errors:
+            raise errors[0]
+
+        for name, stat in stats.items():
+            logging.info(
+                f"pipeline stage {name}: {stat['items']} recordings, {stat['audio']:0.1f}s audio, "
+                f"busy {stat['time']:0.1f}s of {end_total - beg_total:0.1f}s, "
+                f"{stat['audio'] / max(stat['time'], 1e-6):0.1f}x realtime"
+            )
+        self.pipeline_stats = stats
+        log_batch_stats(self.batch_stats)
+        return [results[index] for index in sorted(results.keys())]
+
+    def inference_segments(self, key, speech, vadsegments, kwargs=None, **cfg):
+        """
+        asr of the vad segments of one recording, sorted by duration and batched up to
+        batch_size_s; returns the results in the order of vadsegments, None if there are none
+        """
+        return self.inference_segments_pooled([(key, speech, vadsegments)], kwargs=kwargs, **cfg)[0]
+
+    def inference_segments_pooled(self, recordings, kwargs=None, **cfg):
+        """
+        asr of the vad segments of several recordings [(key, speech, vadsegments), ...]: the
+        segments of all of them are pooled, sorted by duration and batched up to batch_size_s
+        across recording boundaries, which keeps the padding low even for short recordings.
+        Returns, per recording, the results in the order of its vadsegments, None if there are
+        none. Batching counters are accumulated in self.batch_stats.
+        """
+        kwargs = self.kwargs if kwargs is None else kwargs
+        model = self.model
+        batch_size = kwargs["batch_size"]
+        batch_size_threshold_ms = int(kwargs.get("batch_size_threshold_s", 60)) * 1000
+        batch_stats = self.batch_stats
+
+        # (vadsegment, index of the recording, index of the segment in the recording)
+        sorted_data = []
+        for r, (key, speech, vadsegments) in enumerate(recordings):
+            if not len(vadsegments):
+                logging.info("decoding, utt: {}, empty speech".format(key))
+            sorted_data.extend([(vadsegments[j], r, j) for j in range(len(vadsegments))])
+        sorted_data = sorted(sorted_data, key=lambda x: x[0][1] - x[0][0])
+        n = len(sorted_data)
+        restored_list = [[None] * len(vadsegments) for _, _, vadsegments in recordings]
+
+        if len(sorted_data) > 0 and len(sorted_data[0]) > 0:
+            batch_size = max(batch_size, sorted_data[0][0][1] - sorted_data[0][0][0])
+
+        if kwargs["device"] == "cpu":
+            batch_size = 0
+
+        beg_idx = 0
+        max_len_in_batch = 0
+        end_idx = 1
+        for j, _ in enumerate(range(0, n)):
+            sample_length = sorted_data[j][0][1] - sorted_data[j][0][0]
+            potential_batch_length = max(max_len_in_batch, sample_length) * (j + 1 - beg_idx)
+            if (
+                j < n - 1
+                and sample_length < batch_size_threshold_ms
+                and potential_batch_length < batch_size
+            ):
+                max_len_in_batch = max(max_len_in_batch, sample_length)
+                end_idx += 1
+                continue
+
+            batch = sorted_data[beg_idx:end_idx]
+            speech_j = []
+            for segment in batch:
+                speech = recordings[segment[1]][1]
+                speech_j.extend(slice_padding_audio_samples(speech, len(speech), [segment])[0])
+            time1 = time.perf_counter()
+            results = self.inference(speech_j, input_len=None, model=model, kwargs=kwargs, **cfg)
+            batch_stats["time"] += time.perf_counter() - time1
+            batch_stats["batches"] += 1
+            batch_stats["segments"] += len(batch)
+            batch_stats["speech"] += sum(len(speech) for speech in speech_j)
+            batch_stats["padded"] += max(len(speech) for speech in speech_j) * len(batch)
+            beg_idx = end_idx
+            end_idx += 1
+            max_len_in_batch = sample_length
+            if len(results) != len(batch):
+                continue
+            for segment, result in zip(batch, results):
+                restored_list[segment[1]][segment[2]] = result
+
+        for r, (key, _, vadsegments) in enumerate(recordings):
+            if not len(vadsegments):
+                restored_list[r] = None
+            elif any(result is None for result in restored_list[r]):
+                logging.info("decoding, utt: {}, empty result".format(key))
+                restored_list[r] = None
+        return restored_list
+
+    def inference_spk_segments(self, speech, vadsegments, restored_data, kwargs=None, **cfg):
+        """
+        speaker embeddings of the vad segments of one recording, added to restored_data;
+        returns the sv chunks of all segments
+        """
+        kwargs = self.kwargs if kwargs is None else kwargs
+        # compose vad segments: [[start_time_sec, end_time_sec, speech], [...]]
+        speech_list, _ = slice_padding_audio_samples(
+            speech, len(speech), [(vadsegment, j) for j, vadsegment in enumerate(vadsegments)]
+        )
+        all_segments = []
+        for j, speech_j in enumerate(speech_list):
+            vad_segments = [
+                [vadsegments[j][0] / 1000.0, vadsegments[j][1] / 1000.0, np.array(speech_j)]
+            ]
+            segments = sv_chunk(vad_segments)
+            all_segments.extend(segments)
+            speech_b = [i[2] for i in segments]
+            spk_res = self.inference(
+                speech_b, input_len=None, model=self.spk_model, kwargs=kwargs, **cfg
+            )
+            restored_data[j]["spk_embedding"] = spk_res[0]["spk_embedding"]
+        return all_segments
+
+    def postprocess_segments(
+        self, key, restored_data, vadsegments, all_segments, kwargs=None, **cfg
+    ):
+        """
+        combine the results of the vad segments of one recording, then add punctuation and
+        speaker labels; returns None if nothing was recognized
+        """
+        kwargs = self.kwargs if kwargs is None else kwargs
+        n = len(restored_data)
+        result = {}
+
+        # results combine for texts, timestamps, speaker embeddings and others
+        # TODO: rewrite for clean code
+        for j in range(n):
+            for k, v in restored_data[j].items():
+                if k.startswith("timestamp"):
+                    if k not in result:
+                        result[k] = []
+                    for t in restored_data[j][k]:
+                        t[0] += vadsegments[j][0]
+                        t[1] += vadsegments[j][0]
+                    result[k].extend(restored_data[j][k])
+                elif k == "spk_embedding":
+                    if k not in result:
+                        result[k] = restored_data[j][k]
+                    else:
+                        result[k] = torch.cat([result[k], restored_data[j][k]], dim=0)
+                elif "text" in k:
+                    if k not in result:
+                        result[k] = restored_data[j][k]
+                    else:
+                        result[k] += " " + restored_data[j][k]
+                else:
+                    if k not in result:
+                        result[k] = restored_data[j][k]
+                    else:
+                        result[k] += restored_data[j][k]
+
+        if not len(result["text"].strip()):
+            return None
+        return_raw_text = kwargs.get("return_raw_text", False)
+        # step.3 compute punc model
+        raw_text = None
+        if self.punc_model is not None:
+            deep_update(self.punc_kwargs, cfg)
+            punc_res = self.inference(
+                result["text"], model=self.punc_model, kwargs=self.punc_kwargs, **cfg
+            )
+            raw_text = copy.copy(result["text"])
+            if return_raw_text:
+                result["raw_text"] = raw_text
+            result["text"] = punc_res[0]["text"]
+
+        # speaker embedding cluster after resorted
+        if self.spk_model is not None and kwargs.get("return_spk_res", True):
+            if raw_text is None:
+                logging.error("Missing punc_model, which is required by spk_model.")
+            all_segments = sorted(all_segments, key=lambda x: x[0])
+            spk_embedding = result["spk_embedding"]
+            labels = self.cb_model(
+                spk_embedding.cpu(), oracle_num=kwargs.get("preset_spk_num", None)
+            )
+            # del result['spk_embedding']
+            sv_output = postprocess(all_segments, None, labels, spk_embedding.cpu())
+            if self.spk_mode == "vad_segment":  # recover sentence_list
+                sentence_list = []
+                for rest, vadsegment in zip(restored_data, vadsegments):
+                    if "timestamp" not in rest:
+                        logging.error(
+                            "Only 'iic/speech_paraformer-large-vad-punc_asr_nat-zh-cn-16k-common-vocab8404-pytorch' \
+                                       and 'iic/speech_seaco_paraformer_large_asr_nat-zh-cn-16k-common-vocab8404-pytorch'\
+                                       can predict timestamp, and speaker diarization relies on timestamps."
+                        )
+                    sentence_list.append(
+                        {
+                            "start": vadsegment[0],
+                            "end": vadsegment[1],
+                            "sentence": rest["text"],
+                            "timestamp": rest["timestamp"],
+                        }
+                    )
+            elif self.spk_mode == "punc_segment":
+                if "timestamp" not in result:
+                    logging.error(
+                        "Only 'iic/speech_paraformer-large-vad-punc_asr_nat-zh-cn-16k-common-vocab8404-pytorch' \
+                                   and 'iic/speech_seaco_paraformer_large_asr_nat-zh-cn-16k-common-vocab8404-pytorch'\
+                                   can predict timestamp, and speaker diarization relies on timestamps."
+                    )
+                if kwargs.get("en_post_proc", False):
+                    sentence_list = timestamp_sentence_en(
+                        punc_res[0]["punc_array"],
+                        result["timestamp"],
+                        raw_text,
+                        return_raw_text=return_raw_text,
+                    )
+                else:
+                    sentence_list = timestamp_sentence(
+                        punc_res[0]["punc_array"],
+                        result["timestamp"],
+                        raw_text,
+                        return_raw_text=return_raw_text,
+                    )
+            distribute_spk(sentence_list, sv_output)
+            result["sentence_info"] = sentence_list
+        elif kwargs.get("sentence_timestamp", False):
+            if not len(result["text"].strip()):
+                sentence_list = []
+            else:
+                if kwargs.get("en_post_proc", False):
+                    sentence_list = timestamp_sentence_en(
+                        punc_res[0]["punc_array"],
+                        result["timestamp"],
+                        raw_text,
+                        return_raw_text=return_raw_text,
+                    )
+                else:
+                    sentence_list = timestamp_sentence(
+                        punc_res[0]["punc_array"],
+                        result["timestamp"],
+                        raw_text,
+                        return_raw_text=return_raw_text,
+                    )
+            result["sentence_info"] = sentence_list
+        if "spk_embedding" in result:
+            del result["spk_embedding"]
+
+        result["key"] = key
+        return result
+
     def export(self, input=None, **cfg):
         """
 
@@ -74,6 +74,85 @@ def apply_lfr(inputs, lfr_m, lfr_n):
     return LFR_outputs.clone().type(torch.float32)
 
 
+def batch_fbank(
+    waveforms: torch.Tensor,
+    waveform_lengths: torch.Tensor,
+    num_mel_bins: int = 80,
+    frame_length: float = 25.0,
+    frame_shift: float = 10.0,
+    dither: float = 0.0,
+    window_type: str = "hamming",
+    sample_frequency: float = 16000.0,
+    preemphasis_coefficient: float = 0.97,
+    blackman_coeff: float = 0.42,
+    low_freq: float = 20.0,
+    high_freq: float = 0.0,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    kaldi.fbank (snip_edges=True, energy_floor=0.0, power spectrum, log mel) over a padded batch
+    waveforms: (batch, samples), every waveform_lengths[i] >= the window size
+    returns the padded feats (batch, frames, num_mel_bins) and the number of frames of each item
+    """
+    device, dtype = waveforms.device, waveforms.dtype
+    window_size = int(sample_frequency * frame_length * 0.001)
+    window_shift = int(sample_frequency * frame_shift * 0.001)
+    padded_window_size = kaldi._next_power_of_2(window_size)
+
+    feats_lens = (waveform_lengths.to(device) - window_size) // window_shift + 1
+    # frames never reach into the padding of their own waveform, see feats_lens
+    frames = waveforms.unfold(1, window_size, window_shift)[:, : int(feats_lens.max())]
+    if dither != 0.0:
+        frames = frames + dither * torch.randn_like(frames)
+    else:
+        frames = frames.clone()
+    frames = frames - frames.mean(dim=-1, keepdim=True)
+    if preemphasis_coefficient != 0.0:
+        frames = torch.cat(
+            (
+                frames[..., :1] * (1.0 - preemphasis_coefficient),
+                frames[..., 1:] - preemphasis_coefficient * frames[..., :-1],
+            ),
+            dim=-1,
+        )
+    window = kaldi._feature_window_function(window_type, window_size, blackman_coeff, device, dtype)
+    spectrum = torch.fft.rfft(frames * window, n=padded_window_size).abs().pow(2.0)
+
+    mel_banks, _ = kaldi.get_mel_banks(
+        num_mel_bins, padded_window_size, sample_frequency, low_freq, high_freq, 100.0, -500.0, 1.0
+    )
+    # the Nyquist bin has no weight in kaldi
+    mel_banks = torch.nn.functional.pad(mel_banks, (0, 1), mode="constant", value=0)
+    mel_energies = torch.matmul(spectrum, mel_banks.to(device=device, dtype=dtype).T)
+    feats = torch.max(mel_energies, kaldi._get_epsilon(device, dtype)).log()
+
+    mask = torch.arange(feats.size(1), device=device)[None, :] < feats_lens[:, None]
+    return feats * mask[:, :, None], feats_lens
+
+
+def batch_apply_lfr(inputs, inputs_lengths, lfr_m, lfr_n):
+    """
+    apply_lfr over a padded batch (batch, frames, dim): the frames before the first and
+    after the last frame of each item are copies of them, as in apply_lfr
+    """
+    batch_size, _, feat_dim = inputs.shape
+    device = inputs.device
+    outputs_lengths = (inputs_lengths + lfr_n - 1) // lfr_n
+    index = (
+        torch.arange(int(outputs_lengths.max()), device=device)[:, None] * lfr_n
+        + torch.arange(lfr_m, device=device)[None, :]
+        - (lfr_m - 1) // 2
+    )
+    index = torch.minimum(index[None].clamp(min=0), (inputs_lengths - 1)[:, None, None])
+    outputs = torch.gather(
+        inputs,
+        1,
+        index.reshape(batch_size, -1, 1).expand(-1, -1, feat_dim),
+    )
+    outputs = outputs.reshape(batch_size, -1, lfr_m * feat_dim)
+    mask = torch.arange(outputs.size(1), device=device)[None, :] < outputs_lengths[:, None]
+    return outputs * mask[:, :, None], outputs_lengths
+
+
 @tables.register("frontend_classes", "wav_frontend")
 @tables.register("frontend_classes", "WavFrontend")
 class WavFrontend(nn.Module):
@@ -94,6 +173,7 @@ class WavFrontend(nn.Module):
         dither: float = 1.0,
         snip_edges: bool = True,
         upsacle_samples: bool = True,
+        batch_fbank: bool = False,
         **kwargs,
     ):
         super().__init__()
@@ -110,6 +190,8 @@ class WavFrontend(nn.Module):
         self.dither = dither
         self.snip_edges = snip_edges
         self.upsacle_samples = upsacle_samples
+        # compute fbank, lfr and cmvn for the whole padded batch at once instead of per utterance
+        self.batch_fbank = batch_fbank
         self.cmvn = None if self.cmvn_file is None else load_cmvn(self.cmvn_file)
 
     def output_size(self) -> int:
@@ -121,6 +203,12 @@ class WavFrontend(nn.Module):
         input_lengths,
         **kwargs,
     ) -> Tuple[torch.Tensor, torch.Tensor]:
+        if self.batch_fbank and self.snip_edges:
+            input_lengths = torch.as_tensor(input_lengths, device=input.device)
+            # utterances shorter than a frame use a shorter frame, see below
+            if bool((input_lengths >= int(self.fs * self.frame_length / 1000)).all()):
+                return self.forward_batch(input, input_lengths)
+
         batch_size = input.size(0)
         feats = []
         feats_lens = []
@@ -157,6 +245,31 @@ class WavFrontend(nn.Module):
             feats_pad = pad_sequence(feats, batch_first=True, padding_value=0.0)
         return feats_pad, feats_lens
 
+    def forward_batch(
+        self, input: torch.Tensor, input_lengths: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        waveforms = input[:, : int(input_lengths.max())]
+        if self.upsacle_samples:
+            waveforms = waveforms * (1 << 15)
+        feats, feats_lens = batch_fbank(
+            waveforms,
+            input_lengths,
+            num_mel_bins=self.n_mels,
+            frame_length=self.frame_length,
+            frame_shift=self.frame_shift,
+            dither=self.dither,
+            window_type=self.window,
+            sample_frequency=self.fs,
+        )
+        if self.lfr_m != 1 or self.lfr_n != 1:
+            feats, feats_lens = batch_apply_lfr(feats, feats_lens, self.lfr_m, self.lfr_n)
+        if self.cmvn is not None:
+            dim = feats.size(-1)
+            cmvn = self.cmvn.to(feats.device)
+            mask = torch.arange(feats.size(1), device=feats.device)[None, :] < feats_lens[:, None]
+            feats = (feats + cmvn[0, :dim]) * cmvn[1, :dim] * mask[:, :, None]
+        return feats.type(torch.float32), feats_lens.to("cpu", torch.int64)
+
     def forward_fbank(
         self, input: torch.Tensor, input_lengths: torch.Tensor
     ) -> Tuple[torch.Tensor, torch.Tensor]:
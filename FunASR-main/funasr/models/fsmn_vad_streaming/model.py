@@ -19,6 +19,15 @@ from funasr.utils.datadir_writer import DatadirWriter
 from funasr.utils.load_utils import load_audio_text_image_video, extract_fbank
 
 
+def compute_decibel(
+    waveform: np.ndarray, frame_sample_length: int, frame_shift_length: int
+) -> np.ndarray:
+    """decibel of every frame of waveform (1, samples)"""
+    offsets = np.arange(0, waveform.shape[1] - frame_sample_length + 1, frame_shift_length)
+    frames = waveform[0, offsets[:, np.newaxis] + np.arange(frame_sample_length)]
+    return 10 * np.log10(np.sum(np.square(frames), axis=1) + 0.000001)
+
+
 class VadStateMachine(Enum):
     kVadInStateStartPointNotDetected = 1
     kVadInStateInSpeechSegment = 2
@@ -336,13 +345,9 @@ class FsmnVADStreaming(nn.Module):
                 (cache["stats"].data_buf_all, cache["stats"].waveform[0])
             )
             
-        waveform_numpy = cache["stats"].waveform.numpy()
-
-        offsets = np.arange(0, waveform_numpy.shape[1] - frame_sample_length + 1, frame_shift_length)
-        frames = waveform_numpy[0, offsets[:, np.newaxis] + np.arange(frame_sample_length)]
-
-        decibel_numpy = 10 * np.log10(np.sum(np.square(frames), axis=1) + 0.000001)
-        decibel_numpy = decibel_numpy.tolist()
+        decibel_numpy = compute_decibel(
+            cache["stats"].waveform.numpy(), frame_sample_length, frame_shift_length
+        ).tolist()
 
         cache["stats"].decibel.extend(decibel_numpy)
 
@@ -686,6 +691,11 @@ class FsmnVADStreaming(nn.Module):
         is_streaming_input = cfg["is_streaming_input"]
         time2 = time.perf_counter()
         meta_data["load_data"] = f"{time2 - time1:0.3f}"
+        if kwargs.get("vectorized_detect", False) and _is_final and not is_streaming_input:
+            # the whole input is here, decide all of its frames at once
+            return self.inference_vectorized(
+                audio_sample_list, key, frontend, cache, meta_data, **kwargs
+            )
         assert len(audio_sample_list) == 1, "batch_size must be set 1"
 
         audio_sample = torch.cat((cache["prev_samples"], audio_sample_list[0]))
@@ -746,6 +756,84 @@ class FsmnVADStreaming(nn.Module):
 
         return results, meta_data
 
+    def inference_vectorized(
+        self,
+        audio_sample_list: list,
+        key: list,
+        frontend,
+        cache: dict,
+        meta_data: dict,
+        **kwargs,
+    ):
+        """
+        offline inference of whole inputs, any number of them: the fbank and encoder run chunk
+        by chunk as in inference, then the frame decisions of each input are made at once by
+        ComputeFrameStates and DetectAllFrames, giving the same segments as inference
+        """
+        chunk_size = kwargs.get("chunk_size", 60000)
+        chunk_stride_samples = int(chunk_size * frontend.fs / 1000)
+        frame_sample_length = int(self.vad_opts.frame_length_ms * self.vad_opts.sample_rate / 1000)
+        frame_shift_length = int(self.vad_opts.frame_in_ms * self.vad_opts.sample_rate / 1000)
+        sil_pdf_ids = list(self.vad_opts.sil_pdf_ids)
+        assert len(sil_pdf_ids) == self.vad_opts.silence_pdf_num and len(sil_pdf_ids) > 0
+
+        time2 = time.perf_counter()
+        batch_data_time = 0.0
+        results = []
+        for b, audio_sample in enumerate(audio_sample_list):
+            if b == 0:
+                audio_sample = torch.cat((cache["prev_samples"], audio_sample))
+            cache_b = self.init_cache({}, **kwargs)
+            decibel = []
+            sil_scores = []
+            is_final = False
+            n = int(len(audio_sample) // chunk_stride_samples + 1)
+            for i in range(n):
+                audio_sample_i = audio_sample[
+                    i * chunk_stride_samples : (i + 1) * chunk_stride_samples
+                ]
+                speech, speech_lengths = extract_fbank(
+                    [audio_sample_i],
+                    data_type=kwargs.get("data_type", "sound"),
+                    frontend=frontend,
+                    cache=cache_b["frontend"],
+                    is_final=i == n - 1,
+                )
+                batch_data_time += (
+                    speech_lengths.sum().item() * frontend.frame_shift * frontend.lfr_n / 1000
+                )
+                decibel.append(
+                    compute_decibel(
+                        cache_b["frontend"]["waveforms"].numpy(),
+                        frame_sample_length,
+                        frame_shift_length,
+                    )
+                )
+                speech = speech.to(device=kwargs["device"])
+                scores = self.encoder(speech, cache=cache_b["encoder"]).to("cpu")
+                sil_scores.append(scores[0][:, sil_pdf_ids].numpy())
+                # DetectLastFrames marks the final frame only if the last chunk has frames
+                is_final = scores.shape[1] > 0
+
+            frame_states = self.ComputeFrameStates(
+                np.concatenate(decibel), np.concatenate(sil_scores, axis=0)
+            )
+            segments = self.DetectAllFrames(frame_states, is_final=is_final, cache=cache_b)
+            results.append({"key": key[b], "value": segments})
+        time3 = time.perf_counter()
+        meta_data["extract_feat"] = f"{time3 - time2:0.3f}"
+        meta_data["batch_data_time"] = batch_data_time
+        self.init_cache(cache)
+
+        if kwargs.get("output_dir") is not None:
+            if not hasattr(self, "writer"):
+                self.writer = DatadirWriter(kwargs.get("output_dir"))
+            ibest_writer = self.writer[f"{1}best_recog"]
+            for result in results:
+                ibest_writer["text"][result["key"]] = result["value"]
+
+        return results, meta_data
+
     def export(self, **kwargs):
 
         from .export_meta import export_rebuild_model
@@ -915,3 +1003,228 @@ class FsmnVADStreaming(nn.Module):
             and self.vad_opts.detect_mode == VadDetectMode.kVadMutipleUtteranceDetectMode.value
         ):
             self.ResetDetection(cache=cache)
+
+    def ComputeFrameStates(self, decibel: np.ndarray, sil_scores: np.ndarray) -> np.ndarray:
+        """
+        GetFrameState of all frames of an utterance at once
+        decibel: (frames,), sil_scores: (frames, len(sil_pdf_ids)), the scores of the silence pdfs
+        returns 1 for speech, 0 for silence and -1 for silence below decibel_thres
+        """
+        opts = self.vad_opts
+        decibel = decibel[: sil_scores.shape[0]].astype(np.float64)
+        sum_score = sil_scores[:, 0].astype(np.float64)
+        for i in range(1, sil_scores.shape[1]):
+            sum_score = sum_score + sil_scores[:, i].astype(np.float64)
+        with np.errstate(divide="ignore"):
+            noise_prob = np.log(sum_score) * opts.speech_2_noise_ratio
+            speech_prob = np.log(1.0 - sum_score)
+        speech_exp = np.exp(speech_prob)
+        noise_exp = np.exp(noise_prob) + opts.speech_noise_thres
+        is_speech = speech_exp >= noise_exp
+        # numpy's exp and log may differ from math's in the last bit, redo the close calls
+        close = np.abs(speech_exp - noise_exp) <= 1e-9 * np.maximum(np.abs(noise_exp), 1.0)
+        for t in np.nonzero(close)[0].tolist():
+            try:
+                is_speech[t] = math.exp(math.log(1.0 - sum_score[t])) >= (
+                    math.exp(math.log(sum_score[t]) * opts.speech_2_noise_ratio)
+                    + opts.speech_noise_thres
+                )
+            except ValueError:
+                pass
+        low = decibel < opts.decibel_thres
+        is_speech &= ~low
+
+        # the noise level is a running average over the silence frames, the snr of a speech
+        # frame is measured against the average before it
+        noise_frames = np.nonzero(~is_speech & ~low)[0]
+        noise_average_decibel = -100.0
+        noise_averages = []
+        for cur_decibel in decibel[noise_frames].tolist():
+            if noise_average_decibel < -99.9:
+                noise_average_decibel = cur_decibel
+            else:
+                noise_average_decibel = (
+                    cur_decibel + noise_average_decibel * (opts.noise_frame_num_used_for_snr - 1)
+                ) / opts.noise_frame_num_used_for_snr
+            noise_averages.append(noise_average_decibel)
+        speech_frames = np.nonzero(is_speech)[0]
+        last_noise = np.searchsorted(noise_frames, speech_frames) - 1
+        noise_before = np.where(
+            last_noise >= 0, np.array(noise_averages + [-100.0])[last_noise], -100.0
+        )
+        is_speech[speech_frames] = decibel[speech_frames] - noise_before >= opts.snr_thres
+
+        frame_states = is_speech.astype(np.int8)
+        frame_states[low] = -1
+        return frame_states
+
+    def DetectAllFrames(
+        self, frame_states: np.ndarray, is_final: bool = True, cache: dict = {}
+    ) -> List[List[int]]:
+        """
+        DetectCommonFrames/DetectLastFrames over all frames of an utterance, given by
+        ComputeFrameStates, with the window detector and the state machine kept in local
+        variables; the segments [start_ms, end_ms] are the same as those of the frame by frame
+        detection. is_final: the last frame is the final frame of the input
+        """
+        opts = self.vad_opts
+        frame_ms = opts.frame_in_ms
+        multiple_utterance = opts.detect_mode == VadDetectMode.kVadMutipleUtteranceDetectMode.value
+        single_utterance = opts.detect_mode == VadDetectMode.kVadSingleUtteranceDetectMode.value
+        windows_detector = cache["windows_detector"]
+        win_size = windows_detector.win_size_frame
+        sil_to_speech = windows_detector.sil_to_speech_frmcnt_thres
+        speech_to_sil = windows_detector.speech_to_sil_frmcnt_thres
+        latency = self.LatencyFrmNumAtStartPoint(cache=cache)
+        max_end_sil = cache["stats"].max_end_sil_frame_cnt_thresh
+        max_segment_frames = opts.max_single_segment_time / frame_ms
+        lookahead_frames = int(opts.lookahead_time_end_point / frame_ms)
+        end_lookback_frames = int(max_end_sil / frame_ms)
+        if opts.do_extend:
+            end_lookback_frames = max(0, end_lookback_frames - lookahead_frames - 1)
+
+        START, SPEECH, END = 0, 1, 2
+        segments = []  # output_data_buf: [start_ms, end_ms]
+        state = START
+        win_state = [0] * win_size
+        win_sum = win_pos = 0
+        pre_speech = False
+        silence_count = 0
+        latest_speech = 0
+        latest_silence = -1
+        start_frame = -1
+        end_frame = -1
+        end_detected = 0
+        buf_start_frame = 0
+        last_drop_frames = 0
+
+        def voice_detected(beg, end):
+            # OnVoiceDetected for the frames [beg, end)
+            nonlocal latest_speech, buf_start_frame
+            if beg < end:
+                latest_speech = end - 1
+                if not segments:
+                    segments.append([beg * frame_ms, beg * frame_ms])
+                buf_start_frame = max(buf_start_frame, beg) + end - beg
+                segments[-1][1] = end * frame_ms
+
+        def voice_start(frame, fake_result):
+            nonlocal start_frame, buf_start_frame
+            if start_frame == -1:
+                start_frame = frame
+            if not fake_result and state == START:
+                buf_start_frame = max(buf_start_frame, start_frame) + 1
+                segments.append([start_frame * frame_ms, (start_frame + 1) * frame_ms])
+
+        def voice_end(frame, fake_result):
+            nonlocal end_frame, end_detected, buf_start_frame
+            voice_detected(latest_speech + 1, frame)
+            if end_frame == -1:
+                end_frame = frame
+            if not fake_result:
+                if not segments:
+                    segments.append([end_frame * frame_ms, end_frame * frame_ms])
+                buf_start_frame = max(buf_start_frame, end_frame) + 1
+                segments[-1][1] = (end_frame + 1) * frame_ms
+            end_detected += 1
+
+        def detect_one_frame(frame_state, cur_frm_idx, is_final_frame):
+            nonlocal state, win_sum, win_pos, pre_speech, silence_count, latest_silence
+            nonlocal buf_start_frame, start_frame, end_frame, latest_speech, last_drop_frames
+            win_sum += frame_state - win_state[win_pos]
+            win_state[win_pos] = frame_state
+            win_pos = (win_pos + 1) % win_size
+            if not pre_speech and win_sum >= sil_to_speech:
+                pre_speech = True
+                silence_count = 0
+                if state == START:
+                    frame = max(buf_start_frame, cur_frm_idx - latency)
+                    voice_start(frame, False)
+                    state = SPEECH
+                    voice_detected(frame + 1, cur_frm_idx + 1)
+                    return
+                if state != SPEECH:
+                    return
+                voice_detected(latest_speech + 1, cur_frm_idx)
+            elif pre_speech and win_sum <= speech_to_sil:
+                pre_speech = False
+                silence_count = 0
+                if state != SPEECH:
+                    return
+            elif pre_speech:
+                silence_count = 0
+                if state != SPEECH:
+                    return
+            else:
+                silence_count += 1
+                if state == START:
+                    if (
+                        single_utterance and silence_count * frame_ms > opts.max_start_silence_time
+                    ) or (is_final_frame and end_detected == 0):
+                        if latest_silence + 1 < cur_frm_idx:
+                            latest_silence = cur_frm_idx - 1
+                            buf_start_frame = max(buf_start_frame, latest_silence)
+                        voice_start(0, True)
+                        voice_end(0, True)
+                        state = END
+                    elif cur_frm_idx >= latency:
+                        latest_silence = cur_frm_idx - latency
+                        buf_start_frame = max(buf_start_frame, latest_silence)
+                elif state == SPEECH:
+                    if silence_count * frame_ms >= max_end_sil:
+                        voice_end(cur_frm_idx - end_lookback_frames, False)
+                        state = END
+                    elif cur_frm_idx - start_frame + 1 > max_segment_frames:
+                        voice_end(cur_frm_idx, False)
+                        state = END
+                    elif opts.do_extend and not is_final_frame:
+                        if silence_count <= lookahead_frames:
+                            voice_detected(cur_frm_idx, cur_frm_idx + 1)
+                    elif is_final_frame:
+                        voice_end(cur_frm_idx, False)
+                        state = END
+                if state == END and multiple_utterance:
+                    reset()
+                return
+
+            # speech frame in a speech segment
+            if cur_frm_idx - start_frame + 1 > max_segment_frames:
+                voice_end(cur_frm_idx, False)
+                state = END
+            elif not is_final_frame:
+                voice_detected(cur_frm_idx, cur_frm_idx + 1)
+            else:
+                voice_end(cur_frm_idx, False)
+                state = END
+            if state == END and multiple_utterance:
+                reset()
+
+        def reset():
+            # ResetDetection
+            nonlocal state, win_state, win_sum, win_pos, pre_speech, silence_count
+            nonlocal latest_speech, latest_silence, start_frame, end_frame, last_drop_frames
+            state = START
+            win_state = [0] * win_size
+            win_sum = win_pos = 0
+            pre_speech = False
+            silence_count = 0
+            latest_speech = 0
+            latest_silence = -1
+            start_frame = -1
+            end_frame = -1
+            if segments:
+                last_drop_frames = int(segments[-1][1] / frame_ms)
+
+        frame_states = frame_states.tolist()
+        if not math.fabs(1.0) > opts.fe_prior_thres:
+            frame_states = [min(frame_state, 0) for frame_state in frame_states]
+        last_frame = len(frame_states) - 1 if is_final else -1
+        for t, frame_state in enumerate(frame_states):
+            if frame_state == -1:
+                # GetFrameState detects frames below decibel_thres once more, as silence
+                detect_one_frame(0, t - last_drop_frames, False)
+                frame_state = 0
+            detect_one_frame(frame_state, t, t == last_frame)
+            if state == END and single_utterance:
+                break
+        return [[start_ms, end_ms] for start_ms, end_ms in segments]
@@ -485,6 +485,21 @@ class ParaformerStreaming(Paraformer):
         if isinstance(encoder_out, tuple):
             encoder_out = encoder_out[0]
 
+        return self.decode_chunk(
+            encoder_out, encoder_out_lens, key=key, tokenizer=tokenizer, **kwargs
+        )
+
+    def decode_chunk(
+        self,
+        encoder_out,
+        encoder_out_lens,
+        key: list = None,
+        tokenizer=None,
+        **kwargs,
+    ):
+        """Predictor + decoder of one encoded chunk, returns the tokens"""
+        cache = kwargs.get("cache", {})
+
         # predictor
         predictor_outs = self.calc_predictor_chunk(
             encoder_out, encoder_out_lens, cache=cache, is_final=kwargs.get("is_final", False)
@@ -655,6 +670,152 @@ class ParaformerStreaming(Paraformer):
 
         return result, meta_data
 
+    def encode_chunks(self, speech_list: list, cache_list: list):
+        """Encode one chunk of each of several streams.
+
+        Streams whose encoder states line up (same chunk shape and config, cached k/v of the same
+        length) go through the encoder as one batch, the others one by one.
+
+        Args:
+                speech_list: list of (1, Length, Dim) features
+                cache_list: list of the streams' caches
+        Returns:
+                list of (encoder_out, encoder_out_lens), one per stream
+        """
+        groups = {}
+        for i, (speech, cache) in enumerate(zip(speech_list, cache_list)):
+            cache_encoder = cache["encoder"]
+            opt = cache_encoder["opt"]
+            group_key = (
+                tuple(speech.shape),
+                cache_encoder["tail_chunk"],
+                tuple(cache_encoder["chunk_size"]),
+                cache_encoder["encoder_chunk_look_back"],
+                None if opt is None else opt[0]["k"].shape[2],
+            )
+            groups.setdefault(group_key, []).append(i)
+
+        outs = [None] * len(speech_list)
+        for group_key, idx in groups.items():
+            if len(idx) == 1 or group_key[1]:
+                for i in idx:
+                    speech = speech_list[i]
+                    speech_lengths = torch.tensor([speech.shape[1]], dtype=torch.int64)
+                    encoder_out, encoder_out_lens = self.encode_chunk(
+                        speech, speech_lengths, cache=cache_list[i]
+                    )
+                    if isinstance(encoder_out, tuple):
+                        encoder_out = encoder_out[0]
+                    outs[i] = (encoder_out, encoder_out_lens)
+                continue
+            speech = torch.cat([speech_list[i] for i in idx], dim=0)
+            with autocast(False):
+                if self.normalize is not None:
+                    speech_lengths = torch.tensor([speech.shape[1]] * len(idx), dtype=torch.int64)
+                    speech, _ = self.normalize(speech, speech_lengths)
+            encoder_out = self.encoder.forward_chunk_batch(
+                speech, [cache_list[i]["encoder"] for i in idx]
+            )
+            encoder_out_lens = torch.tensor([encoder_out.size(1)])
+            for j, i in enumerate(idx):
+                outs[i] = (encoder_out[j : j + 1], encoder_out_lens)
+        return outs
+
+    def inference_sessions(
+        self,
+        data_in: list,
+        caches: list,
+        is_final: list,
+        key: list = None,
+        tokenizer=None,
+        frontend=None,
+        **kwargs,
+    ):
+        """Streaming decoding of several sessions at once.
+
+        data_in[i] is the new audio of the session whose state is caches[i]; the result is the same
+        as calling inference for each session in turn, but the chunks of all sessions are encoded
+        together (see encode_chunks). The sessions must share chunk_size and the look back options.
+        """
+        is_use_ctc = kwargs.get("decoding_ctc_weight", 0.0) > 0.00001 and self.ctc != None
+        is_use_lm = (
+            kwargs.get("lm_weight", 0.0) > 0.00001 and kwargs.get("lm_file", None) is not None
+        )
+        if self.beam_search is None and (is_use_lm or is_use_ctc):
+            logging.info("enable beam_search")
+            self.init_beam_search(**kwargs)
+            self.nbest = kwargs.get("nbest", 1)
+        kwargs.pop("is_final", None)
+        kwargs.pop("cache", None)
+        if key is None:
+            key = [f"session{i}" for i in range(len(caches))]
+
+        chunk_size = kwargs.get("chunk_size", [0, 10, 5])
+        chunk_stride_samples = int(chunk_size[1] * 960)  # 600ms
+        audio_samples = []
+        chunk_nums = []
+        for i, cache in enumerate(caches):
+            if len(cache) == 0:
+                self.init_cache(cache, **kwargs)
+            audio_sample = load_audio_text_image_video(
+                data_in[i],
+                fs=frontend.fs,
+                audio_fs=kwargs.get("fs", 16000),
+                data_type=kwargs.get("data_type", "sound"),
+                tokenizer=tokenizer,
+            )
+            audio_sample = torch.cat((cache["prev_samples"], audio_sample))
+            audio_samples.append(audio_sample)
+            chunk_nums.append(int(len(audio_sample) // chunk_stride_samples + int(is_final[i])))
+
+        tokens = [[] for _ in caches]
+        for k in range(max(chunk_nums, default=0)):
+            idx = [i for i in range(len(caches)) if k < chunk_nums[i]]
+            speech_list = []
+            for i in idx:
+                cache = caches[i]
+                is_final_i = is_final[i] and k == chunk_nums[i] - 1
+                audio_sample_i = audio_samples[i][
+                    k * chunk_stride_samples : (k + 1) * chunk_stride_samples
+                ]
+                if is_final_i and len(audio_sample_i) < 960:
+                    cache["encoder"]["tail_chunk"] = True
+                    speech = cache["encoder"]["feats"]
+                else:
+                    # extract fbank feats
+                    speech, _ = extract_fbank(
+                        [audio_sample_i],
+                        data_type=kwargs.get("data_type", "sound"),
+                        frontend=frontend,
+                        cache=cache["frontend"],
+                        is_final=is_final_i,
+                    )
+                speech_list.append(speech.to(device=kwargs["device"]))
+
+            encoder_outs = self.encode_chunks(speech_list, [caches[i] for i in idx])
+            for i, (encoder_out, encoder_out_lens) in zip(idx, encoder_outs):
+                tokens[i].extend(
+                    self.decode_chunk(
+                        encoder_out,
+                        encoder_out_lens,
+                        key=[key[i]],
+                        tokenizer=tokenizer,
+                        cache=caches[i],
+                        is_final=is_final[i] and k == chunk_nums[i] - 1,
+                        **kwargs,
+                    )
+                )
+
+        results = []
+        for i, cache in enumerate(caches):
+            text_postprocessed, _ = postprocess_utils.sentence_postprocess(tokens[i])
+            results.append({"key": key[i], "text": text_postprocessed})
+            m = int(len(audio_samples[i]) % chunk_stride_samples * (1 - int(is_final[i])))
+            cache["prev_samples"] = audio_samples[i][:-m]
+            if is_final[i]:
+                self.init_cache(cache, **kwargs)
+        return results
+
     def export(self, **kwargs):
         from .export_meta import export_rebuild_model
 
@@ -497,3 +497,66 @@ class SANMEncoderChunkOpt(nn.Module):
             cache["opt"] = new_cache
 
         return xs_pad, ilens, None
+
+    def forward_chunk_batch(
+        self,
+        xs_pad: torch.Tensor,
+        caches: list,
+    ):
+        """forward_chunk over one chunk of several streams at once.
+
+        Args:
+            xs_pad: (#streams, time, size), a chunk of every stream
+            caches: the streams' encoder caches; they must share chunk_size and
+                encoder_chunk_look_back and hold cached k/v of the same length
+        Returns:
+            (#streams, time, size) encoder output, the caches are updated in place
+        """
+        xs_pad = xs_pad * self.output_size() ** 0.5
+        # position encoding and overlap frames are per stream
+        xs_list = []
+        for i, cache in enumerate(caches):
+            xs = xs_pad[i : i + 1]
+            if self.embed is not None:
+                xs = self.embed(xs, cache)
+            xs_list.append(self._add_overlap_chunk(xs, cache))
+        xs_pad = torch.cat(xs_list, dim=0)
+
+        cache = caches[0]
+        cache_layer_num = len(self.encoders0) + len(self.encoders)
+        if cache["opt"] is None:
+            new_cache = [None] * cache_layer_num
+        else:
+            new_cache = [
+                {
+                    "k": torch.cat([c["opt"][layer_idx]["k"] for c in caches], dim=0),
+                    "v": torch.cat([c["opt"][layer_idx]["v"] for c in caches], dim=0),
+                }
+                for layer_idx in range(cache_layer_num)
+            ]
+
+        for layer_idx, encoder_layer in enumerate(self.encoders0):
+            encoder_outs = encoder_layer.forward_chunk(
+                xs_pad, new_cache[layer_idx], cache["chunk_size"], cache["encoder_chunk_look_back"]
+            )
+            xs_pad, new_cache[0] = encoder_outs[0], encoder_outs[1]
+
+        for layer_idx, encoder_layer in enumerate(self.encoders):
+            encoder_outs = encoder_layer.forward_chunk(
+                xs_pad,
+                new_cache[layer_idx + len(self.encoders0)],
+                cache["chunk_size"],
+                cache["encoder_chunk_look_back"],
+            )
+            xs_pad, new_cache[layer_idx + len(self.encoders0)] = encoder_outs[0], encoder_outs[1]
+
+        if self.normalize_before:
+            xs_pad = self.after_norm(xs_pad)
+        if cache["encoder_chunk_look_back"] > 0 or cache["encoder_chunk_look_back"] == -1:
+            for i, c in enumerate(caches):
+                c["opt"] = [
+                    {"k": layer_cache["k"][i : i + 1], "v": layer_cache["v"][i : i + 1]}
+                    for layer_cache in new_cache
+                ]
+
+        return xs_pad
@@ -0,0 +1,87 @@
+# -*- encoding: utf-8 -*-
+"""
+Time the funasr_onnx WavFrontend (fbank + LFR + CMVN) per hour of audio, comparing the
+vectorized frontend with the per-frame kaldi_native_fbank path it replaces.
+
+python benchmark_frontend.py --wav asr_example.wav --minutes 10
+"""
+
+import argparse
+import time
+
+import kaldi_native_fbank as knf
+import numpy as np
+
+from funasr_onnx.utils.frontend import WavFrontend
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--wav", type=str, default=None, help="16k wav, random audio if not given")
+parser.add_argument("--minutes", type=float, default=10, help="minutes of audio to process")
+parser.add_argument("--lfr_m", type=int, default=7)
+parser.add_argument("--lfr_n", type=int, default=6)
+parser.add_argument("--repeat", type=int, default=3, help="best of n runs")
+args = parser.parse_args()
+
+
+def load_audio(path, minutes):
+    samples = int(minutes * 60 * 16000)
+    if path is None:
+        return (np.random.randn(samples) * 0.1).astype(np.float32)
+    import librosa
+
+    waveform, _ = librosa.load(path, sr=16000)
+    return np.resize(waveform, samples).astype(np.float32)
+
+
+def knf_fbank(frontend, waveform):
+    fbank_fn = knf.OnlineFbank(frontend.opts)
+    fbank_fn.accept_waveform(frontend.opts.frame_opts.samp_freq, (waveform * (1 << 15)).tolist())
+    frames = fbank_fn.num_frames_ready
+    mat = np.empty([frames, frontend.opts.mel_opts.num_bins])
+    for i in range(frames):
+        mat[i, :] = fbank_fn.get_frame(i)
+    return mat.astype(np.float32)
+
+
+def best_of(fn, repeat):
+    cost = []
+    for _ in range(repeat):
+        beg = time.perf_counter()
+        fn()
+        cost.append(time.perf_counter() - beg)
+    return min(cost)
+
+
+def main():
+    waveform = load_audio(args.wav, args.minutes)
+    frontend = WavFrontend(lfr_m=args.lfr_m, lfr_n=args.lfr_n)
+    # a unit cmvn, so that the cost of apply_cmvn is included without a model dir
+    frontend.cmvn = np.stack([np.zeros(80 * args.lfr_m), np.ones(80 * args.lfr_m)]).astype(
+        np.float32
+    )
+    hours = len(waveform) / 16000 / 3600
+
+    feat = frontend.compute_fbank(waveform)
+    stages = [
+        ("fbank (kaldi_native_fbank, per frame)", lambda: knf_fbank(frontend, waveform)),
+        ("fbank (vectorized)", lambda: frontend.compute_fbank(waveform)),
+        ("lfr", lambda: frontend.apply_lfr(feat, args.lfr_m, args.lfr_n)),
+        (
+            "lfr + cmvn",
+            lambda: frontend.apply_cmvn(frontend.apply_lfr(feat, args.lfr_m, args.lfr_n)),
+        ),
+        (
+            "fbank + lfr + cmvn",
+            lambda: frontend.apply_cmvn(
+                frontend.apply_lfr(frontend.compute_fbank(waveform), args.lfr_m, args.lfr_n)
+            ),
+        ),
+    ]
+    print("{:.1f} min of audio, best of {}".format(args.minutes, args.repeat))
+    for name, fn in stages:
+        cost = best_of(fn, args.repeat)
+        print("{:<40s} {:8.3f} s, {:8.3f} s per hour of audio".format(name, cost, cost / hours))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import copy
 from functools import lru_cache
 
 import numpy as np
+import scipy.fft
 import kaldi_native_fbank as knf
 
 root_dir = Path(__file__).resolve().parent
@@ -51,16 +52,62 @@ class WavFrontend:
         self.fbank_beg_idx = 0
         self.reset_status()
 
+        frame_opts = opts.frame_opts
+        self.frame_sample_length = int(frame_opts.frame_length_ms * frame_opts.samp_freq / 1000)
+        self.frame_shift_sample_length = int(frame_opts.frame_shift_ms * frame_opts.samp_freq / 1000)
+        self.padded_window_size = 1 << int(np.ceil(np.log2(self.frame_sample_length)))
+        self.window = feature_window(
+            frame_opts.window_type, self.frame_sample_length, frame_opts.blackman_coeff
+        )
+        self.mel_banks = mel_banks(
+            n_mels,
+            self.padded_window_size,
+            fs,
+            opts.mel_opts.low_freq,
+            opts.mel_opts.high_freq,
+        )
+
+    def compute_fbank(self, waveform: np.ndarray, block_frames: int = 4096) -> np.ndarray:
+        """
+        Kaldi fbank (the same as knf.OnlineFbank with self.opts) of a whole waveform, computed on
+        all frames at once: frames are a strided view of the waveform, the FFT and mel filter bank
+        run over blocks of block_frames frames.
+        """
+        frame_opts = self.opts.frame_opts
+        waveform = np.ascontiguousarray(waveform, dtype=np.float32)
+        if waveform.shape[0] < self.frame_sample_length:
+            return np.empty((0, self.opts.mel_opts.num_bins), dtype=np.float32)
+        frames = np.lib.stride_tricks.as_strided(
+            waveform,
+            shape=(
+                (waveform.shape[0] - self.frame_sample_length) // self.frame_shift_sample_length + 1,
+                self.frame_sample_length,
+            ),
+            strides=(waveform.strides[0] * self.frame_shift_sample_length, waveform.strides[0]),
+            writeable=False,
+        )
+        feats = []
+        for beg in range(0, frames.shape[0], block_frames):
+            block = frames[beg : beg + block_frames] * np.float32(1 << 15)
+            if frame_opts.dither != 0.0:
+                block += np.float32(frame_opts.dither) * np.random.standard_normal(
+                    block.shape
+                ).astype(np.float32)
+            if frame_opts.remove_dc_offset:
+                block -= block.mean(axis=1, keepdims=True)
+            if frame_opts.preemph_coeff != 0.0:
+                block[:, 1:] -= np.float32(frame_opts.preemph_coeff) * block[:, :-1]
+                block[:, 0] *= np.float32(1.0 - frame_opts.preemph_coeff)
+            block *= self.window
+            spectrum = scipy.fft.rfft(block, n=self.padded_window_size, axis=1)
+            power = spectrum.real**2 + spectrum.imag**2
+            mel = power @ self.mel_banks.T
+            feats.append(np.log(np.maximum(mel, np.finfo(np.float32).eps)))
+        return np.concatenate(feats, axis=0)
+
     def fbank(self, waveform: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-        waveform = waveform * (1 << 15)
-        fbank_fn = knf.OnlineFbank(self.opts)
-        fbank_fn.accept_waveform(self.opts.frame_opts.samp_freq, waveform.tolist())
-        frames = fbank_fn.num_frames_ready
-        mat = np.empty([frames, self.opts.mel_opts.num_bins])
-        for i in range(frames):
-            mat[i, :] = fbank_fn.get_frame(i)
-        feat = mat.astype(np.float32)
-        feat_len = np.array(mat.shape[0]).astype(np.int32)
+        feat = self.compute_fbank(waveform)
+        feat_len = np.array(feat.shape[0]).astype(np.int32)
         return feat, feat_len
 
     def fbank_online(self, waveform: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
@@ -92,36 +139,88 @@ class WavFrontend:
 
     @staticmethod
     def apply_lfr(inputs: np.ndarray, lfr_m: int, lfr_n: int) -> np.ndarray:
-        LFR_inputs = []
-
         T = inputs.shape[0]
         T_lfr = int(np.ceil(T / lfr_n))
-        left_padding = np.tile(inputs[0], ((lfr_m - 1) // 2, 1))
-        inputs = np.vstack((left_padding, inputs))
-        T = T + (lfr_m - 1) // 2
-        for i in range(T_lfr):
-            if lfr_m <= T - i * lfr_n:
-                LFR_inputs.append((inputs[i * lfr_n : i * lfr_n + lfr_m]).reshape(1, -1))
-            else:
-                # process last LFR frame
-                num_padding = lfr_m - (T - i * lfr_n)
-                frame = inputs[i * lfr_n :].reshape(-1)
-                for _ in range(num_padding):
-                    frame = np.hstack((frame, inputs[-1]))
-
-                LFR_inputs.append(frame)
-        LFR_outputs = np.vstack(LFR_inputs).astype(np.float32)
-        return LFR_outputs
+        left_padding = (lfr_m - 1) // 2
+        # the last LFR frames are padded with copies of the last frame
+        right_padding = max(0, (T_lfr - 1) * lfr_n + lfr_m - (T + left_padding))
+        inputs = np.concatenate(
+            (
+                np.repeat(inputs[:1], left_padding, axis=0),
+                inputs,
+                np.repeat(inputs[-1:], right_padding, axis=0),
+            ),
+            axis=0,
+        )
+        return lfr_view(inputs, lfr_m, lfr_n, T_lfr).astype(np.float32)
 
     def apply_cmvn(self, inputs: np.ndarray) -> np.ndarray:
         """
-        Apply CMVN with mvn data
+        Apply CMVN with mvn data, inputs: (..., frame, dim)
         """
-        frame, dim = inputs.shape
-        means = np.tile(self.cmvn[0:1, :dim], (frame, 1))
-        vars = np.tile(self.cmvn[1:2, :dim], (frame, 1))
-        inputs = (inputs + means) * vars
-        return inputs
+        dim = inputs.shape[-1]
+        inputs = (inputs + self.cmvn[0, :dim]) * self.cmvn[1, :dim]
+        return inputs.astype(np.float32)
+
+
+def lfr_view(inputs: np.ndarray, lfr_m: int, lfr_n: int, T_lfr: int) -> np.ndarray:
+    """(T_lfr, lfr_m * dim) strided view of inputs (T, dim), LFR frame i = inputs[i * lfr_n : i * lfr_n + lfr_m]"""
+    inputs = np.ascontiguousarray(inputs)
+    feat_dim = inputs.shape[-1]
+    return np.lib.stride_tricks.as_strided(
+        inputs,
+        shape=(T_lfr, lfr_m * feat_dim),
+        strides=(lfr_n * feat_dim * inputs.itemsize, inputs.itemsize),
+        writeable=False,
+    )
+
+
+def feature_window(window_type: str, length: int, blackman_coeff: float = 0.42) -> np.ndarray:
+    """kaldi FeatureWindowFunction"""
+    a = 2 * np.pi / (length - 1)
+    i = np.arange(length, dtype=np.float64)
+    if window_type == "hanning":
+        window = 0.5 - 0.5 * np.cos(a * i)
+    elif window_type == "sine":
+        window = np.sin(0.5 * a * i)
+    elif window_type == "hamming":
+        window = 0.54 - 0.46 * np.cos(a * i)
+    elif window_type == "povey":
+        window = np.power(0.5 - 0.5 * np.cos(a * i), 0.85)
+    elif window_type == "rectangular":
+        window = np.ones(length)
+    elif window_type == "blackman":
+        window = blackman_coeff - 0.5 * np.cos(a * i) + (0.5 - blackman_coeff) * np.cos(2 * a * i)
+    else:
+        raise ValueError(f"Invalid window type {window_type}")
+    return window.astype(np.float32)
+
+
+def mel_banks(
+    num_bins: int, padded_window_size: int, fs: int, low_freq: float = 20.0, high_freq: float = 0.0
+) -> np.ndarray:
+    """kaldi MelBanks (htk_mode false, no vtln) as a (num_bins, padded_window_size // 2 + 1) matrix"""
+
+    def mel_scale(freq):
+        return 1127.0 * np.log(1.0 + freq / 700.0)
+
+    num_fft_bins = padded_window_size // 2
+    nyquist = 0.5 * fs
+    if high_freq <= 0.0:
+        high_freq += nyquist
+    mel_low = mel_scale(low_freq)
+    mel_delta = (mel_scale(high_freq) - mel_low) / (num_bins + 1)
+    mel = mel_scale(fs / padded_window_size * np.arange(num_fft_bins))
+    left = mel_low + mel_delta * np.arange(num_bins)[:, None]
+    center = left + mel_delta
+    right = center + mel_delta
+    weights = np.where(mel <= center, (mel - left) / mel_delta, (right - mel) / mel_delta)
+    weights = np.where((mel > left) & (mel < right), weights, 0.0)
+    # the nyquist bin has no weight
+    banks = np.zeros((num_bins, num_fft_bins + 1), dtype=np.float32)
+    banks[:, :num_fft_bins] = weights
+    return banks
+
 
 @lru_cache()
 def load_cmvn(cmvn_file: Union[str, Path]) -> np.ndarray:
@@ -171,12 +270,6 @@ class WavFrontendOnline(WavFrontend):
         super().__init__(**kwargs)
         # self.fbank_fn = knf.OnlineFbank(self.opts)
         # add variables
-        self.frame_sample_length = int(
-            self.opts.frame_opts.frame_length_ms * self.opts.frame_opts.samp_freq / 1000
-        )
-        self.frame_shift_sample_length = int(
-            self.opts.frame_opts.frame_shift_ms * self.opts.frame_opts.samp_freq / 1000
-        )
         self.waveform = None
         self.reserve_waveforms = None
         self.input_cache = None
@@ -191,29 +284,24 @@ class WavFrontendOnline(WavFrontend):
         Apply lfr with data
         """
 
-        LFR_inputs = []
         T = inputs.shape[0]  # include the right context
         T_lfr = int(
             np.ceil((T - (lfr_m - 1) // 2) / lfr_n)
         )  # minus the right context: (lfr_m - 1) // 2
-        splice_idx = T_lfr
-        for i in range(T_lfr):
-            if lfr_m <= T - i * lfr_n:
-                LFR_inputs.append((inputs[i * lfr_n : i * lfr_n + lfr_m]).reshape(1, -1))
-            else:  # process last LFR frame
-                if is_final:
-                    num_padding = lfr_m - (T - i * lfr_n)
-                    frame = (inputs[i * lfr_n :]).reshape(-1)
-                    for _ in range(num_padding):
-                        frame = np.hstack((frame, inputs[-1]))
-                    LFR_inputs.append(frame)
-                else:
-                    # update splice_idx and break the circle
-                    splice_idx = i
-                    break
+        # LFR frames that do not run past the end of inputs
+        num_full = min(T_lfr, max(0, (T - lfr_m) // lfr_n + 1))
+        if is_final:
+            # the last LFR frames are padded with copies of the last frame
+            right_padding = max(0, (T_lfr - 1) * lfr_n + lfr_m - T)
+            padded = np.concatenate((inputs, np.repeat(inputs[-1:], right_padding, axis=0)), axis=0)
+            LFR_outputs = lfr_view(padded, lfr_m, lfr_n, T_lfr)
+            splice_idx = T_lfr
+        else:
+            # the incomplete LFR frames wait in the cache for the next chunk
+            LFR_outputs = lfr_view(inputs, lfr_m, lfr_n, num_full)
+            splice_idx = num_full
         splice_idx = min(T - 1, splice_idx * lfr_n)
         lfr_splice_cache = inputs[splice_idx:, :]
-        LFR_outputs = np.vstack(LFR_inputs)
         return LFR_outputs.astype(np.float32), lfr_splice_cache, splice_idx
 
     @staticmethod
@@ -226,7 +314,6 @@ class WavFrontendOnline(WavFrontend):
     def fbank(
         self, input: np.ndarray, input_lengths: np.ndarray
     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-        self.fbank_fn = knf.OnlineFbank(self.opts)
         batch_size = input.shape[0]
         if self.input_cache is None:
             self.input_cache = np.empty((batch_size, 0), dtype=np.float32)
@@ -255,15 +342,8 @@ class WavFrontendOnline(WavFrontend):
                         )
                     ]
                 )
-                waveform = waveform * (1 << 15)
-
-                self.fbank_fn.accept_waveform(self.opts.frame_opts.samp_freq, waveform.tolist())
-                frames = self.fbank_fn.num_frames_ready
-                mat = np.empty([frames, self.opts.mel_opts.num_bins])
-                for i in range(frames):
-                    mat[i, :] = self.fbank_fn.get_frame(i)
-                feat = mat.astype(np.float32)
-                feat_len = np.array(mat.shape[0]).astype(np.int32)
+                feat = self.compute_fbank(waveform)
+                feat_len = np.array(feat.shape[0]).astype(np.int32)
                 feats.append(feat)
                 feats_lens.append(feat_len)
 
@@ -0,0 +1,169 @@
+# -*- encoding: utf-8 -*-
+"""
+Load test for funasr_wss_server.py: runs N concurrent sessions that stream the same audio in
+real time and reports the latency of the streaming partial results, i.e. the time from sending
+the last chunk a partial covers (given by its "audio_ms") until the partial is received.
+
+python funasr_wss_load_test.py --host 127.0.0.1 --port 10095 --audio_in demo.wav --sessions 8
+"""
+import argparse
+import asyncio
+import json
+import ssl
+import time
+import wave
+
+import websockets
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--host", type=str, default="localhost", required=False, help="host ip, localhost, 0.0.0.0"
+)
+parser.add_argument("--port", type=int, default=10095, required=False, help="grpc server port")
+parser.add_argument("--audio_in", type=str, required=True, help="16k 16bit mono wav or pcm")
+parser.add_argument("--sessions", type=int, default=4, help="number of concurrent sessions")
+parser.add_argument("--rounds", type=int, default=1, help="times each session streams the audio")
+parser.add_argument(
+    "--stagger", type=float, default=0.5, help="seconds between the start of two sessions"
+)
+parser.add_argument("--chunk_size", type=str, default="5, 10, 5", help="chunk")
+parser.add_argument("--chunk_interval", type=int, default=10, help="chunk")
+parser.add_argument("--mode", type=str, default="2pass", help="online, 2pass")
+parser.add_argument(
+    "--final_timeout", type=float, default=30, help="seconds to wait for the last offline result"
+)
+parser.add_argument("--ssl", type=int, default=1, help="1 for ssl connect, 0 for no ssl")
+args = parser.parse_args()
+args.chunk_size = [int(x) for x in args.chunk_size.split(",")]
+
+
+def load_audio(path):
+    if path.endswith(".wav"):
+        with wave.open(path, "rb") as wav_file:
+            assert wav_file.getframerate() == 16000, "only 16k audio is supported"
+            return wav_file.readframes(wav_file.getnframes())
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+async def receive(websocket, sent, stats):
+    # sent: audio_ms -> time the chunk ending there was sent, filled by the sender
+    async for meg in websocket:
+        meg = json.loads(meg)
+        now = time.perf_counter()
+        if "audio_ms" in meg and meg["audio_ms"] in sent:
+            stats["partial"].append(now - sent[meg["audio_ms"]])
+        elif meg.get("mode") in ["offline", "2pass-offline"]:
+            stats["offline"] += 1
+            # the server marks the result of the last segment with is_final = is_speaking = False
+            if not meg.get("is_final", True):
+                stats["done"].set()
+
+
+async def session(id, audio_bytes, stats):
+    await asyncio.sleep(id * args.stagger)
+    if args.ssl == 1:
+        ssl_context = ssl.SSLContext()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        uri = "wss://{}:{}".format(args.host, args.port)
+    else:
+        uri = "ws://{}:{}".format(args.host, args.port)
+        ssl_context = None
+
+    for _ in range(args.rounds):
+        try:
+            await stream(uri, ssl_context, id, audio_bytes, stats)
+        except Exception as e:
+            stats["errors"] += 1
+            print("session{}: {}".format(id, repr(e)))
+
+
+async def stream(uri, ssl_context, id, audio_bytes, stats):
+    stride = int(60 * args.chunk_size[1] / args.chunk_interval / 1000 * 16000 * 2)
+    chunk_num = (len(audio_bytes) - 1) // stride + 1
+    async with websockets.connect(
+        uri, subprotocols=["binary"], ping_interval=None, ssl=ssl_context
+    ) as websocket:
+        sent = {}
+        stats["done"] = asyncio.Event()
+        receiver = asyncio.ensure_future(receive(websocket, sent, stats))
+        await websocket.send(
+            json.dumps(
+                {
+                    "mode": args.mode,
+                    "chunk_size": args.chunk_size,
+                    "chunk_interval": args.chunk_interval,
+                    "wav_name": "session{}".format(id),
+                    "is_speaking": True,
+                }
+            )
+        )
+        audio_ms = 0
+        start = time.perf_counter()
+        for i in range(chunk_num):
+            data = audio_bytes[i * stride : (i + 1) * stride]
+            # send in real time, a stalled server shows up as latency rather than slower sending
+            await asyncio.sleep(max(0.0, start + audio_ms / 1000.0 - time.perf_counter()))
+            # same accounting as the server's vad_pre_idx
+            audio_ms += len(data) // 32
+            sent[audio_ms] = time.perf_counter()
+            await websocket.send(data)
+        await websocket.send(json.dumps({"is_speaking": False}))
+        if args.mode == "2pass":
+            try:
+                await asyncio.wait_for(stats["done"].wait(), timeout=args.final_timeout)
+            except asyncio.TimeoutError:
+                print("session{}: no final result".format(id))
+        else:
+            await asyncio.sleep(2)
+        receiver.cancel()
+
+
+async def main():
+    audio_bytes = load_audio(args.audio_in)
+    stats = [{"partial": [], "offline": 0, "errors": 0} for _ in range(args.sessions)]
+    start = time.perf_counter()
+    await asyncio.gather(*[session(i, audio_bytes, stats[i]) for i in range(args.sessions)])
+    elapsed = time.perf_counter() - start
+
+    latencies = []
+    for i, stat in enumerate(stats):
+        latencies.extend(stat["partial"])
+        if len(stat["partial"]) > 0:
+            print(
+                "session{}: {} partials, avg {:.0f} ms, max {:.0f} ms, {} offline results".format(
+                    i,
+                    len(stat["partial"]),
+                    1000 * sum(stat["partial"]) / len(stat["partial"]),
+                    1000 * max(stat["partial"]),
+                    stat["offline"],
+                )
+            )
+    print(
+        "{} sessions, {:.1f} s, {} failed".format(
+            args.sessions, elapsed, sum(stat["errors"] for stat in stats)
+        )
+    )
+    if len(latencies) == 0:
+        print("no partial results received")
+        return
+    print(
+        "partial latency over {} results: avg {:.0f} ms, p50 {:.0f} ms, p95 {:.0f} ms, p99 {:.0f} ms, max {:.0f} ms".format(
+            len(latencies),
+            1000 * sum(latencies) / len(latencies),
+            1000 * percentile(latencies, 50),
+            1000 * percentile(latencies, 95),
+            1000 * percentile(latencies, 99),
+            1000 * max(latencies),
+        )
+    )
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -7,6 +7,8 @@ import tracemalloc
 import numpy as np
 import argparse
 import ssl
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 
 parser = argparse.ArgumentParser()
@@ -60,13 +62,33 @@ parser.add_argument(
     required=False,
     help="keyfile for ssl",
 )
+parser.add_argument(
+    "--queue_size",
+    type=int,
+    default=100,
+    help="max pending messages per connection, reading from the socket pauses when it is full",
+)
+parser.add_argument(
+    "--offline_queue_size",
+    type=int,
+    default=4,
+    help="max pending offline segments per connection",
+)
+parser.add_argument(
+    "--max_batch",
+    type=int,
+    default=16,
+    help="max connections decoded in one asr forward, 1 disables batching across connections",
+)
 args = parser.parse_args()
 
 
 websocket_users = set()
 
 print("model loading")
+import torch
 from funasr import AutoModel
+from funasr.utils.load_utils import load_bytes
 
 # asr
 model_asr = AutoModel(
@@ -114,7 +136,117 @@ else:
     model_punc = None
 
 
-print("model loaded! only support one client at the same time now!!!!")
+# Every model runs on its own single-thread executor: AutoModel.generate merges the per-call
+# cfg (e.g. the connection's cache) into the model's shared kwargs, so calls to one model must
+# not overlap. The streaming lane (vad, asr_online) and the offline lane (asr, punc) never wait
+# for each other, so a long offline decode does not delay the partial results of other clients.
+executors = {
+    name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=name) for name in ["vad", "punc"]
+}
+
+
+async def run_model(lane, model, **kwargs):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executors[lane], functools.partial(model.generate, **kwargs))
+
+
+class BatchLane:
+    """
+    Runs a model on its own thread like run_model, but the requests that arrive while the model
+    is busy are handed to run_batch together (at most max_batch at a time), so concurrent
+    connections share one forward instead of queueing up for batch size 1 each.
+    """
+
+    def __init__(self, name, run_batch, max_batch):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.pending = []
+        self.busy = False
+
+    async def submit(self, request):
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append((request, future))
+        if not self.busy:
+            self.busy = True
+            asyncio.ensure_future(self.drain())
+        return await future
+
+    async def drain(self):
+        loop = asyncio.get_event_loop()
+        while len(self.pending) > 0:
+            batch = self.pending[: self.max_batch]
+            self.pending = self.pending[self.max_batch :]
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.run_batch, [request for request, _ in batch]
+                )
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+        self.busy = False
+
+
+def asr_online_batch(requests):
+    """requests: [(audio bytes, status_dict_asr_online)], one streaming chunk per connection"""
+    results = [None] * len(requests)
+    groups = {}
+    for i, (audio_in, status) in enumerate(requests):
+        key = (
+            tuple(status.get("chunk_size", [0, 10, 5])),
+            status.get("encoder_chunk_look_back", 0),
+            status.get("decoder_chunk_look_back", 0),
+        )
+        groups.setdefault(key, []).append(i)
+    for (chunk_size, encoder_chunk_look_back, decoder_chunk_look_back), idx in groups.items():
+        kwargs = dict(model_asr_streaming.kwargs)
+        kwargs.pop("cache", None)
+        kwargs.update(
+            chunk_size=list(chunk_size),
+            encoder_chunk_look_back=encoder_chunk_look_back,
+            decoder_chunk_look_back=decoder_chunk_look_back,
+        )
+        with torch.no_grad():
+            res = model_asr_streaming.model.inference_sessions(
+                [load_bytes(requests[i][0]) for i in idx],
+                [requests[i][1]["cache"] for i in idx],
+                [requests[i][1].get("is_final", False) for i in idx],
+                **kwargs,
+            )
+        for i, result in zip(idx, res):
+            results[i] = result
+    return results
+
+
+def asr_offline_batch(requests):
+    """requests: [(audio bytes, status_dict_asr)], one vad segment per connection"""
+    results = [None] * len(requests)
+    groups = {}
+    for i, (audio_in, status) in enumerate(requests):
+        groups.setdefault(json.dumps(status, sort_keys=True), []).append(i)
+    for idx in groups.values():
+        res = model_asr.generate(
+            input=[load_bytes(requests[i][0]) for i in idx],
+            batch_size=len(idx),
+            **requests[idx[0]][1],
+        )
+        for i, result in zip(idx, res):
+            results[i] = result
+    return results
+
+
+model_asr_streaming.model.eval()
+lanes = {
+    "asr_online": BatchLane("asr_online", asr_online_batch, args.max_batch),
+    "asr": BatchLane("asr", asr_offline_batch, args.max_batch),
+}
+
+
+print("model loaded!")
 
 
 async def ws_reset(websocket):
@@ -136,9 +268,6 @@ async def clear_websocket():
 
 
 async def ws_serve(websocket, path):
-    frames = []
-    frames_asr = []
-    frames_asr_online = []
     global websocket_users
     # await clear_websocket()
     websocket_users.add(websocket)
@@ -148,111 +277,155 @@ async def ws_serve(websocket, path):
     websocket.status_dict_punc = {"cache": {}}
     websocket.chunk_interval = 10
     websocket.vad_pre_idx = 0
-    speech_start = False
-    speech_end_i = -1
     websocket.wav_name = "microphone"
     websocket.mode = "2pass"
+    # messages are handled in order by ws_consume, offline segments by ws_offline; both queues are
+    # bounded, so a connection that sends faster than its models keep up is throttled by TCP flow
+    # control instead of growing the server's memory
+    websocket.message_queue = asyncio.Queue(maxsize=args.queue_size)
+    websocket.offline_queue = asyncio.Queue(maxsize=args.offline_queue_size)
     print("new user connected", flush=True)
 
+    tasks = [
+        asyncio.ensure_future(ws_read(websocket)),
+        asyncio.ensure_future(ws_consume(websocket)),
+        asyncio.ensure_future(ws_offline(websocket)),
+    ]
     try:
-        async for message in websocket:
-            if isinstance(message, str):
-                messagejson = json.loads(message)
-
-                if "is_speaking" in messagejson:
-                    websocket.is_speaking = messagejson["is_speaking"]
-                    websocket.status_dict_asr_online["is_final"] = not websocket.is_speaking
-                if "chunk_interval" in messagejson:
-                    websocket.chunk_interval = messagejson["chunk_interval"]
-                if "wav_name" in messagejson:
-                    websocket.wav_name = messagejson.get("wav_name")
-                if "chunk_size" in messagejson:
-                    chunk_size = messagejson["chunk_size"]
-                    if isinstance(chunk_size, str):
-                        chunk_size = chunk_size.split(",")
-                    websocket.status_dict_asr_online["chunk_size"] = [int(x) for x in chunk_size]
-                if "encoder_chunk_look_back" in messagejson:
-                    websocket.status_dict_asr_online["encoder_chunk_look_back"] = messagejson[
-                        "encoder_chunk_look_back"
-                    ]
-                if "decoder_chunk_look_back" in messagejson:
-                    websocket.status_dict_asr_online["decoder_chunk_look_back"] = messagejson[
-                        "decoder_chunk_look_back"
-                    ]
-                if "hotwords" in messagejson:
-                    websocket.status_dict_asr["hotword"] = messagejson["hotwords"]
-                if "mode" in messagejson:
-                    websocket.mode = messagejson["mode"]
-
-            websocket.status_dict_vad["chunk_size"] = int(
-                websocket.status_dict_asr_online["chunk_size"][1] * 60 / websocket.chunk_interval
-            )
-            if len(frames_asr_online) > 0 or len(frames_asr) >= 0 or not isinstance(message, str):
-                if not isinstance(message, str):
-                    frames.append(message)
-                    duration_ms = len(message) // 32
-                    websocket.vad_pre_idx += duration_ms
-
-                    # asr online
-                    frames_asr_online.append(message)
-                    websocket.status_dict_asr_online["is_final"] = speech_end_i != -1
-                    if (
-                        len(frames_asr_online) % websocket.chunk_interval == 0
-                        or websocket.status_dict_asr_online["is_final"]
-                    ):
-                        if websocket.mode == "2pass" or websocket.mode == "online":
-                            audio_in = b"".join(frames_asr_online)
-                            try:
-                                await async_asr_online(websocket, audio_in)
-                            except:
-                                print(f"error in asr streaming, {websocket.status_dict_asr_online}")
-                        frames_asr_online = []
-                    if speech_start:
-                        frames_asr.append(message)
-                    # vad online
-                    try:
-                        speech_start_i, speech_end_i = await async_vad(websocket, message)
-                    except:
-                        print("error in vad")
-                    if speech_start_i != -1:
-                        speech_start = True
-                        beg_bias = (websocket.vad_pre_idx - speech_start_i) // duration_ms
-                        frames_pre = frames[-beg_bias:]
-                        frames_asr = []
-                        frames_asr.extend(frames_pre)
-                # asr punc offline
-                if speech_end_i != -1 or not websocket.is_speaking:
-                    # print("vad end point")
-                    if websocket.mode == "2pass" or websocket.mode == "offline":
-                        audio_in = b"".join(frames_asr)
-                        try:
-                            await async_asr(websocket, audio_in)
-                        except:
-                            print("error in asr offline")
-                    frames_asr = []
-                    speech_start = False
-                    frames_asr_online = []
-                    websocket.status_dict_asr_online["cache"] = {}
-                    if not websocket.is_speaking:
-                        websocket.vad_pre_idx = 0
-                        frames = []
-                        websocket.status_dict_vad["cache"] = {}
-                    else:
-                        frames = frames[-20:]
-
+        # ws_read returns when the client disconnects, the consumers only return by raising (a bad
+        # message, a model error); either way the connection is done, and the error must close it
+        # rather than leave ws_read blocked on a queue nobody drains
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
     except websockets.ConnectionClosed:
         print("ConnectionClosed...", websocket_users, flush=True)
-        await ws_reset(websocket)
-        websocket_users.remove(websocket)
     except websockets.InvalidState:
         print("InvalidState...")
     except Exception as e:
         print("Exception:", e)
+    finally:
+        # results can no longer be delivered once the client is gone; wait for the tasks to
+        # finish cancelling so none of them outlives the connection
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await ws_reset(websocket)
+        websocket_users.discard(websocket)
+
+
+async def ws_read(websocket):
+    async for message in websocket:
+        await websocket.message_queue.put(message)
+
+
+async def ws_consume(websocket):
+    frames = []
+    frames_asr = []
+    frames_asr_online = []
+    speech_start = False
+    speech_end_i = -1
+
+    while True:
+        message = await websocket.message_queue.get()
+        if isinstance(message, str):
+            messagejson = json.loads(message)
+
+            if "is_speaking" in messagejson:
+                websocket.is_speaking = messagejson["is_speaking"]
+                websocket.status_dict_asr_online["is_final"] = not websocket.is_speaking
+            if "chunk_interval" in messagejson:
+                websocket.chunk_interval = messagejson["chunk_interval"]
+            if "wav_name" in messagejson:
+                websocket.wav_name = messagejson.get("wav_name")
+            if "chunk_size" in messagejson:
+                chunk_size = messagejson["chunk_size"]
+                if isinstance(chunk_size, str):
+                    chunk_size = chunk_size.split(",")
+                websocket.status_dict_asr_online["chunk_size"] = [int(x) for x in chunk_size]
+            if "encoder_chunk_look_back" in messagejson:
+                websocket.status_dict_asr_online["encoder_chunk_look_back"] = messagejson[
+                    "encoder_chunk_look_back"
+                ]
+            if "decoder_chunk_look_back" in messagejson:
+                websocket.status_dict_asr_online["decoder_chunk_look_back"] = messagejson[
+                    "decoder_chunk_look_back"
+                ]
+            if "hotwords" in messagejson:
+                websocket.status_dict_asr["hotword"] = messagejson["hotwords"]
+            if "mode" in messagejson:
+                websocket.mode = messagejson["mode"]
+
+        websocket.status_dict_vad["chunk_size"] = int(
+            websocket.status_dict_asr_online["chunk_size"][1] * 60 / websocket.chunk_interval
+        )
+        if len(frames_asr_online) > 0 or len(frames_asr) >= 0 or not isinstance(message, str):
+            if not isinstance(message, str):
+                frames.append(message)
+                duration_ms = len(message) // 32
+                websocket.vad_pre_idx += duration_ms
+
+                # asr online
+                frames_asr_online.append(message)
+                websocket.status_dict_asr_online["is_final"] = speech_end_i != -1
+                if (
+                    len(frames_asr_online) % websocket.chunk_interval == 0
+                    or websocket.status_dict_asr_online["is_final"]
+                ):
+                    if websocket.mode == "2pass" or websocket.mode == "online":
+                        audio_in = b"".join(frames_asr_online)
+                        try:
+                            await async_asr_online(websocket, audio_in)
+                        except Exception:
+                            print(f"error in asr streaming, {websocket.status_dict_asr_online}")
+                    frames_asr_online = []
+                if speech_start:
+                    frames_asr.append(message)
+                # vad online
+                try:
+                    speech_start_i, speech_end_i = await async_vad(websocket, message)
+                except Exception:
+                    print("error in vad")
+                    speech_start_i, speech_end_i = -1, -1
+                if speech_start_i != -1:
+                    speech_start = True
+                    beg_bias = (websocket.vad_pre_idx - speech_start_i) // duration_ms
+                    frames_pre = frames[-beg_bias:]
+                    frames_asr = []
+                    frames_asr.extend(frames_pre)
+            # asr punc offline
+            if speech_end_i != -1 or not websocket.is_speaking:
+                # print("vad end point")
+                if websocket.mode == "2pass" or websocket.mode == "offline":
+                    audio_in = b"".join(frames_asr)
+                    # decoded by ws_offline, the streaming path goes on with the next message
+                    await websocket.offline_queue.put((audio_in, websocket.is_speaking))
+                frames_asr = []
+                speech_start = False
+                frames_asr_online = []
+                websocket.status_dict_asr_online["cache"] = {}
+                if not websocket.is_speaking:
+                    websocket.vad_pre_idx = 0
+                    frames = []
+                    websocket.status_dict_vad["cache"] = {}
+                else:
+                    frames = frames[-20:]
+
+
+async def ws_offline(websocket):
+    while True:
+        audio_in, is_speaking = await websocket.offline_queue.get()
+        try:
+            await async_asr(websocket, audio_in, is_speaking)
+        except Exception:
+            print("error in asr offline")
 
 
 async def async_vad(websocket, audio_in):
 
-    segments_result = model_vad.generate(input=audio_in, **websocket.status_dict_vad)[0]["value"]
+    segments_result = (
+        await run_model("vad", model_vad, input=audio_in, **websocket.status_dict_vad)
+    )[0]["value"]
     # print(segments_result)
 
     speech_start = -1
@@ -267,15 +440,17 @@ async def async_vad(websocket, audio_in):
     return speech_start, speech_end
 
 
-async def async_asr(websocket, audio_in):
+async def async_asr(websocket, audio_in, is_speaking):
     if len(audio_in) > 0:
         # print(len(audio_in))
-        rec_result = model_asr.generate(input=audio_in, **websocket.status_dict_asr)[0]
+        rec_result = await lanes["asr"].submit((audio_in, websocket.status_dict_asr))
         # print("offline_asr, ", rec_result)
         if model_punc is not None and len(rec_result["text"]) > 0:
             # print("offline, before punc", rec_result, "cache", websocket.status_dict_punc)
-            rec_result = model_punc.generate(
-                input=rec_result["text"], **websocket.status_dict_punc
+            rec_result = (
+                await run_model(
+                    "punc", model_punc, input=rec_result["text"], **websocket.status_dict_punc
+                )
             )[0]
             # print("offline, after punc", rec_result)
         if len(rec_result["text"]) > 0:
@@ -286,7 +461,7 @@ async def async_asr(websocket, audio_in):
                     "mode": mode,
                     "text": rec_result["text"],
                     "wav_name": websocket.wav_name,
-                    "is_final": websocket.is_speaking,
+                    "is_final": is_speaking,
                 }
             )
             await websocket.send(message)
@@ -298,17 +473,17 @@ async def async_asr(websocket, audio_in):
                 "mode": mode,
                 "text": "",
                 "wav_name": websocket.wav_name,
-                "is_final": websocket.is_speaking,
+                "is_final": is_speaking,
             }
         )
-        await websocket.send(message)    
+        await websocket.send(message)
+
 
 async def async_asr_online(websocket, audio_in):
     if len(audio_in) > 0:
         # print(websocket.status_dict_asr_online.get("is_final", False))
-        rec_result = model_asr_streaming.generate(
-            input=audio_in, **websocket.status_dict_asr_online
-        )[0]
+        audio_ms = websocket.vad_pre_idx
+        rec_result = await lanes["asr_online"].submit((audio_in, websocket.status_dict_asr_online))
         # print("online, ", rec_result)
         if websocket.mode == "2pass" and websocket.status_dict_asr_online.get("is_final", False):
             return
@@ -321,6 +496,9 @@ async def async_asr_online(websocket, audio_in):
                     "text": rec_result["text"],
                     "wav_name": websocket.wav_name,
                     "is_final": websocket.is_speaking,
+                    # audio received on this connection (ms) when the chunk was decoded,
+                    # lets a client measure the latency of partial results
+                    "audio_ms": audio_ms,
                 }
             )
             await websocket.send(message)
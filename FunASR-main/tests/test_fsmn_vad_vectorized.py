@@ -0,0 +1,131 @@
+import unittest
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from funasr.models.fsmn_vad_streaming.model import FsmnVADStreaming, VADXOptions, compute_decibel
+
+
+class IdentityEncoder(torch.nn.Module):
+    """the synthetic scores are fed as feats"""
+
+    def forward(self, feats, cache=None):
+        return feats
+
+
+def make_model(**opts):
+    model = FsmnVADStreaming.__new__(FsmnVADStreaming)
+    torch.nn.Module.__init__(model)
+    model.vad_opts = VADXOptions(**opts)
+    model.encoder = IdentityEncoder()
+    return model
+
+
+def synthetic_input(rng, n_frames, n_pdf=2, frame_shift=160, frame_length=400):
+    """alternating speech / silence runs of random length: scores (1, frames, n_pdf) and waveform"""
+    sil = np.empty(n_frames)
+    t, speech = 0, True
+    while t < n_frames:
+        run = int(rng.choice([rng.integers(1, 30), rng.integers(20, 400), rng.integers(300, 2000)]))
+        prob = rng.uniform(0.005, 0.35, run) if speech else rng.uniform(0.3, 0.9, run)
+        sil[t : t + run] = prob[: n_frames - t]
+        t, speech = t + run, not speech
+    scores = rng.uniform(0.001, 0.05, (1, n_frames, n_pdf)).astype(np.float32)
+    scores[0, :, 0] = sil
+    amplitude = np.repeat(np.where(sil < 0.5, 0.3, 0.01), frame_shift)
+    amplitude = np.concatenate([amplitude, amplitude[-(frame_length - frame_shift) :]])
+    waveform = rng.standard_normal(len(amplitude)) * amplitude * rng.uniform(0.5, 2.0)
+    return scores, waveform.astype(np.float32)
+
+
+def chunk_bounds(n_frames, chunk_frames, empty_last_chunk):
+    bounds = [(b, min(n_frames, b + chunk_frames)) for b in range(0, n_frames, chunk_frames)]
+    if empty_last_chunk:
+        bounds.append((n_frames, n_frames))
+    return bounds
+
+
+def chunk_waveform(waveform, beg, end, frame_shift=160, frame_length=400):
+    if end == beg:
+        return waveform[:0]
+    return waveform[beg * frame_shift : (end - 1) * frame_shift + frame_length]
+
+
+def detect_frame_by_frame(model, scores, waveform, bounds):
+    cache = model.init_cache({})
+    segments = []
+    for i, (beg, end) in enumerate(bounds):
+        out = model.forward(
+            feats=torch.from_numpy(scores[:, beg:end]),
+            waveform=torch.from_numpy(chunk_waveform(waveform, beg, end))[None, :],
+            cache=cache,
+            is_final=i == len(bounds) - 1,
+            is_streaming_input=False,
+        )
+        for segment_batch in out:
+            segments.extend(segment_batch)
+    return segments
+
+
+def detect_vectorized(model, scores, waveform, bounds):
+    cache = model.init_cache({})
+    opts = model.vad_opts
+    decibel = np.concatenate(
+        [
+            compute_decibel(chunk_waveform(waveform, beg, end)[None, :], 400, 160)
+            for beg, end in bounds
+        ]
+    )
+    frame_states = model.ComputeFrameStates(decibel, scores[0][:, opts.sil_pdf_ids])
+    # as in inference_vectorized, the final frame is marked only if the last chunk has frames
+    is_final = bounds[-1][1] > bounds[-1][0]
+    return model.DetectAllFrames(frame_states, is_final=is_final, cache=cache), frame_states
+
+
+class TestFsmnVADVectorized(unittest.TestCase):
+    def assert_same_segments(self, opts, n_frames=6000, chunk_frames=1000, empty_last_chunk=False):
+        rng = np.random.default_rng(0)
+        for _ in range(3):
+            scores, waveform = synthetic_input(rng, n_frames)
+            bounds = chunk_bounds(n_frames, chunk_frames, empty_last_chunk)
+            expected = detect_frame_by_frame(make_model(**opts), scores, waveform, bounds)
+            segments, frame_states = detect_vectorized(make_model(**opts), scores, waveform, bounds)
+            self.assertEqual(segments, expected)
+        return segments, frame_states
+
+    def test_multiple_utterance(self):
+        segments, _ = self.assert_same_segments({})
+        self.assertGreater(len(segments), 1)
+
+    def test_single_utterance(self):
+        self.assert_same_segments({"detect_mode": 0})
+        self.assert_same_segments({"detect_mode": 0, "max_start_silence_time": 500})
+
+    def test_no_extend(self):
+        self.assert_same_segments({"do_extend": 0})
+        self.assert_same_segments({"do_extend": 0, "detect_mode": 0})
+
+    def test_low_energy_frames(self):
+        opts = {"decibel_thres": -10.0, "snr_thres": 2.0}
+        _, frame_states = self.assert_same_segments(opts)
+        self.assertTrue((frame_states == -1).any())
+        self.assert_same_segments({**opts, "max_single_segment_time": 2000})
+
+    def test_empty_last_chunk(self):
+        self.assert_same_segments({}, empty_last_chunk=True)
+        self.assert_same_segments({"detect_mode": 0}, empty_last_chunk=True)
+
+    def test_segment_limits(self):
+        self.assert_same_segments({"max_single_segment_time": 3000})
+        self.assert_same_segments({"max_end_silence_time": 300}, chunk_frames=997)
+
+    def test_multiple_silence_pdfs(self):
+        self.assert_same_segments(
+            {"sil_pdf_ids": [0, 1], "silence_pdf_num": 2, "speech_noise_thres": 0.3}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import importlib.util
+import os
+import unittest
+
+import numpy as np
+import kaldi_native_fbank as knf
+
+frontend_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "../runtime/python/onnxruntime/funasr_onnx/utils/frontend.py",
+)
+spec = importlib.util.spec_from_file_location("funasr_onnx_frontend", frontend_path)
+frontend = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(frontend)
+
+
+def knf_fbank(opts, waveform):
+    fbank_fn = knf.OnlineFbank(opts)
+    fbank_fn.accept_waveform(opts.frame_opts.samp_freq, (waveform * (1 << 15)).tolist())
+    frames = fbank_fn.num_frames_ready
+    mat = np.empty([frames, opts.mel_opts.num_bins])
+    for i in range(frames):
+        mat[i, :] = fbank_fn.get_frame(i)
+    return mat.astype(np.float32)
+
+
+def loop_lfr(inputs, lfr_m, lfr_n):
+    LFR_inputs = []
+    T = inputs.shape[0]
+    T_lfr = int(np.ceil(T / lfr_n))
+    left_padding = np.tile(inputs[0], ((lfr_m - 1) // 2, 1))
+    inputs = np.vstack((left_padding, inputs))
+    T = T + (lfr_m - 1) // 2
+    for i in range(T_lfr):
+        if lfr_m <= T - i * lfr_n:
+            LFR_inputs.append((inputs[i * lfr_n : i * lfr_n + lfr_m]).reshape(1, -1))
+        else:
+            num_padding = lfr_m - (T - i * lfr_n)
+            frame = inputs[i * lfr_n :].reshape(-1)
+            for _ in range(num_padding):
+                frame = np.hstack((frame, inputs[-1]))
+            LFR_inputs.append(frame)
+    return np.vstack(LFR_inputs).astype(np.float32)
+
+
+def loop_lfr_online(inputs, lfr_m, lfr_n, is_final):
+    LFR_inputs = []
+    T = inputs.shape[0]
+    T_lfr = int(np.ceil((T - (lfr_m - 1) // 2) / lfr_n))
+    splice_idx = T_lfr
+    for i in range(T_lfr):
+        if lfr_m <= T - i * lfr_n:
+            LFR_inputs.append((inputs[i * lfr_n : i * lfr_n + lfr_m]).reshape(1, -1))
+        elif is_final:
+            num_padding = lfr_m - (T - i * lfr_n)
+            frame = (inputs[i * lfr_n :]).reshape(-1)
+            for _ in range(num_padding):
+                frame = np.hstack((frame, inputs[-1]))
+            LFR_inputs.append(frame)
+        else:
+            splice_idx = i
+            break
+    splice_idx = min(T - 1, splice_idx * lfr_n)
+    return np.vstack(LFR_inputs).astype(np.float32), inputs[splice_idx:, :], splice_idx
+
+
+class TestOnnxWavFrontend(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_fbank_matches_kaldi_native_fbank(self):
+        for window in ["hamming", "povey", "hanning"]:
+            wav_frontend = frontend.WavFrontend(n_mels=80, window=window, dither=0.0)
+            for length in [0, 399, 400, 401, 16000 * 3 + 123]:
+                waveform = (np.random.randn(length) * 0.1).astype(np.float32)
+                feat, feat_len = wav_frontend.fbank(waveform)
+                expected = knf_fbank(wav_frontend.opts, waveform)
+                self.assertEqual(feat.dtype, np.float32)
+                self.assertEqual(feat.shape, expected.shape)
+                self.assertEqual(int(feat_len), expected.shape[0])
+                np.testing.assert_allclose(feat, expected, atol=2e-3)
+
+    def test_fbank_blocks(self):
+        wav_frontend = frontend.WavFrontend(n_mels=80, dither=0.0)
+        waveform = (np.random.randn(16000 * 2) * 0.1).astype(np.float32)
+        np.testing.assert_allclose(
+            wav_frontend.compute_fbank(waveform, block_frames=7),
+            wav_frontend.compute_fbank(waveform),
+            atol=1e-5,
+        )
+
+    def test_lfr_matches_loop(self):
+        for T in range(1, 40):
+            inputs = np.random.randn(T, 8).astype(np.float32)
+            for lfr_m, lfr_n in [(7, 6), (5, 1), (3, 2), (1, 1)]:
+                np.testing.assert_array_equal(
+                    frontend.WavFrontend.apply_lfr(inputs, lfr_m, lfr_n),
+                    loop_lfr(inputs, lfr_m, lfr_n),
+                )
+
+    def test_online_lfr_matches_loop(self):
+        for T in range(7, 40):
+            inputs = np.random.randn(T, 8).astype(np.float32)
+            for is_final in [False, True]:
+                outputs, cache, splice_idx = frontend.WavFrontendOnline.apply_lfr(
+                    inputs, 7, 6, is_final
+                )
+                expected, expected_cache, expected_idx = loop_lfr_online(inputs, 7, 6, is_final)
+                np.testing.assert_array_equal(outputs, expected)
+                np.testing.assert_array_equal(cache, expected_cache)
+                self.assertEqual(splice_idx, expected_idx)
+
+    def test_cmvn_batched(self):
+        wav_frontend = frontend.WavFrontend(n_mels=80, lfr_m=7, lfr_n=6, dither=0.0)
+        wav_frontend.cmvn = np.random.randn(2, 560)
+        feats = np.random.randn(3, 20, 560).astype(np.float32)
+        batched = wav_frontend.apply_cmvn(feats)
+        for i in range(feats.shape[0]):
+            expected = (feats[i] + wav_frontend.cmvn[0]) * wav_frontend.cmvn[1]
+            np.testing.assert_allclose(batched[i], expected, rtol=1e-5, atol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from funasr.frontends.wav_frontend import WavFrontend
+
+
+class TestWavFrontendBatchFbank(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+
+    def forward_both(self, input_lengths, **kwargs):
+        input = torch.randn(len(input_lengths), max(input_lengths)) * 0.1
+        input_lengths = torch.tensor(input_lengths)
+        feats, feats_lens = WavFrontend(dither=0.0, **kwargs)(input, input_lengths)
+        batch_feats, batch_feats_lens = WavFrontend(dither=0.0, batch_fbank=True, **kwargs)(
+            input, input_lengths
+        )
+        return feats, feats_lens, batch_feats, batch_feats_lens
+
+    def test_matches_per_utterance_fbank(self):
+        for kwargs in [{}, {"lfr_m": 7, "lfr_n": 6}, {"window": "povey", "lfr_m": 5, "lfr_n": 3}]:
+            feats, feats_lens, batch_feats, batch_feats_lens = self.forward_both(
+                [16000 * 3, 400, 12345, 16000 + 159], **kwargs
+            )
+            self.assertTrue(torch.equal(feats_lens, batch_feats_lens))
+            self.assertEqual(feats.shape, batch_feats.shape)
+            self.assertTrue(torch.allclose(feats, batch_feats, atol=1e-3, rtol=1e-4))
+
+    def test_short_utterance_falls_back(self):
+        feats, feats_lens, batch_feats, batch_feats_lens = self.forward_both(
+            [16000, 300], lfr_m=7, lfr_n=6
+        )
+        self.assertTrue(torch.equal(feats_lens, batch_feats_lens))
+        self.assertTrue(torch.allclose(feats, batch_feats))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,6 +13,7 @@ from torch.utils.data import DataLoader, Dataset
 
 version = os.environ.get("version", None)
 
+from feature_store import has_feature, load_feature, open_feature_store
 from text import cleaned_text_to_sequence
 
 # from config import exp_dir
@@ -67,6 +68,8 @@ class Text2SemanticDataset(Dataset):
             )
         )  # "%s/3-bert"%exp_dir#bert_dir
         self.path6 = semantic_path  # "%s/6-name2semantic.tsv"%exp_dir#semantic_path
+        # prepare_datasets/prepare_all.py 写入的合并特征（3-bert.store），没有则读取 3-bert/*.pt
+        self.bert_store = open_feature_store(self.path3)
         assert os.path.exists(self.path2)
         assert os.path.exists(self.path6)
         self.phoneme_data = {}
@@ -219,9 +222,8 @@ class Text2SemanticDataset(Dataset):
         semantic_ids_len = len(semantic_ids)
 
         flag = 0
-        path_bert = "%s/%s.pt" % (self.path3, item_name)
-        if os.path.exists(path_bert) == True:
-            bert_feature = torch.load(path_bert, map_location="cpu")
+        if has_feature(self.path3, self.bert_store, item_name):
+            bert_feature = load_feature(self.path3, self.bert_store, item_name)
         else:
             flag = 1
         if flag == 1:
@@ -220,6 +220,55 @@ class T2SBlock:
         )
         return x, k_cache, v_cache
 
+    def decode_next_token_static(
+        self,
+        x: torch.Tensor,
+        k_cache: torch.Tensor,
+        v_cache: torch.Tensor,
+        cache_len: int,
+        attn_mask: Optional[torch.Tensor] = None,
+        torch_sdpa: bool = True,
+    ):
+        q, k, v = F.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+
+        # 新 token 的 k/v 原地写入预分配的缓存，不再每步 torch.cat 拷贝整段历史
+        k_cache[:, cache_len : cache_len + 1] = k
+        v_cache[:, cache_len : cache_len + 1] = v
+
+        batch_size = q.shape[0]
+        q_len = q.shape[1]
+        kv_len = cache_len + q_len
+
+        q = q.view(batch_size, q_len, self.num_heads, -1).transpose(1, 2)
+        k = k_cache[:, :kv_len].view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+        v = v_cache[:, :kv_len].view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+
+        if torch_sdpa:
+            attn = F.scaled_dot_product_attention(q, k, v, (~attn_mask) if attn_mask is not None else None)
+        else:
+            attn = scaled_dot_product_attention(q, k, v, attn_mask)
+
+        attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
+        attn = F.linear(attn, self.out_w, self.out_b)
+
+        x = x + attn
+        x = F.layer_norm(
+            x,
+            [self.hidden_dim],
+            self.norm_w1,
+            self.norm_b1,
+            self.norm_eps1,
+        )
+        x = x + self.mlp.forward(x)
+        x = F.layer_norm(
+            x,
+            [self.hidden_dim],
+            self.norm_w2,
+            self.norm_b2,
+            self.norm_eps2,
+        )
+        return x
+
 
 @torch.jit.script
 class T2STransformer:
@@ -256,6 +305,59 @@ class T2STransformer:
             )
         return x, k_cache, v_cache
 
+    def decode_next_token_static(
+        self,
+        x: torch.Tensor,
+        k_cache: List[torch.Tensor],
+        v_cache: List[torch.Tensor],
+        cache_len: int,
+        attn_mask: Optional[torch.Tensor] = None,
+        torch_sdpa: bool = True,
+    ):
+        for i in range(self.num_blocks):
+            x = self.blocks[i].decode_next_token_static(x, k_cache[i], v_cache[i], cache_len, attn_mask, torch_sdpa)
+        return x
+
+
+class T2SKVCache:
+    """
+    预分配的 KV cache
+
+    每层的 k/v 缓存是 (batch, capacity, hidden) 的定长张量，新 token 原地写入第 length 个位置，
+    容量不足时按 2 倍扩容（不超过 max_len），解码 n 个 token 的拷贝量从 O(n^2) 降为 O(n)。
+    """
+
+    def __init__(self, k_cache: List[torch.Tensor], v_cache: List[torch.Tensor], max_len: int, init_len: int = 256):
+        self.length = k_cache[0].shape[1]
+        self.max_len = max(max_len, self.length + 1)
+        self.capacity = min(self.max_len, self.length + init_len)
+        self.k_cache = [self._resize(k, self.capacity) for k in k_cache]
+        self.v_cache = [self._resize(v, self.capacity) for v in v_cache]
+
+    def _resize(self, cache: torch.Tensor, capacity: int) -> torch.Tensor:
+        new_cache = cache.new_empty(cache.shape[0], capacity, cache.shape[2])
+        new_cache[:, : self.length] = cache[:, : self.length]
+        return new_cache
+
+    def reserve(self, n: int = 1):
+        needed = self.length + n
+        if needed <= self.capacity:
+            return
+        self.capacity = max(needed, min(self.max_len, self.capacity * 2))
+        self.k_cache = [self._resize(k, self.capacity) for k in self.k_cache]
+        self.v_cache = [self._resize(v, self.capacity) for v in self.v_cache]
+
+    def index_select(self, index: torch.Tensor):
+        """只保留 batch 中 index 对应的序列"""
+        self.k_cache = [torch.index_select(k, dim=0, index=index) for k in self.k_cache]
+        self.v_cache = [torch.index_select(v, dim=0, index=index) for v in self.v_cache]
+
+    def decode_next_token(self, transformer: T2STransformer, x: torch.Tensor, attn_mask: Optional[torch.Tensor] = None):
+        self.reserve(1)
+        x = transformer.decode_next_token_static(x, self.k_cache, self.v_cache, self.length, attn_mask)
+        self.length += 1
+        return x
+
 
 class Text2SemanticDecoder(nn.Module):
     def __init__(self, config, norm_first=False, top_k=3):
@@ -629,6 +731,8 @@ class Text2SemanticDecoder(nn.Module):
 
         k_cache = None
         v_cache = None
+        kv_cache: Optional[T2SKVCache] = None
+        static_kv_cache = kwargs.get("static_kv_cache", True)
         ###################  first step ##########################
         assert y is not None, "Error: Prompt free is not supported batch_infer!"
         ref_free = False
@@ -701,6 +805,10 @@ class Text2SemanticDecoder(nn.Module):
         for idx in tqdm(range(1500)):
             if idx == 0:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, attn_mask, None)
+                if static_kv_cache:
+                    kv_cache = T2SKVCache(k_cache, v_cache, src_len + 1500)
+            elif kv_cache is not None:
+                xy_dec = kv_cache.decode_next_token(self.t2s_transformer, xy_pos, attn_mask)
             else:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache, attn_mask)
             logits = self.ar_predict_layer(xy_dec[:, -1])
@@ -739,7 +847,9 @@ class Text2SemanticDecoder(nn.Module):
                 # index = torch.LongTensor(batch_idx_map).to(y.device)
                 y = torch.index_select(y, dim=0, index=reserved_idx_of_batch_for_y)
                 attn_mask = torch.index_select(attn_mask, dim=0, index=reserved_idx_of_batch_for_y)
-                if k_cache is not None:
+                if kv_cache is not None:
+                    kv_cache.index_select(reserved_idx_of_batch_for_y)
+                elif k_cache is not None:
                     for i in range(len(k_cache)):
                         k_cache[i] = torch.index_select(k_cache[i], dim=0, index=reserved_idx_of_batch_for_y)
                         v_cache[i] = torch.index_select(v_cache[i], dim=0, index=reserved_idx_of_batch_for_y)
@@ -838,6 +948,10 @@ class Text2SemanticDecoder(nn.Module):
 
         k_cache = None
         v_cache = None
+        kv_cache: Optional[T2SKVCache] = None
+        static_kv_cache = kwargs.get("static_kv_cache", True)
+        # 每生成一个（非结束）token 调用一次，用于流式合成
+        token_callback = kwargs.get("token_callback", None)
         ###################  first step ##########################
         if y is not None:
             y_emb = self.ar_audio_embedding(y)
@@ -878,6 +992,10 @@ class Text2SemanticDecoder(nn.Module):
         for idx in tqdm(range(1500)):
             if xy_attn_mask is not None:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask, None)
+                if static_kv_cache:
+                    kv_cache = T2SKVCache(k_cache, v_cache, src_len + 1500)
+            elif kv_cache is not None:
+                xy_dec = kv_cache.decode_next_token(self.t2s_transformer, xy_pos)
             else:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache)
 
@@ -906,6 +1024,8 @@ class Text2SemanticDecoder(nn.Module):
                     print("bad zero prediction")
                 print(f"T2S Decoding EOS [{prefix_len} -> {y.shape[1]}]")
                 break
+            if token_callback is not None:
+                token_callback(samples[0, 0].item())
 
             ####################### update next step ###################################
             y_emb = self.ar_audio_embedding(y[:, -1:])
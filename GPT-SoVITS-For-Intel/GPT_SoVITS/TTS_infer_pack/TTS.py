@@ -1,11 +1,13 @@
 import gc
 import math
 import os
+import queue
 import random
 import sys
+import threading
 import time
 import traceback
-from copy import deepcopy
+from copy import copy, deepcopy
 
 import torchaudio
 from tqdm import tqdm
@@ -33,6 +35,8 @@ from transformers import AutoModelForMaskedLM, AutoTokenizer
 from tools.audio_sr import AP_BWE
 from tools.i18n.i18n import I18nAuto, scan_language_list
 from tools.my_utils import load_audio
+from TTS_infer_pack.ov_backend import OVBackend
+from TTS_infer_pack.prompt_cache import PromptCache
 from TTS_infer_pack.text_segmentation_method import splits
 from TTS_infer_pack.TextPreprocessor import TextPreprocessor
 
@@ -146,6 +150,10 @@ class NO_PROMPT_ERROR(Exception):
     pass
 
 
+class _StreamCancelled(Exception):
+    """raised from the T2S token callback to stop an abandoned incremental stream"""
+
+
 # configs/tts_infer.yaml
 """
 custom:
@@ -307,6 +315,15 @@ class TTS_Config:
         self.vits_weights_path = self.configs.get("vits_weights_path", None)
         self.bert_base_path = self.configs.get("bert_base_path", None)
         self.cnhuhbert_base_path = self.configs.get("cnhuhbert_base_path", None)
+        self.prompt_cache_size = self.configs.get("prompt_cache_size", 8)
+        self.prompt_cache_dir = self.configs.get("prompt_cache_dir", None)
+        self.text_cache_size = self.configs.get("text_cache_size", 0)
+        self.text_cache_dir = self.configs.get("text_cache_dir", None)
+        # "torch" or "openvino" (models exported by ov_export.py, see TTS_infer_pack/ov_backend.py)
+        self.backend = self.configs.get("backend", "torch")
+        self.ov_model_dir = self.configs.get("ov_model_dir", "GPT_SoVITS/pretrained_models/openvino")
+        self.ov_device = self.configs.get("ov_device", "CPU")
+        self.ov_cache_dir = self.configs.get("ov_cache_dir", "GPT_SoVITS/pretrained_models/openvino/cache")
         self.languages = self.v1_languages if self.version == "v1" else self.v2_languages
 
         self.use_vocoder: bool = False
@@ -365,6 +382,14 @@ class TTS_Config:
             "vits_weights_path": self.vits_weights_path,
             "bert_base_path": self.bert_base_path,
             "cnhuhbert_base_path": self.cnhuhbert_base_path,
+            "prompt_cache_size": self.prompt_cache_size,
+            "prompt_cache_dir": self.prompt_cache_dir,
+            "text_cache_size": self.text_cache_size,
+            "text_cache_dir": self.text_cache_dir,
+            "backend": self.backend,
+            "ov_model_dir": self.ov_model_dir,
+            "ov_device": self.ov_device,
+            "ov_cache_dir": self.ov_cache_dir,
         }
         return self.config
 
@@ -405,6 +430,10 @@ class TTS:
         self.vocoder = None
         self.sr_model: AP_BWE = None
         self.sr_model_not_exist: bool = False
+        # the super-resolution model is loaded on first use, once for this pipeline and all of its
+        # clone_worker() copies, which share the lock and the holder
+        self._sr_lock = threading.Lock()
+        self._sr_shared: dict = {"sr_model": None}
 
         self.vocoder_configs: dict = {
             "sr": None,
@@ -414,13 +443,38 @@ class TTS:
             "overlapped_len": None,
         }
 
+        self.ov_backend: OVBackend = None
+        if self.configs.backend == "openvino":
+            self.ov_backend = OVBackend(self.configs.ov_model_dir, self.configs.ov_device, self.configs.ov_cache_dir)
+
         self._init_models()
 
+        # 常用语句的文本前端结果 (phones / bert features) 缓存，默认关闭，text_cache_size > 0 时启用；
+        # bert features 以 CPU 张量缓存，不占用推理设备显存
+        text_cache = None
+        if self.configs.text_cache_size > 0:
+            text_cache = PromptCache(self.configs.text_cache_size, self.configs.text_cache_dir)
         self.text_preprocessor: TextPreprocessor = TextPreprocessor(
-            self.bert_model, self.bert_tokenizer, self.configs.device
+            self.bert_model, self.bert_tokenizer, self.configs.device, cache=text_cache
         )
 
-        self.prompt_cache: dict = {
+        self.prompt_cache: dict = self._new_prompt_cache()
+        # keyed LRU of reference-audio / prompt-text artifacts across speakers,
+        # prompt_cache above always holds the currently selected one
+        self.prompt_store: PromptCache = PromptCache(self.configs.prompt_cache_size, self.configs.prompt_cache_dir)
+
+
+        self.stop_flag: bool = False
+        # 推理异常时重新加载权重以释放显存；与其他 worker 共享权重时应关闭
+        self.reload_on_error: bool = True
+        # 增量流式合成时 VITS 解码窗口的左侧上下文 token 数，以及暂不输出、留待下一窗口交叉淡化的末尾 token 数
+        self.stream_context_tokens: int = 12
+        self.stream_lookahead_tokens: int = 4
+        self.precision: torch.dtype = torch.float16 if self.configs.is_half else torch.float32
+
+    @staticmethod
+    def _new_prompt_cache() -> dict:
+        return {
             "ref_audio_path": None,
             "prompt_semantic": None,
             "refer_spec": [],
@@ -432,9 +486,15 @@ class TTS:
             "aux_ref_audio_paths": [],
         }
 
-
-        self.stop_flag: bool = False
-        self.precision: torch.dtype = torch.float16 if self.configs.is_half else torch.float32
+    def clone_worker(self) -> "TTS":
+        """
+        Create another TTS worker that shares this pipeline's (read-only) models,
+        configs and prompt_store, but has its own current prompt and stop flag.
+        """
+        worker = copy(self)
+        worker.prompt_cache = worker._new_prompt_cache()
+        worker.stop_flag = False
+        return worker
 
     def _init_models(
         self,
@@ -452,6 +512,8 @@ class TTS:
         self.cnhuhbert_model = self.cnhuhbert_model.to(self.configs.device)
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.cnhuhbert_model = self.cnhuhbert_model.half()
+        if self.ov_backend is not None:
+            self.cnhuhbert_model.model = self.ov_backend.wrap_cnhubert(self.cnhuhbert_model.model, base_path)
 
     def init_bert_weights(self, base_path: str):
         print(f"Loading BERT weights from {base_path}")
@@ -461,6 +523,8 @@ class TTS:
         self.bert_model = self.bert_model.to(self.configs.device)
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.bert_model = self.bert_model.half()
+        if self.ov_backend is not None:
+            self.bert_model = self.ov_backend.wrap_bert(self.bert_model, base_path)
 
     def init_vits_weights(self, weights_path: str):
         self.configs.vits_weights_path = weights_path
@@ -547,6 +611,8 @@ class TTS:
         self.vits_model = vits_model
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.vits_model = self.vits_model.half()
+        if self.ov_backend is not None and not self.configs.use_vocoder:
+            self.vits_model = self.ov_backend.wrap_vits(self.vits_model, weights_path)
 
     def init_t2s_weights(self, weights_path: str):
         print(f"Loading Text2Semantic weights from {weights_path}")
@@ -563,22 +629,50 @@ class TTS:
         self.t2s_model = t2s_model
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.t2s_model = self.t2s_model.half()
+        if self.ov_backend is not None:
+            self.t2s_model.model = self.ov_backend.wrap_t2s(self.t2s_model.model, weights_path)
+
+    @staticmethod
+    def build_vocoder(version: str) -> torch.nn.Module:
+        """
+        Load the vocoder of SoVITS v3 (BigVGAN) or v4 (HiFiGAN Generator) on CPU,
+        with weight norm removed.
+        """
+        if version == "v3":
+            vocoder = BigVGAN.from_pretrained(
+                "%s/GPT_SoVITS/pretrained_models/models--nvidia--bigvgan_v2_24khz_100band_256x" % (now_dir,),
+                use_cuda_kernel=False,
+            )  # if True, RuntimeError: Ninja is required to load C++ extensions
+            # remove weight norm in the model and set to eval mode
+            vocoder.remove_weight_norm()
+        else:
+            vocoder = Generator(
+                        initial_channel=100,
+                        resblock="1",
+                        resblock_kernel_sizes=[3, 7, 11],
+                        resblock_dilation_sizes=[[1, 3, 5], [1, 3, 5], [1, 3, 5]],
+                        upsample_rates=[10, 6, 2, 2, 2],
+                        upsample_initial_channel=512,
+                        upsample_kernel_sizes=[20, 12, 4, 4, 4],
+                        gin_channels=0, is_bias=True
+                    )
+            vocoder.remove_weight_norm()
+            state_dict_g = torch.load("%s/GPT_SoVITS/pretrained_models/gsv-v4-pretrained/vocoder.pth" % (now_dir,), map_location="cpu")
+            print("loading vocoder",vocoder.load_state_dict(state_dict_g))
+        return vocoder
 
     def init_vocoder(self, version: str):
+        # the OpenVINO backend wraps the torch vocoder
+        loaded = getattr(self.vocoder, "torch_model", self.vocoder).__class__.__name__ if self.vocoder is not None else None
         if version == "v3":
-            if self.vocoder is not None and self.vocoder.__class__.__name__ == "BigVGAN":
+            if loaded == "BigVGAN":
                 return
             if self.vocoder is not None:
                 self.vocoder.cpu()
                 del self.vocoder
                 self.empty_cache()
                 
-            self.vocoder = BigVGAN.from_pretrained(
-                "%s/GPT_SoVITS/pretrained_models/models--nvidia--bigvgan_v2_24khz_100band_256x" % (now_dir,),
-                use_cuda_kernel=False,
-            )  # if True, RuntimeError: Ninja is required to load C++ extensions
-            # remove weight norm in the model and set to eval mode
-            self.vocoder.remove_weight_norm()
+            self.vocoder = self.build_vocoder(version)
 
             self.vocoder_configs["sr"] = 24000
             self.vocoder_configs["T_ref"] = 468
@@ -587,26 +681,14 @@ class TTS:
             self.vocoder_configs["overlapped_len"] = 12
 
         elif version == "v4":
-            if self.vocoder is not None and self.vocoder.__class__.__name__ == "Generator":
+            if loaded == "Generator":
                 return
             if self.vocoder is not None:
                 self.vocoder.cpu()
                 del self.vocoder
                 self.empty_cache()
 
-            self.vocoder = Generator(
-                        initial_channel=100,
-                        resblock="1",
-                        resblock_kernel_sizes=[3, 7, 11],
-                        resblock_dilation_sizes=[[1, 3, 5], [1, 3, 5], [1, 3, 5]],
-                        upsample_rates=[10, 6, 2, 2, 2],
-                        upsample_initial_channel=512,
-                        upsample_kernel_sizes=[20, 12, 4, 4, 4],
-                        gin_channels=0, is_bias=True
-                    )
-            self.vocoder.remove_weight_norm()
-            state_dict_g = torch.load("%s/GPT_SoVITS/pretrained_models/gsv-v4-pretrained/vocoder.pth" % (now_dir,), map_location="cpu")
-            print("loading vocoder",self.vocoder.load_state_dict(state_dict_g))
+            self.vocoder = self.build_vocoder(version)
 
             self.vocoder_configs["sr"] = 48000
             self.vocoder_configs["T_ref"] = 500
@@ -622,16 +704,20 @@ class TTS:
             self.vocoder = self.vocoder.half().to(self.configs.device)
         else:
             self.vocoder = self.vocoder.to(self.configs.device)
+        if self.ov_backend is not None:
+            self.vocoder = self.ov_backend.wrap_vocoder(self.vocoder, version)
 
     def init_sr_model(self):
         if self.sr_model is not None:
             return
-        try:
-            self.sr_model: AP_BWE = AP_BWE(self.configs.device, DictToAttrRecursive)
-            self.sr_model_not_exist = False
-        except FileNotFoundError:
-            print(i18n("你没有下载超分模型的参数，因此不进行超分。如想超分请先参照教程把文件下载好"))
-            self.sr_model_not_exist = True
+        with self._sr_lock:
+            if self._sr_shared["sr_model"] is None:
+                try:
+                    self._sr_shared["sr_model"] = AP_BWE(self.configs.device, DictToAttrRecursive)
+                except FileNotFoundError:
+                    print(i18n("你没有下载超分模型的参数，因此不进行超分。如想超分请先参照教程把文件下载好"))
+            self.sr_model: AP_BWE = self._sr_shared["sr_model"]
+            self.sr_model_not_exist = self.sr_model is None
 
     def enable_half_precision(self, enable: bool = True, save: bool = True):
         """
@@ -714,11 +800,35 @@ class TTS:
         else:
             self.prompt_cache["refer_spec"][0] = spec
 
+    def _prompt_store_key(self, kind: str, content: str, **params) -> str:
+        return self.prompt_store.make_key(
+            kind,
+            content,
+            version=self.configs.version,
+            is_half=self.configs.is_half,
+            **params,
+        )
+
     def _get_ref_spec(self, ref_audio_path):
+        key = self._prompt_store_key(
+            "spec",
+            self.prompt_store.audio_digest(ref_audio_path),
+            sampling_rate=self.configs.sampling_rate,
+            filter_length=self.configs.filter_length,
+            hop_length=self.configs.hop_length,
+            win_length=self.configs.win_length,
+        )
+        cached = self.prompt_store.get(key, self.configs.device)
+        if cached is None:
+            cached = self._compute_ref_spec(ref_audio_path)
+            self.prompt_store.put(key, cached)
+        self.prompt_cache["raw_audio"] = cached["raw_audio"]
+        self.prompt_cache["raw_sr"] = cached["raw_sr"]
+        return cached["spec"]
+
+    def _compute_ref_spec(self, ref_audio_path):
         raw_audio, raw_sr = torchaudio.load(ref_audio_path)
         raw_audio = raw_audio.to(self.configs.device).float()
-        self.prompt_cache["raw_audio"] = raw_audio
-        self.prompt_cache["raw_sr"] = raw_sr
 
         audio = load_audio(ref_audio_path, int(self.configs.sampling_rate))
         audio = torch.FloatTensor(audio)
@@ -738,9 +848,23 @@ class TTS:
         spec = spec.to(self.configs.device)
         if self.configs.is_half:
             spec = spec.half()
-        return spec
+        return {"spec": spec, "raw_audio": raw_audio, "raw_sr": raw_sr}
 
     def _set_prompt_semantic(self, ref_wav_path: str):
+        # prompt_semantic depends on the HuBERT model and the SoVITS quantizer
+        key = self._prompt_store_key(
+            "semantic",
+            self.prompt_store.audio_digest(ref_wav_path),
+            vits_weights_path=self.configs.vits_weights_path,
+            cnhuhbert_base_path=self.configs.cnhuhbert_base_path,
+        )
+        cached = self.prompt_store.get(key, self.configs.device)
+        if cached is None:
+            cached = {"prompt_semantic": self._compute_prompt_semantic(ref_wav_path)}
+            self.prompt_store.put(key, cached)
+        self.prompt_cache["prompt_semantic"] = cached["prompt_semantic"]
+
+    def _compute_prompt_semantic(self, ref_wav_path: str):
         zero_wav = np.zeros(
             int(self.configs.sampling_rate * 0.3),
             dtype=np.float16 if self.configs.is_half else np.float32,
@@ -764,7 +888,65 @@ class TTS:
             codes = self.vits_model.extract_latent(hubert_feature)
 
             prompt_semantic = codes[0, 0].to(self.configs.device)
-            self.prompt_cache["prompt_semantic"] = prompt_semantic
+            return prompt_semantic
+
+    def prepare_prompt(
+        self, ref_audio_path: str, aux_ref_audio_paths: list = None, prompt_text: str = "", prompt_lang: str = ""
+    ):
+        """
+        Select the reference audio(s) and the prompt text as the current prompt
+        (self.prompt_cache), looking them up in the prompt_store when possible.
+        """
+        no_prompt_text = prompt_text in [None, ""]
+        if ref_audio_path in [None, ""] and (
+            (self.prompt_cache["prompt_semantic"] is None) or (self.prompt_cache["refer_spec"] in [None, []])
+        ):
+            raise ValueError(
+                "ref_audio_path cannot be empty, when the reference audio is not set using set_ref_audio()"
+            )
+
+        if (ref_audio_path is not None) and (ref_audio_path != self.prompt_cache["ref_audio_path"]):
+            if not os.path.exists(ref_audio_path):
+                raise ValueError(f"{ref_audio_path} not exists")
+            self.set_ref_audio(ref_audio_path)
+
+        aux_ref_audio_paths = aux_ref_audio_paths if aux_ref_audio_paths is not None else []
+        paths = set(aux_ref_audio_paths) & set(self.prompt_cache["aux_ref_audio_paths"])
+        if not (len(list(paths)) == len(aux_ref_audio_paths) == len(self.prompt_cache["aux_ref_audio_paths"])):
+            self.prompt_cache["aux_ref_audio_paths"] = aux_ref_audio_paths
+            self.prompt_cache["refer_spec"] = [self.prompt_cache["refer_spec"][0]]
+            for path in aux_ref_audio_paths:
+                if path in [None, ""]:
+                    continue
+                if not os.path.exists(path):
+                    print(i18n("音频文件不存在，跳过："), path)
+                    continue
+                self.prompt_cache["refer_spec"].append(self._get_ref_spec(path))
+
+        if not no_prompt_text:
+            prompt_text = prompt_text.strip("\n")
+            if prompt_text[-1] not in splits:
+                prompt_text += "。" if prompt_lang != "en" else "."
+            print(i18n("实际输入的参考文本:"), prompt_text)
+            if self.prompt_cache["prompt_text"] != prompt_text or self.prompt_cache["prompt_lang"] != prompt_lang:
+                key = self._prompt_store_key(
+                    "text", prompt_text, prompt_lang=prompt_lang, bert_base_path=self.configs.bert_base_path
+                )
+                cached = self.prompt_store.get(key, self.configs.device)
+                if cached is None:
+                    phones, bert_features, norm_text = self.text_preprocessor.segment_and_extract_feature_for_text(
+                        prompt_text, prompt_lang, self.configs.version
+                    )
+                    self.prompt_store.put(
+                        key, {"phones": phones, "bert_features": bert_features, "norm_text": norm_text}
+                    )
+                else:
+                    phones, bert_features, norm_text = cached["phones"], cached["bert_features"], cached["norm_text"]
+                self.prompt_cache["prompt_text"] = prompt_text
+                self.prompt_cache["prompt_lang"] = prompt_lang
+                self.prompt_cache["phones"] = phones
+                self.prompt_cache["bert_features"] = bert_features
+                self.prompt_cache["norm_text"] = norm_text
 
     def batch_sequences(self, sequences: List[torch.Tensor], axis: int = 0, pad_value: int = 0, max_length: int = None):
         seq = sequences[0]
@@ -957,6 +1139,7 @@ class TTS:
                     "repetition_penalty": 1.35    # float. repetition penalty for T2S model.
                     "sample_steps": 32,           # int. number of sampling steps for VITS model V3.
                     "super_sampling": False,       # bool. whether to use super-sampling for audio when using VITS model V3.
+                    "stream_chunk_tokens": 0,     # int. incremental streaming: vocode every n semantic tokens (0: off), implies return_fragment.
                 }
         returns:
             Tuple[int, np.ndarray]: sampling rate and audio data.
@@ -986,13 +1169,17 @@ class TTS:
         repetition_penalty = inputs.get("repetition_penalty", 1.35)
         sample_steps = inputs.get("sample_steps", 32)
         super_sampling = inputs.get("super_sampling", False)
+        stream_chunk_tokens = inputs.get("stream_chunk_tokens", 0) or 0
+        if stream_chunk_tokens > 0:
+            return_fragment = True
 
+        # 使用局部变量而不是改写共享模型的 infer_panel，多个 worker 并发时互不影响
         if parallel_infer:
             print(i18n("并行推理模式已开启"))
-            self.t2s_model.model.infer_panel = self.t2s_model.model.infer_panel_batch_infer
+            infer_panel = self.t2s_model.model.infer_panel_batch_infer
         else:
             print(i18n("并行推理模式已关闭"))
-            self.t2s_model.model.infer_panel = self.t2s_model.model.infer_panel_naive_batched
+            infer_panel = self.t2s_model.model.infer_panel_naive_batched
 
         if return_fragment:
             print(i18n("分段返回模式已开启"))
@@ -1026,47 +1213,9 @@ class TTS:
         if no_prompt_text and self.configs.use_vocoder:
             raise NO_PROMPT_ERROR("prompt_text cannot be empty when using SoVITS_V3")
 
-        if ref_audio_path in [None, ""] and (
-            (self.prompt_cache["prompt_semantic"] is None) or (self.prompt_cache["refer_spec"] in [None, []])
-        ):
-            raise ValueError(
-                "ref_audio_path cannot be empty, when the reference audio is not set using set_ref_audio()"
-            )
-
         ###### setting reference audio and prompt text preprocessing ########
         t0 = time.perf_counter()
-        if (ref_audio_path is not None) and (ref_audio_path != self.prompt_cache["ref_audio_path"]):
-            if not os.path.exists(ref_audio_path):
-                raise ValueError(f"{ref_audio_path} not exists")
-            self.set_ref_audio(ref_audio_path)
-
-        aux_ref_audio_paths = aux_ref_audio_paths if aux_ref_audio_paths is not None else []
-        paths = set(aux_ref_audio_paths) & set(self.prompt_cache["aux_ref_audio_paths"])
-        if not (len(list(paths)) == len(aux_ref_audio_paths) == len(self.prompt_cache["aux_ref_audio_paths"])):
-            self.prompt_cache["aux_ref_audio_paths"] = aux_ref_audio_paths
-            self.prompt_cache["refer_spec"] = [self.prompt_cache["refer_spec"][0]]
-            for path in aux_ref_audio_paths:
-                if path in [None, ""]:
-                    continue
-                if not os.path.exists(path):
-                    print(i18n("音频文件不存在，跳过："), path)
-                    continue
-                self.prompt_cache["refer_spec"].append(self._get_ref_spec(path))
-
-        if not no_prompt_text:
-            prompt_text = prompt_text.strip("\n")
-            if prompt_text[-1] not in splits:
-                prompt_text += "。" if prompt_lang != "en" else "."
-            print(i18n("实际输入的参考文本:"), prompt_text)
-            if self.prompt_cache["prompt_text"] != prompt_text:
-                phones, bert_features, norm_text = self.text_preprocessor.segment_and_extract_feature_for_text(
-                    prompt_text, prompt_lang, self.configs.version
-                )
-                self.prompt_cache["prompt_text"] = prompt_text
-                self.prompt_cache["prompt_lang"] = prompt_lang
-                self.prompt_cache["phones"] = phones
-                self.prompt_cache["bert_features"] = bert_features
-                self.prompt_cache["norm_text"] = norm_text
+        self.prepare_prompt(ref_audio_path, aux_ref_audio_paths, prompt_text, prompt_lang)
 
         ###### text preprocessing ########
         t1 = time.perf_counter()
@@ -1099,10 +1248,8 @@ class TTS:
             def make_batch(batch_texts):
                 batch_data = []
                 print(f"############ {i18n('提取文本Bert特征')} ############")
-                for text in tqdm(batch_texts):
-                    phones, bert_features, norm_text = self.text_preprocessor.segment_and_extract_feature_for_text(
-                        text, text_lang, self.configs.version
-                    )
+                features = self.text_preprocessor.extract_features(batch_texts, text_lang, self.configs.version)
+                for phones, bert_features, norm_text in features:
                     if phones is None:
                         continue
                     res = {
@@ -1127,6 +1274,22 @@ class TTS:
         t2 = time.perf_counter()
         try:
             print("############ 推理 ############")
+            if stream_chunk_tokens > 0:
+                yield from self._run_incremental(
+                    texts,
+                    text_lang,
+                    no_prompt_text,
+                    stream_chunk_tokens,
+                    top_k=top_k,
+                    top_p=top_p,
+                    temperature=temperature,
+                    repetition_penalty=repetition_penalty,
+                    speed_factor=speed_factor,
+                    fragment_interval=fragment_interval,
+                    sample_steps=sample_steps,
+                    super_sampling=super_sampling and self.configs.use_vocoder and self.configs.version == "v3",
+                )
+                return
             ###### inference ######
             t_34 = 0.0
             t_45 = 0.0
@@ -1139,112 +1302,20 @@ class TTS:
                     if item is None:
                         continue
 
-                batch_phones: List[torch.LongTensor] = item["phones"]
-                # batch_phones:torch.LongTensor = item["phones"]
-                batch_phones_len: torch.LongTensor = item["phones_len"]
-                all_phoneme_ids: torch.LongTensor = item["all_phones"]
-                all_phoneme_lens: torch.LongTensor = item["all_phones_len"]
-                all_bert_features: torch.LongTensor = item["all_bert_features"]
-                norm_text: str = item["norm_text"]
-                max_len = item["max_len"]
-
-                print(i18n("前端处理后的文本(每句):"), norm_text)
-                if no_prompt_text:
-                    prompt = None
-                else:
-                    prompt = (
-                        self.prompt_cache["prompt_semantic"].expand(len(all_phoneme_ids), -1).to(self.configs.device)
-                    )
-
-                print(f"############ {i18n('预测语义Token')} ############")
-                pred_semantic_list, idx_list = self.t2s_model.model.infer_panel(
-                    all_phoneme_ids,
-                    all_phoneme_lens,
-                    prompt,
-                    all_bert_features,
-                    # prompt_phone_len=ph_offset,
+                batch_audio_fragment, t4 = self._synthesize_batch(
+                    item,
+                    infer_panel,
+                    no_prompt_text,
                     top_k=top_k,
                     top_p=top_p,
                     temperature=temperature,
-                    early_stop_num=self.configs.hz * self.configs.max_sec,
-                    max_len=max_len,
                     repetition_penalty=repetition_penalty,
+                    speed_factor=speed_factor,
+                    sample_steps=sample_steps,
+                    parallel_infer=parallel_infer,
                 )
-                t4 = time.perf_counter()
                 t_34 += t4 - t3
 
-                refer_audio_spec: torch.Tensor = [
-                    item.to(dtype=self.precision, device=self.configs.device)
-                    for item in self.prompt_cache["refer_spec"]
-                ]
-
-                batch_audio_fragment = []
-
-                # ## vits并行推理 method 1
-                # pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
-                # pred_semantic_len = torch.LongTensor([item.shape[0] for item in pred_semantic_list]).to(self.configs.device)
-                # pred_semantic = self.batch_sequences(pred_semantic_list, axis=0, pad_value=0).unsqueeze(0)
-                # max_len = 0
-                # for i in range(0, len(batch_phones)):
-                #     max_len = max(max_len, batch_phones[i].shape[-1])
-                # batch_phones = self.batch_sequences(batch_phones, axis=0, pad_value=0, max_length=max_len)
-                # batch_phones = batch_phones.to(self.configs.device)
-                # batch_audio_fragment = (self.vits_model.batched_decode(
-                #         pred_semantic, pred_semantic_len, batch_phones, batch_phones_len,refer_audio_spec
-                #     ))
-                print(f"############ {i18n('合成音频')} ############")
-                if not self.configs.use_vocoder:
-                    if speed_factor == 1.0:
-                        print(f"{i18n('并行合成中')}...")
-                        # ## vits并行推理 method 2
-                        pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
-                        upsample_rate = math.prod(self.vits_model.upsample_rates)
-                        audio_frag_idx = [
-                            pred_semantic_list[i].shape[0] * 2 * upsample_rate
-                            for i in range(0, len(pred_semantic_list))
-                        ]
-                        audio_frag_end_idx = [sum(audio_frag_idx[: i + 1]) for i in range(0, len(audio_frag_idx))]
-                        all_pred_semantic = (
-                            torch.cat(pred_semantic_list).unsqueeze(0).unsqueeze(0).to(self.configs.device)
-                        )
-                        _batch_phones = torch.cat(batch_phones).unsqueeze(0).to(self.configs.device)
-                        _batch_audio_fragment = self.vits_model.decode(
-                            all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor
-                        ).detach()[0, 0, :]
-                        audio_frag_end_idx.insert(0, 0)
-                        batch_audio_fragment = [
-                            _batch_audio_fragment[audio_frag_end_idx[i - 1] : audio_frag_end_idx[i]]
-                            for i in range(1, len(audio_frag_end_idx))
-                        ]
-                    else:
-                        # ## vits串行推理
-                        for i, idx in enumerate(tqdm(idx_list)):
-                            phones = batch_phones[i].unsqueeze(0).to(self.configs.device)
-                            _pred_semantic = (
-                                pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0)
-                            )  # .unsqueeze(0)#mq要多unsqueeze一次
-                            audio_fragment = self.vits_model.decode(
-                                _pred_semantic, phones, refer_audio_spec, speed=speed_factor
-                            ).detach()[0, 0, :]
-                            batch_audio_fragment.append(audio_fragment)  ###试试重建不带上prompt部分
-                else:
-                    if parallel_infer:
-                        print(f"{i18n('并行合成中')}...")
-                        audio_fragments = self.using_vocoder_synthesis_batched_infer(
-                            idx_list, pred_semantic_list, batch_phones, speed=speed_factor, sample_steps=sample_steps
-                        )
-                        batch_audio_fragment.extend(audio_fragments)
-                    else:
-                        for i, idx in enumerate(tqdm(idx_list)):
-                            phones = batch_phones[i].unsqueeze(0).to(self.configs.device)
-                            _pred_semantic = (
-                                pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0)
-                            )  # .unsqueeze(0)#mq要多unsqueeze一次
-                            audio_fragment = self.using_vocoder_synthesis(
-                                _pred_semantic, phones, speed=speed_factor, sample_steps=sample_steps
-                            )
-                            batch_audio_fragment.append(audio_fragment)
-
                 t5 = time.perf_counter()
                 t_45 += t5 - t4
                 if return_fragment:
@@ -1285,16 +1356,340 @@ class TTS:
             # 必须返回一个空音频, 否则会导致显存不释放。
             yield 16000, np.zeros(int(16000), dtype=np.int16)
             # 重置模型, 否则会导致显存释放不完全。
-            del self.t2s_model
-            del self.vits_model
-            self.t2s_model = None
-            self.vits_model = None
-            self.init_t2s_weights(self.configs.t2s_weights_path)
-            self.init_vits_weights(self.configs.vits_weights_path)
+            if self.reload_on_error:
+                del self.t2s_model
+                del self.vits_model
+                self.t2s_model = None
+                self.vits_model = None
+                self.init_t2s_weights(self.configs.t2s_weights_path)
+                self.init_vits_weights(self.configs.vits_weights_path)
             raise e
         finally:
             self.empty_cache()
 
+    @torch.no_grad()
+    def _run_incremental(
+        self,
+        texts: List[str],
+        text_lang: str,
+        no_prompt_text: bool,
+        chunk_tokens: int,
+        top_k: int = 5,
+        top_p: float = 1,
+        temperature: float = 1,
+        repetition_penalty: float = 1.35,
+        speed_factor: float = 1.0,
+        fragment_interval: float = 0.3,
+        sample_steps: int = 32,
+        super_sampling: bool = False,
+    ):
+        """
+        Incremental streaming synthesis of the sentences in texts with the current prompt.
+
+        A producer thread extracts the text features and predicts the semantic tokens
+        sentence by sentence while this generator decodes the audio, so VITS decoding of
+        sentence k overlaps T2S of sentence k+1. With VITS (v1/v2) at speed 1.0 a sentence
+        is not decoded as a whole: every chunk_tokens new tokens, a window of the tokens so
+        far (with stream_context_tokens of left context) is decoded and its newly finished
+        part is yielded, cross-faded with the previous window. The last stream_lookahead_tokens
+        are held back until the next window or the end of the sentence.
+
+        Yields:
+            Tuple[int, np.ndarray]: sampling rate and an audio chunk.
+        """
+        t_start = time.perf_counter()
+        device = self.configs.device
+        incremental = not self.configs.use_vocoder and speed_factor == 1.0
+        lookahead = self.stream_lookahead_tokens
+        output_sr = self.configs.sampling_rate if not self.configs.use_vocoder else self.vocoder_configs["sr"]
+        refer_audio_spec = [item.to(dtype=self.precision, device=device) for item in self.prompt_cache["refer_spec"]]
+        prompt = None
+        if not no_prompt_text:
+            prompt = self.prompt_cache["prompt_semantic"].expand(1, -1).to(device)
+
+        events = queue.Queue()
+        cancelled = threading.Event()
+
+        def on_token(token: int):
+            if cancelled.is_set() or self.stop_flag:
+                raise _StreamCancelled()
+            events.put(("token", token))
+
+        def produce():
+            try:
+                with torch.no_grad():
+                    for text in texts:
+                        if cancelled.is_set() or self.stop_flag:
+                            break
+                        phones, bert_features, norm_text = self.text_preprocessor.segment_and_extract_feature_for_text(
+                            text, text_lang, self.configs.version
+                        )
+                        if phones is None:
+                            continue
+                        batch, _ = self.to_batch(
+                            [{"phones": phones, "bert_features": bert_features, "norm_text": norm_text}],
+                            prompt_data=self.prompt_cache if not no_prompt_text else None,
+                            batch_size=1,
+                            split_bucket=False,
+                            device=device,
+                            precision=self.precision,
+                        )
+                        item = batch[0]
+                        print(i18n("前端处理后的文本(每句):"), item["norm_text"])
+                        events.put(("start", item["phones"][0]))
+                        self.t2s_model.model.infer_panel_naive(
+                            item["all_phones"][0].unsqueeze(0),
+                            item["all_phones_len"][0],
+                            prompt,
+                            item["all_bert_features"][0].unsqueeze(0),
+                            top_k=top_k,
+                            top_p=top_p,
+                            temperature=temperature,
+                            early_stop_num=self.configs.hz * self.configs.max_sec,
+                            repetition_penalty=repetition_penalty,
+                            token_callback=on_token,
+                        )
+                        events.put(("end", None))
+            except _StreamCancelled:
+                pass
+            except Exception as e:
+                events.put(("error", e))
+                return
+            events.put(("done", None))
+
+        producer = threading.Thread(target=produce, name="tts-stream-t2s", daemon=True)
+        producer.start()
+        t_first = None
+        try:
+            phones, tokens, emitted, tail = None, [], 0, None
+            while True:
+                kind, value = events.get()
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    break
+                if kind == "start":
+                    phones, tokens, emitted, tail = value.unsqueeze(0).to(device), [], 0, None
+                    continue
+
+                if kind == "token":
+                    tokens.append(value)
+                    if not incremental or len(tokens) - emitted < chunk_tokens + lookahead:
+                        continue
+                    end = len(tokens) - lookahead
+                    audio, tail = self._decode_stream_window(tokens, phones, refer_audio_spec, emitted, end, tail)
+                    emitted = end
+                    chunk = self._stream_chunk_to_int16(audio)
+                elif len(tokens) == 0:
+                    continue
+                elif incremental:
+                    audio, _ = self._decode_stream_window(tokens, phones, refer_audio_spec, emitted, len(tokens), tail)
+                    zero_wav = torch.zeros(int(output_sr * fragment_interval), dtype=audio.dtype, device=audio.device)
+                    chunk = self._stream_chunk_to_int16(torch.cat([audio, zero_wav], dim=0))
+                else:
+                    codes = torch.LongTensor(tokens).view(1, 1, -1).to(device)
+                    if self.configs.use_vocoder:
+                        audio = self.using_vocoder_synthesis(
+                            codes, phones, speed=speed_factor, sample_steps=sample_steps
+                        )
+                    else:
+                        audio = self.vits_model.decode(codes, phones, refer_audio_spec, speed=speed_factor).detach()[
+                            0, 0, :
+                        ]
+                    output_sr, chunk = self.audio_postprocess(
+                        [[audio]], output_sr, None, speed_factor, False, fragment_interval, super_sampling
+                    )
+
+                if t_first is None:
+                    t_first = time.perf_counter()
+                    print(f"流式合成首包延迟: {(t_first - t_start) * 1000:.1f}ms")
+                yield output_sr, chunk
+        finally:
+            cancelled.set()
+            producer.join()
+        print(f"流式合成用时: {time.perf_counter() - t_start:.3f}s")
+
+    def _decode_stream_window(
+        self,
+        tokens: List[int],
+        phones: torch.LongTensor,
+        refer_audio_spec: List[torch.Tensor],
+        start: int,
+        end: int,
+        tail: torch.Tensor = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Decode all tokens received so far from start - stream_context_tokens on, and return
+        the audio of tokens[start:end] (its beginning cross-faded with tail, the audio the
+        previous window decoded past its end) and the new tail.
+        """
+        samples_per_token = 2 * math.prod(self.vits_model.upsample_rates)
+        window_start = max(0, start - self.stream_context_tokens)
+        codes = torch.LongTensor(tokens[window_start:]).view(1, 1, -1).to(self.configs.device)
+        audio = self.vits_model.decode(codes, phones, refer_audio_spec).detach()[0, 0, :]
+        body = audio[(start - window_start) * samples_per_token : (end - window_start) * samples_per_token].clone()
+        new_tail = audio[(end - window_start) * samples_per_token :]
+        if tail is not None:
+            n = min(tail.shape[0], body.shape[0])
+            fade_in = torch.linspace(0, 1, n, dtype=body.dtype, device=body.device)
+            body[:n] = body[:n] * fade_in + tail[:n] * (1 - fade_in)
+        return body, new_tail
+
+    @staticmethod
+    def _stream_chunk_to_int16(audio: torch.Tensor) -> np.ndarray:
+        return (audio.float().clamp(-1, 1) * 32767).cpu().numpy().astype(np.int16)
+
+    @torch.no_grad()
+    def infer_fragments(self, fragments: list, no_prompt_text: bool = False, **params) -> Tuple[int, List[torch.Tensor]]:
+        """
+        Synthesize preprocessed text fragments (see TextPreprocessor.preprocess), possibly
+        taken from different requests, as a single batch with the current prompt (see prepare_prompt).
+        Sequences leave the T2S batch as soon as they reach EOS.
+
+        Args:
+            fragments (List[dict]): {"phones", "bert_features", "norm_text"} of each fragment.
+            no_prompt_text (bool): synthesize without the prompt text / prompt semantic.
+            **params: top_k, top_p, temperature, repetition_penalty, speed_factor, sample_steps.
+
+        Returns:
+            Tuple[int, List[torch.Tensor]]: sampling rate and the raw audio of each fragment, in input order.
+        """
+        batch, _ = self.to_batch(
+            fragments,
+            prompt_data=self.prompt_cache if not no_prompt_text else None,
+            batch_size=len(fragments),
+            split_bucket=False,
+            device=self.configs.device,
+            precision=self.precision,
+        )
+        audio_fragments, _ = self._synthesize_batch(
+            batch[0], self.t2s_model.model.infer_panel_batch_infer, no_prompt_text, parallel_infer=True, **params
+        )
+        output_sr = self.configs.sampling_rate if not self.configs.use_vocoder else self.vocoder_configs["sr"]
+        return output_sr, audio_fragments
+
+    def _synthesize_batch(
+        self,
+        item: dict,
+        infer_panel,
+        no_prompt_text: bool,
+        top_k: int = 5,
+        top_p: float = 1,
+        temperature: float = 1,
+        repetition_penalty: float = 1.35,
+        speed_factor: float = 1.0,
+        sample_steps: int = 32,
+        parallel_infer: bool = True,
+    ):
+        """
+        Predict the semantic tokens of one batch (see to_batch) with the current
+        prompt and synthesize the audio of every fragment in it.
+
+        Returns:
+            Tuple[List[torch.Tensor], float]: the audio fragments in batch order, and
+                the time.perf_counter() at which the semantic tokens were ready.
+        """
+        batch_phones: List[torch.LongTensor] = item["phones"]
+        # batch_phones:torch.LongTensor = item["phones"]
+        batch_phones_len: torch.LongTensor = item["phones_len"]
+        all_phoneme_ids: torch.LongTensor = item["all_phones"]
+        all_phoneme_lens: torch.LongTensor = item["all_phones_len"]
+        all_bert_features: torch.LongTensor = item["all_bert_features"]
+        norm_text: str = item["norm_text"]
+        max_len = item["max_len"]
+
+        print(i18n("前端处理后的文本(每句):"), norm_text)
+        if no_prompt_text:
+            prompt = None
+        else:
+            prompt = self.prompt_cache["prompt_semantic"].expand(len(all_phoneme_ids), -1).to(self.configs.device)
+
+        print(f"############ {i18n('预测语义Token')} ############")
+        pred_semantic_list, idx_list = infer_panel(
+            all_phoneme_ids,
+            all_phoneme_lens,
+            prompt,
+            all_bert_features,
+            # prompt_phone_len=ph_offset,
+            top_k=top_k,
+            top_p=top_p,
+            temperature=temperature,
+            early_stop_num=self.configs.hz * self.configs.max_sec,
+            max_len=max_len,
+            repetition_penalty=repetition_penalty,
+        )
+        t4 = time.perf_counter()
+
+        refer_audio_spec: torch.Tensor = [
+            item.to(dtype=self.precision, device=self.configs.device) for item in self.prompt_cache["refer_spec"]
+        ]
+
+        batch_audio_fragment = []
+
+        # ## vits并行推理 method 1
+        # pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
+        # pred_semantic_len = torch.LongTensor([item.shape[0] for item in pred_semantic_list]).to(self.configs.device)
+        # pred_semantic = self.batch_sequences(pred_semantic_list, axis=0, pad_value=0).unsqueeze(0)
+        # max_len = 0
+        # for i in range(0, len(batch_phones)):
+        #     max_len = max(max_len, batch_phones[i].shape[-1])
+        # batch_phones = self.batch_sequences(batch_phones, axis=0, pad_value=0, max_length=max_len)
+        # batch_phones = batch_phones.to(self.configs.device)
+        # batch_audio_fragment = (self.vits_model.batched_decode(
+        #         pred_semantic, pred_semantic_len, batch_phones, batch_phones_len,refer_audio_spec
+        #     ))
+        print(f"############ {i18n('合成音频')} ############")
+        if not self.configs.use_vocoder:
+            if speed_factor == 1.0:
+                print(f"{i18n('并行合成中')}...")
+                # ## vits并行推理 method 2
+                pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
+                upsample_rate = math.prod(self.vits_model.upsample_rates)
+                audio_frag_idx = [
+                    pred_semantic_list[i].shape[0] * 2 * upsample_rate for i in range(0, len(pred_semantic_list))
+                ]
+                audio_frag_end_idx = [sum(audio_frag_idx[: i + 1]) for i in range(0, len(audio_frag_idx))]
+                all_pred_semantic = torch.cat(pred_semantic_list).unsqueeze(0).unsqueeze(0).to(self.configs.device)
+                _batch_phones = torch.cat(batch_phones).unsqueeze(0).to(self.configs.device)
+                _batch_audio_fragment = self.vits_model.decode(
+                    all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor
+                ).detach()[0, 0, :]
+                audio_frag_end_idx.insert(0, 0)
+                batch_audio_fragment = [
+                    _batch_audio_fragment[audio_frag_end_idx[i - 1] : audio_frag_end_idx[i]]
+                    for i in range(1, len(audio_frag_end_idx))
+                ]
+            else:
+                # ## vits串行推理
+                for i, idx in enumerate(tqdm(idx_list)):
+                    phones = batch_phones[i].unsqueeze(0).to(self.configs.device)
+                    _pred_semantic = (
+                        pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0)
+                    )  # .unsqueeze(0)#mq要多unsqueeze一次
+                    audio_fragment = self.vits_model.decode(
+                        _pred_semantic, phones, refer_audio_spec, speed=speed_factor
+                    ).detach()[0, 0, :]
+                    batch_audio_fragment.append(audio_fragment)  ###试试重建不带上prompt部分
+        else:
+            if parallel_infer:
+                print(f"{i18n('并行合成中')}...")
+                audio_fragments = self.using_vocoder_synthesis_batched_infer(
+                    idx_list, pred_semantic_list, batch_phones, speed=speed_factor, sample_steps=sample_steps
+                )
+                batch_audio_fragment.extend(audio_fragments)
+            else:
+                for i, idx in enumerate(tqdm(idx_list)):
+                    phones = batch_phones[i].unsqueeze(0).to(self.configs.device)
+                    _pred_semantic = (
+                        pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0)
+                    )  # .unsqueeze(0)#mq要多unsqueeze一次
+                    audio_fragment = self.using_vocoder_synthesis(
+                        _pred_semantic, phones, speed=speed_factor, sample_steps=sample_steps
+                    )
+                    batch_audio_fragment.append(audio_fragment)
+
+        return batch_audio_fragment, t4
+
     def empty_cache(self):
         try:
             gc.collect()  # 触发gc的垃圾回收。避免内存一直增长。
@@ -2,8 +2,6 @@ import os
 import sys
 import threading
 
-from tqdm import tqdm
-
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 
@@ -15,6 +13,7 @@ from typing import Dict, List, Tuple
 from text.cleaner import clean_text
 from text import cleaned_text_to_sequence
 from transformers import AutoModelForMaskedLM, AutoTokenizer
+from TTS_infer_pack.prompt_cache import PromptCache
 from TTS_infer_pack.text_segmentation_method import split_big_text, splits, get_method as get_seg_method
 
 from tools.i18n.i18n import I18nAuto, scan_language_list
@@ -50,11 +49,21 @@ def merge_short_text_in_array(texts: str, threshold: int) -> list:
 
 
 class TextPreprocessor:
-    def __init__(self, bert_model: AutoModelForMaskedLM, tokenizer: AutoTokenizer, device: torch.device):
+    def __init__(
+        self,
+        bert_model: AutoModelForMaskedLM,
+        tokenizer: AutoTokenizer,
+        device: torch.device,
+        cache: PromptCache = None,
+        bert_batch_size: int = 16,
+    ):
         self.bert_model = bert_model
         self.tokenizer = tokenizer
         self.device = device
         self.bert_lock = threading.RLock()
+        # 文本前端结果 (phones, bert_features, norm_text) 的 LRU / 磁盘缓存，None 表示不缓存
+        self.cache = cache
+        self.bert_batch_size = max(1, bert_batch_size)
 
     def preprocess(self, text: str, lang: str, text_split_method: str, version: str = "v2") -> List[Dict]:
         print(f"############ {i18n('切分文本')} ############")
@@ -62,8 +71,7 @@ class TextPreprocessor:
         texts = self.pre_seg_text(text, lang, text_split_method)
         result = []
         print(f"############ {i18n('提取文本Bert特征')} ############")
-        for text in tqdm(texts):
-            phones, bert_features, norm_text = self.segment_and_extract_feature_for_text(text, lang, version)
+        for phones, bert_features, norm_text in self.extract_features(texts, lang, version):
             if phones is None or norm_text == "":
                 continue
             res = {
@@ -120,86 +128,149 @@ class TextPreprocessor:
         return self.get_phones_and_bert(text, language, version)
 
     def get_phones_and_bert(self, text: str, language: str, version: str, final: bool = False):
-        with self.bert_lock:
-            if language in {"en", "all_zh", "all_ja", "all_ko", "all_yue"}:
-                # language = language.replace("all_","")
-                formattext = text
-                while "  " in formattext:
-                    formattext = formattext.replace("  ", " ")
-                if language == "all_zh":
-                    if re.search(r"[A-Za-z]", formattext):
-                        formattext = re.sub(r"[a-z]", lambda x: x.group(0).upper(), formattext)
-                        formattext = chinese.mix_text_normalize(formattext)
-                        return self.get_phones_and_bert(formattext, "zh", version)
-                    else:
-                        phones, word2ph, norm_text = self.clean_text_inf(formattext, language, version)
-                        bert = self.get_bert_feature(norm_text, word2ph).to(self.device)
-                elif language == "all_yue" and re.search(r"[A-Za-z]", formattext):
+        return self.extract_features([text], language, version, final)[0]
+
+    def extract_features(
+        self, texts: List[str], language: str, version: str, final: bool = False
+    ) -> List[Tuple[list, torch.Tensor, str]]:
+        """
+        (phones, bert_features, norm_text) of every text segment. Segments found in
+        the cache skip the text frontend; the BERT features of the others are computed
+        with batched forwards (see get_bert_features) instead of one forward per segment.
+        """
+        results = [None] * len(texts)
+        pending = []
+        for i, text in enumerate(texts):
+            key = None
+            if self.cache is not None:
+                key = self.cache.make_key(
+                    "text", text, language=language, version=version, final=final, bert=self.tokenizer.name_or_path
+                )
+                # entries are kept on the CPU, only the returned copy is moved to self.device
+                cached = self.cache.get(key, "cpu")
+                if cached is not None:
+                    results[i] = (cached["phones"], cached["bert_features"].to(self.device), cached["norm_text"])
+                    continue
+            with self.bert_lock:
+                phones, bert_parts, norm_text = self.clean_segment(text, language, version, final)
+            pending.append((i, key, phones, bert_parts, norm_text))
+
+        bert_items = [
+            (part_text, word2ph)
+            for *_, bert_parts, _ in pending
+            for _, part_text, word2ph in bert_parts
+            if part_text is not None
+        ]
+        bert_features = iter(self.get_bert_features(bert_items))
+        for i, key, phones, bert_parts, norm_text in pending:
+            bert_list = []
+            for n_phones, part_text, _ in bert_parts:
+                if part_text is None:
+                    bert_list.append(torch.zeros((1024, n_phones), dtype=torch.float32).to(self.device))
+                else:
+                    bert_list.append(next(bert_features).to(self.device))
+            bert = torch.cat(bert_list, dim=1)
+            results[i] = (phones, bert, norm_text)
+            if key is not None:
+                self.cache.put(key, {"phones": phones, "bert_features": bert.cpu(), "norm_text": norm_text})
+        return results
+
+    def clean_segment(self, text: str, language: str, version: str, final: bool = False) -> Tuple[list, list, str]:
+        """
+        Text frontend of a segment (language split, normalization, G2P) without the BERT forward.
+
+        Returns:
+            Tuple[list, list, str]: phones, the parts of the segment as (number of phones,
+                norm_text, word2ph) with norm_text None where the BERT features are zeros, and norm_text.
+        """
+        if language in {"en", "all_zh", "all_ja", "all_ko", "all_yue"}:
+            # language = language.replace("all_","")
+            formattext = text
+            while "  " in formattext:
+                formattext = formattext.replace("  ", " ")
+            if language == "all_zh":
+                if re.search(r"[A-Za-z]", formattext):
                     formattext = re.sub(r"[a-z]", lambda x: x.group(0).upper(), formattext)
                     formattext = chinese.mix_text_normalize(formattext)
-                    return self.get_phones_and_bert(formattext, "yue", version)
+                    return self.clean_segment(formattext, "zh", version)
                 else:
                     phones, word2ph, norm_text = self.clean_text_inf(formattext, language, version)
-                    bert = torch.zeros(
-                        (1024, len(phones)),
-                        dtype=torch.float32,
-                    ).to(self.device)
-            elif language in {"zh", "ja", "ko", "yue", "auto", "auto_yue"}:
-                textlist = []
-                langlist = []
-                if language == "auto":
-                    for tmp in LangSegmenter.getTexts(text):
-                        langlist.append(tmp["lang"])
-                        textlist.append(tmp["text"])
-                elif language == "auto_yue":
-                    for tmp in LangSegmenter.getTexts(text):
-                        if tmp["lang"] == "zh":
-                            tmp["lang"] = "yue"
+                    bert_parts = [(len(phones), norm_text, word2ph)]
+            elif language == "all_yue" and re.search(r"[A-Za-z]", formattext):
+                formattext = re.sub(r"[a-z]", lambda x: x.group(0).upper(), formattext)
+                formattext = chinese.mix_text_normalize(formattext)
+                return self.clean_segment(formattext, "yue", version)
+            else:
+                phones, word2ph, norm_text = self.clean_text_inf(formattext, language, version)
+                bert_parts = [(len(phones), None, None)]
+        elif language in {"zh", "ja", "ko", "yue", "auto", "auto_yue"}:
+            textlist = []
+            langlist = []
+            if language == "auto":
+                for tmp in LangSegmenter.getTexts(text):
+                    langlist.append(tmp["lang"])
+                    textlist.append(tmp["text"])
+            elif language == "auto_yue":
+                for tmp in LangSegmenter.getTexts(text):
+                    if tmp["lang"] == "zh":
+                        tmp["lang"] = "yue"
+                    langlist.append(tmp["lang"])
+                    textlist.append(tmp["text"])
+            else:
+                for tmp in LangSegmenter.getTexts(text):
+                    if tmp["lang"] == "en":
                         langlist.append(tmp["lang"])
-                        textlist.append(tmp["text"])
-                else:
-                    for tmp in LangSegmenter.getTexts(text):
-                        if tmp["lang"] == "en":
-                            langlist.append(tmp["lang"])
-                        else:
-                            # 因无法区别中日韩文汉字,以用户输入为准
-                            langlist.append(language)
-                        textlist.append(tmp["text"])
-                # print(textlist)
-                # print(langlist)
-                phones_list = []
-                bert_list = []
-                norm_text_list = []
-                for i in range(len(textlist)):
-                    lang = langlist[i]
-                    phones, word2ph, norm_text = self.clean_text_inf(textlist[i], lang, version)
-                    bert = self.get_bert_inf(phones, word2ph, norm_text, lang)
-                    phones_list.append(phones)
-                    norm_text_list.append(norm_text)
-                    bert_list.append(bert)
-                bert = torch.cat(bert_list, dim=1)
-                phones = sum(phones_list, [])
-                norm_text = "".join(norm_text_list)
-
-            if not final and len(phones) < 6:
-                return self.get_phones_and_bert("." + text, language, version, final=True)
-
-            return phones, bert, norm_text
+                    else:
+                        # 因无法区别中日韩文汉字,以用户输入为准
+                        langlist.append(language)
+                    textlist.append(tmp["text"])
+            # print(textlist)
+            # print(langlist)
+            phones_list = []
+            bert_parts = []
+            norm_text_list = []
+            for i in range(len(textlist)):
+                lang = langlist[i].replace("all_", "")
+                phones, word2ph, norm_text = self.clean_text_inf(textlist[i], lang, version)
+                phones_list.append(phones)
+                norm_text_list.append(norm_text)
+                # 只有中文使用 BERT 特征，其余语言为全零
+                bert_parts.append((len(phones), norm_text, word2ph) if lang == "zh" else (len(phones), None, None))
+            phones = sum(phones_list, [])
+            norm_text = "".join(norm_text_list)
+
+        if not final and len(phones) < 6:
+            return self.clean_segment("." + text, language, version, final=True)
+
+        return phones, bert_parts, norm_text
+
+    def get_bert_features(self, items: List[Tuple[str, list]]) -> List[torch.Tensor]:
+        """
+        Phone-level BERT features of several (norm_text, word2ph), computed with padded
+        batches of up to bert_batch_size texts of similar length.
+        """
+        features = [None] * len(items)
+        order = sorted(range(len(items)), key=lambda i: len(items[i][0]))
+        for start in range(0, len(order), self.bert_batch_size):
+            batch = order[start : start + self.bert_batch_size]
+            with self.bert_lock, torch.no_grad():
+                inputs = self.tokenizer([items[i][0] for i in batch], return_tensors="pt", padding=True)
+                for k in inputs:
+                    inputs[k] = inputs[k].to(self.device)
+                res = self.bert_model(**inputs, output_hidden_states=True)
+                hidden = torch.cat(res["hidden_states"][-3:-2], -1).cpu()
+            lengths = inputs["attention_mask"].sum(-1).tolist()
+            for row, i in enumerate(batch):
+                text, word2ph = items[i]
+                # 去掉 [CLS] / [SEP]
+                res = hidden[row, 1 : int(lengths[row]) - 1]
+                assert len(word2ph) == len(text)
+                phone_level_feature = torch.repeat_interleave(res, torch.tensor(word2ph), dim=0)
+                features[i] = phone_level_feature.T
+        return features
 
     def get_bert_feature(self, text: str, word2ph: list) -> torch.Tensor:
-        with torch.no_grad():
-            inputs = self.tokenizer(text, return_tensors="pt")
-            for i in inputs:
-                inputs[i] = inputs[i].to(self.device)
-            res = self.bert_model(**inputs, output_hidden_states=True)
-            res = torch.cat(res["hidden_states"][-3:-2], -1)[0].cpu()[1:-1]
-        assert len(word2ph) == len(text)
-        phone_level_feature = []
-        for i in range(len(word2ph)):
-            repeat_feature = res[i].repeat(word2ph[i], 1)
-            phone_level_feature.append(repeat_feature)
-        phone_level_feature = torch.cat(phone_level_feature, dim=0)
-        return phone_level_feature.T
+        return self.get_bert_features([(text, word2ph)])[0]
 
     def clean_text_inf(self, text: str, language: str, version: str = "v2"):
         language = language.replace("all_", "")
@@ -207,18 +278,6 @@ class TextPreprocessor:
         phones = cleaned_text_to_sequence(phones, version)
         return phones, word2ph, norm_text
 
-    def get_bert_inf(self, phones: list, word2ph: list, norm_text: str, language: str):
-        language = language.replace("all_", "")
-        if language == "zh":
-            feature = self.get_bert_feature(norm_text, word2ph).to(self.device)
-        else:
-            feature = torch.zeros(
-                (1024, len(phones)),
-                dtype=torch.float32,
-            ).to(self.device)
-
-        return feature
-
     def filter_text(self, texts):
         _text = []
         if all(text in [None, " ", "\n", ""] for text in texts):
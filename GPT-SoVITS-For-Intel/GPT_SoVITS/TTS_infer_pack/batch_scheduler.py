@@ -0,0 +1,265 @@
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Generator, List, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from TTS_infer_pack.worker_pool import TTSWorkerPool
+
+
+class _BatchJob:
+    """One request: its preprocessed text fragments and a queue of synthesized ones."""
+
+    def __init__(self, req: dict, fragments: list):
+        self.req = req
+        self.fragments = fragments
+        self.results = queue.Queue()
+        self.cancelled = False
+
+
+class TTSBatchScheduler:
+    """
+    Cross-request batching on top of a TTSWorkerPool.
+
+    Every request is split into text fragments on the caller's thread. The fragments
+    are queued per group (same reference voice, prompt and sampling parameters), and
+    one dispatch loop per pool worker repeatedly takes the oldest group once it holds
+    max_batch_size fragments or its oldest fragment has waited max_wait_ms, and
+    synthesizes them with a single infer_panel_batch_infer + VITS decode
+    (TTS.infer_fragments). Sequences leave the T2S batch as soon as they reach EOS,
+    and fragments that arrive meanwhile join the next batch of their group.
+    Each request gets its own audio back, fragment by fragment when streaming.
+    """
+
+    def __init__(self, pool: "TTSWorkerPool", max_batch_size: int = 8, max_wait_ms: float = 20):
+        self.pool = pool
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000)
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[tuple, deque]" = OrderedDict()
+        self._since = {}
+        self._closed = False
+
+        self.requests = 0
+        self.batches = 0
+        self.batched_fragments = 0
+        self.recent = deque(maxlen=100)
+
+        self._threads = [
+            threading.Thread(target=self._loop, name="tts-batch-%d" % i, daemon=True) for i in range(pool.num_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def accepts(self, req: dict) -> bool:
+        """
+        Requests that can share a batch: parallel inference without a fixed seed
+        (a batch samples with one random state), and with a prompt text when
+        SoVITS V3/V4 is used. Incremental streaming requests (stream_chunk_tokens)
+        and other requests should go through TTSWorkerPool.run.
+        """
+        if self.pool.primary.configs.use_vocoder and req.get("prompt_text") in [None, ""]:
+            return False
+        if (req.get("stream_chunk_tokens") or 0) > 0:
+            return False
+        return req.get("parallel_infer", True) and req.get("seed", -1) in [-1, "", None]
+
+    @staticmethod
+    def group_key(req: dict) -> tuple:
+        return (
+            req.get("ref_audio_path"),
+            tuple(req.get("aux_ref_audio_paths") or []),
+            req.get("prompt_text") or "",
+            req.get("prompt_lang") or "",
+            req.get("top_k", 5),
+            req.get("top_p", 1),
+            req.get("temperature", 1),
+            req.get("repetition_penalty", 1.35),
+            req.get("speed_factor", 1.0),
+            req.get("sample_steps", 32),
+        )
+
+    def run(self, req: dict) -> Generator:
+        """
+        Same contract as TTS.run: one (sr, audio) chunk, or one chunk per text
+        fragment when req["return_fragment"] is set.
+        """
+        tts = self.pool.primary
+        text_lang = req.get("text_lang", "")
+        assert text_lang in tts.configs.languages
+        fragment_interval = max(req.get("fragment_interval", 0.3), 0.01)
+        speed_factor = req.get("speed_factor", 1.0)
+        super_sampling = req.get("super_sampling", False) and tts.configs.use_vocoder and tts.configs.version == "v3"
+        return_fragment = req.get("return_fragment", False)
+
+        t_submit = time.perf_counter()
+        fragments = tts.text_preprocessor.preprocess(
+            req.get("text", ""), text_lang, req.get("text_split_method", "cut0"), tts.configs.version
+        )
+        if len(fragments) == 0:
+            yield 16000, np.zeros(int(16000), dtype=np.int16)
+            return
+
+        job = _BatchJob(req, fragments)
+        key = self.group_key(req)
+        t_queued = time.perf_counter()
+        with self._cond:
+            if key not in self._pending:
+                self._pending[key] = deque()
+                self._since[key] = t_queued
+            self._pending[key].extend((job, i, t_queued) for i in range(len(fragments)))
+            self.requests += 1
+            self._cond.notify_all()
+
+        t_first = None
+        audio_seconds = 0.0
+        received = {}
+        next_index = 0
+        try:
+            while next_index < len(fragments):
+                item = job.results.get()
+                if isinstance(item, BaseException):
+                    raise item
+                index, sr, audio = item
+                received[index] = audio
+                while next_index in received:
+                    if return_fragment:
+                        sr, chunk = tts.audio_postprocess(
+                            [[received.pop(next_index)]],
+                            sr,
+                            None,
+                            speed_factor,
+                            False,
+                            fragment_interval,
+                            super_sampling,
+                        )
+                        if t_first is None:
+                            t_first = time.perf_counter()
+                        audio_seconds += len(chunk) / float(sr)
+                        yield sr, chunk
+                    next_index += 1
+
+            if not return_fragment:
+                sr, chunk = tts.audio_postprocess(
+                    [[received[i] for i in range(len(fragments))]],
+                    sr,
+                    None,
+                    speed_factor,
+                    False,
+                    fragment_interval,
+                    super_sampling,
+                )
+                t_first = time.perf_counter()
+                audio_seconds = len(chunk) / float(sr)
+                yield sr, chunk
+        finally:
+            # fragments still queued for a finished or abandoned request are skipped
+            job.cancelled = True
+            total = time.perf_counter() - t_submit
+            with self._cond:
+                self.recent.append(
+                    {
+                        "fragments": len(fragments),
+                        "ttfa_ms": round((t_first - t_submit) * 1000, 1) if t_first is not None else None,
+                        "total_ms": round(total * 1000, 1),
+                        "audio_s": round(audio_seconds, 3),
+                        "rtf": round(total / audio_seconds, 4) if audio_seconds > 0 else None,
+                    }
+                )
+
+    def _next_batch(self) -> Tuple[tuple, List[Tuple[_BatchJob, int]]]:
+        with self._cond:
+            while not self._closed:
+                now = time.perf_counter()
+                ready_key, timeout = None, None
+                # _since[key] is the queue time of the group's oldest pending fragment, of the groups
+                # that are full or overdue the one that has waited longest goes first
+                for key, pending in self._pending.items():
+                    age = now - self._since[key]
+                    if len(pending) >= self.max_batch_size or age >= self.max_wait:
+                        if ready_key is None or self._since[key] < self._since[ready_key]:
+                            ready_key = key
+                        continue
+                    timeout = self.max_wait - age if timeout is None else min(timeout, self.max_wait - age)
+                if ready_key is None:
+                    self._cond.wait(timeout)
+                    continue
+
+                pending = self._pending[ready_key]
+                items = [pending.popleft() for _ in range(min(len(pending), self.max_batch_size))]
+                if pending:
+                    # the fragments left behind have only waited since they were queued
+                    self._since[ready_key] = pending[0][2]
+                else:
+                    del self._pending[ready_key]
+                    del self._since[ready_key]
+                items = [(job, index) for job, index, _ in items if not job.cancelled]
+                if items:
+                    return ready_key, items
+            return None, None
+
+    def _loop(self):
+        while True:
+            key, items = self._next_batch()
+            if items is None:
+                return
+            req = items[0][0].req
+            try:
+                with self.pool.worker(self.pool.voice_key(req)) as tts:
+                    tts.prepare_prompt(
+                        req.get("ref_audio_path"),
+                        req.get("aux_ref_audio_paths"),
+                        req.get("prompt_text", ""),
+                        req.get("prompt_lang", ""),
+                    )
+                    try:
+                        sr, audio = tts.infer_fragments(
+                            [job.fragments[index] for job, index in items],
+                            no_prompt_text=req.get("prompt_text") in [None, ""],
+                            top_k=req.get("top_k", 5),
+                            top_p=req.get("top_p", 1),
+                            temperature=req.get("temperature", 1),
+                            repetition_penalty=req.get("repetition_penalty", 1.35),
+                            speed_factor=req.get("speed_factor", 1.0),
+                            sample_steps=req.get("sample_steps", 32),
+                        )
+                    finally:
+                        tts.empty_cache()
+            except Exception as e:
+                traceback.print_exc()
+                for job in {job for job, _ in items}:
+                    job.results.put(e)
+                continue
+
+            print("TTS batch: %d fragments from %d requests" % (len(items), len({id(job) for job, _ in items})))
+            with self._cond:
+                self.batches += 1
+                self.batched_fragments += len(items)
+            for (job, index), fragment in zip(items, audio):
+                job.results.put((index, sr, fragment))
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            rtfs = [m["rtf"] for m in self.recent if m["rtf"] is not None]
+            ttfas = [m["ttfa_ms"] for m in self.recent if m["ttfa_ms"] is not None]
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "requests": self.requests,
+                "batches": self.batches,
+                "avg_batch_size": self.batched_fragments / self.batches if self.batches else 0.0,
+                "pending_fragments": sum(len(pending) for pending in self._pending.values()),
+                "avg_rtf": float(np.mean(rtfs)) if rtfs else None,
+                "avg_ttfa_ms": float(np.mean(ttfas)) if ttfas else None,
+                "p95_ttfa_ms": float(np.percentile(ttfas, 95)) if ttfas else None,
+                "recent": list(self.recent)[-10:],
+            }
@@ -0,0 +1,327 @@
+import json
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+import torch
+from torch import nn
+
+try:
+    import openvino as ov
+except ImportError:
+    ov = None
+
+MANIFEST_NAME = "manifest.json"
+
+
+class OVModel:
+    """A compiled OpenVINO model with one infer request per thread."""
+
+    def __init__(self, compiled_model):
+        self.compiled_model = compiled_model
+        self.input_dtypes = [port.get_element_type().to_dtype() for port in compiled_model.inputs]
+        self.num_outputs = len(compiled_model.outputs)
+        self._local = threading.local()
+
+    def __call__(self, *inputs) -> List[np.ndarray]:
+        request = getattr(self._local, "request", None)
+        if request is None:
+            request = self._local.request = self.compiled_model.create_infer_request()
+        request.infer([np.ascontiguousarray(x, dtype=dtype) for x, dtype in zip(inputs, self.input_dtypes)])
+        return [request.get_output_tensor(i).data.copy() for i in range(self.num_outputs)]
+
+
+def _to_numpy(x: torch.Tensor) -> np.ndarray:
+    return x.detach().cpu().float().numpy() if x.is_floating_point() else x.detach().cpu().numpy()
+
+
+def _like(x: np.ndarray, ref: torch.Tensor) -> torch.Tensor:
+    return torch.from_numpy(x).to(device=ref.device, dtype=ref.dtype if ref.is_floating_point() else None)
+
+
+class _OVWrapper(nn.Module):
+    """
+    Keeps the wrapped torch model as a submodule (so .half() / .to() / state_dict still
+    work) and forwards every attribute it does not define itself to it.
+    """
+
+    def __init__(self, torch_model: nn.Module):
+        super().__init__()
+        self.torch_model = torch_model
+
+    def __getattr__(self, name):
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(self.torch_model, name)
+
+
+class OVBertModel(_OVWrapper):
+    def __init__(self, torch_model: nn.Module, ov_model: OVModel):
+        super().__init__(torch_model)
+        self.ov_model = ov_model
+
+    def forward(self, input_ids, attention_mask=None, token_type_ids=None, output_hidden_states=True, **kwargs):
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        if token_type_ids is None:
+            token_type_ids = torch.zeros_like(input_ids)
+        (hidden,) = self.ov_model(_to_numpy(input_ids), _to_numpy(attention_mask), _to_numpy(token_type_ids))
+        hidden = torch.from_numpy(hidden).to(input_ids.device)
+        # only the layer TextPreprocessor reads (hidden_states[-3]) is exported
+        return {"hidden_states": (hidden, None, None)}
+
+
+class OVHubertModel(_OVWrapper):
+    def __init__(self, torch_model: nn.Module, ov_model: OVModel):
+        super().__init__(torch_model)
+        self.ov_model = ov_model
+
+    def forward(self, input_values, **kwargs):
+        (hidden,) = self.ov_model(_to_numpy(input_values))
+        return {"last_hidden_state": _like(hidden, input_values)}
+
+
+class OVVocoder(_OVWrapper):
+    def __init__(self, torch_model: nn.Module, ov_model: OVModel):
+        super().__init__(torch_model)
+        self.ov_model = ov_model
+
+    def forward(self, mel):
+        (wav,) = self.ov_model(_to_numpy(mel))
+        return _like(wav, mel)
+
+
+class OVSynthesizerTrn(_OVWrapper):
+    """
+    VITS decode through OpenVINO. The exported graph takes a single reference
+    spectrogram and runs at speed 1.0; other cases (aux reference audios,
+    speed_factor) and extract_latent use the torch model.
+    """
+
+    def __init__(self, torch_model: nn.Module, ov_model: OVModel):
+        super().__init__(torch_model)
+        self.ov_model = ov_model
+
+    def decode(self, codes, text, refer, noise_scale=0.5, speed=1):
+        refers = refer if isinstance(refer, list) else [refer]
+        if len(refers) != 1 or speed != 1 or noise_scale != 0.5:
+            return self.torch_model.decode(codes, text, refer, noise_scale=noise_scale, speed=speed)
+        (audio,) = self.ov_model(_to_numpy(codes), _to_numpy(text), _to_numpy(refers[0]))
+        return _like(audio, refers[0])
+
+
+def _sample_token(
+    logits: np.ndarray,
+    previous_tokens: np.ndarray,
+    top_k: int,
+    top_p: float,
+    temperature: float,
+    repetition_penalty: float,
+) -> int:
+    """numpy version of AR.models.utils.sample for a single sequence"""
+    logits = logits.astype(np.float64)
+    if repetition_penalty != 1.0 and previous_tokens.size > 0:
+        score = logits[previous_tokens]
+        logits[previous_tokens] = np.where(score < 0, score * repetition_penalty, score / repetition_penalty)
+
+    if top_p is not None and top_p < 1.0:
+        order = np.argsort(-logits, kind="stable")
+        sorted_logits = logits[order]
+        probs = np.exp(sorted_logits - sorted_logits[0])
+        cum_probs = np.cumsum(probs / probs.sum())
+        remove = cum_probs > top_p
+        remove[0] = False
+        logits[order[remove]] = -np.inf
+
+    logits = logits / max(temperature, 1e-5)
+
+    if top_k is not None and top_k > 0:
+        pivot = np.partition(logits, -min(top_k, logits.size))[-min(top_k, logits.size)]
+        logits = np.where(logits < pivot, -np.inf, logits)
+
+    probs = np.exp(logits - logits.max())
+    probs /= probs.sum()
+    # same trick as multinomial_sample_one_no_sync: argmax(p / Exp(1))
+    return int(np.argmax(probs / np.random.exponential(1.0, size=probs.shape)))
+
+
+class OVText2SemanticDecoder(_OVWrapper):
+    """
+    T2S decoding with the encoder / first stage decoder / stage decoder graphs
+    exported by ov_export.py (AR/models/t2s_model_onnx.py). Sampling runs in numpy
+    with the request's top_k / top_p / temperature / repetition_penalty; the
+    tokens sampled inside the graphs are ignored.
+    Sequences are decoded one by one; reference-free synthesis uses the torch model.
+    """
+
+    def __init__(self, torch_model: nn.Module, encoder: OVModel, first_stage_decoder: OVModel, stage_decoder: OVModel):
+        super().__init__(torch_model)
+        self.ov_encoder = encoder
+        self.ov_first_stage_decoder = first_stage_decoder
+        self.ov_stage_decoder = stage_decoder
+
+    def infer_panel_batch_infer(self, x, x_lens, prompts, bert_feature, **kwargs):
+        return self.infer_panel_naive_batched(x, x_lens, prompts, bert_feature, **kwargs)
+
+    def infer_panel_naive_batched(
+        self,
+        x: List[torch.LongTensor],
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,
+        bert_feature: List[torch.Tensor],
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        **kwargs,
+    ):
+        if prompts is None:
+            return self.torch_model.infer_panel_naive_batched(
+                x,
+                x_lens,
+                prompts,
+                bert_feature,
+                top_k=top_k,
+                top_p=top_p,
+                early_stop_num=early_stop_num,
+                temperature=temperature,
+                repetition_penalty=repetition_penalty,
+                **kwargs,
+            )
+        y_list = []
+        idx_list = []
+        for i in range(len(x)):
+            y, idx = self.infer_panel_naive(
+                x[i].unsqueeze(0),
+                x_lens[i],
+                prompts[i].unsqueeze(0),
+                bert_feature[i].unsqueeze(0),
+                top_k=top_k,
+                top_p=top_p,
+                early_stop_num=early_stop_num,
+                temperature=temperature,
+                repetition_penalty=repetition_penalty,
+            )
+            y_list.append(y[0])
+            idx_list.append(idx)
+        return y_list, idx_list
+
+    def infer_panel_naive(
+        self,
+        x: torch.LongTensor,
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,
+        bert_feature: torch.Tensor,
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        **kwargs,
+    ):
+        if prompts is None or prompts.shape[1] < 2:
+            return self.torch_model.infer_panel_naive(
+                x,
+                x_lens,
+                prompts,
+                bert_feature,
+                top_k,
+                top_p,
+                early_stop_num,
+                temperature,
+                repetition_penalty,
+                **kwargs,
+            )
+        token_callback = kwargs.get("token_callback", None)
+        (x_enc,) = self.ov_encoder(_to_numpy(x), _to_numpy(bert_feature))
+        prompt = _to_numpy(prompts).astype(np.int64)
+        prefix_len = prompt.shape[1]
+        # Prefill with all but the last prompt token, then let the stage decoder
+        # re-feed it: this yields the logits of the first new token, which the
+        # first stage decoder graph only returns already sampled.
+        _, k, v, y_emb, x_example = self.ov_first_stage_decoder(x_enc, prompt[:, :-1])
+        y = prompt
+        tokens = []
+        for idx in range(1500):
+            _, k, v, y_emb, logits, _ = self.ov_stage_decoder(y, k, v, y_emb, x_example)
+            logits = logits[0]
+            if idx < 11:  ###至少预测出10个token不然不给停止（0.4s）
+                logits = logits[:-1]
+            token = _sample_token(logits, y[0], top_k, top_p, temperature, repetition_penalty)
+            tokens.append(token)
+            y = np.concatenate([y, np.array([[token]], dtype=np.int64)], axis=1)
+
+            stop = early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num
+            if int(np.argmax(logits)) == self.EOS or token == self.EOS:
+                stop = True
+            if stop:
+                print(f"T2S Decoding EOS [{prefix_len} -> {y.shape[1]}]")
+                break
+            if token_callback is not None:
+                token_callback(token)
+        return torch.from_numpy(y[:, :-1]).to(x.device), idx
+
+
+class OVBackend:
+    """
+    OpenVINO models exported by ov_export.py.
+
+    model_dir holds the IR files and a manifest recording which weights each
+    model was exported from; a model is only used when it matches the weights
+    currently loaded, otherwise the torch model is kept. Compiled blobs are
+    cached in cache_dir (CACHE_DIR), so only the first start pays for compilation.
+    """
+
+    def __init__(self, model_dir: str, device: str = "CPU", cache_dir: Optional[str] = None):
+        if ov is None:
+            raise ImportError("openvino is not installed, run `pip install openvino` to use the openvino backend")
+        self.model_dir = model_dir
+        self.device = device
+        self.core = ov.Core()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.core.set_property({"CACHE_DIR": cache_dir})
+        manifest_path = os.path.join(model_dir, MANIFEST_NAME)
+        self.manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        else:
+            print(f"OpenVINO manifest not found: {manifest_path}, all models stay on torch")
+
+    def compile(self, name: str, source: Optional[str] = None) -> Optional[OVModel]:
+        entry = self.manifest.get(name)
+        if entry is None:
+            print(f"OpenVINO model {name} not exported, using torch")
+            return None
+        if source is not None and os.path.abspath(entry["source"]) != os.path.abspath(source):
+            print(f"OpenVINO model {name} was exported from {entry['source']}, not {source}, using torch")
+            return None
+        xml_path = os.path.join(self.model_dir, entry["xml"])
+        print(f"Compiling OpenVINO model {xml_path} on {self.device}")
+        return OVModel(self.core.compile_model(xml_path, self.device, {"PERFORMANCE_HINT": "LATENCY"}))
+
+    def wrap_t2s(self, decoder: nn.Module, weights_path: str) -> nn.Module:
+        models = [self.compile(name, weights_path) for name in ("t2s_encoder", "t2s_fsdec", "t2s_sdec")]
+        if None in models:
+            return decoder
+        return OVText2SemanticDecoder(decoder, *models)
+
+    def wrap_vits(self, vits_model: nn.Module, weights_path: str) -> nn.Module:
+        ov_model = self.compile("vits", weights_path)
+        return vits_model if ov_model is None else OVSynthesizerTrn(vits_model, ov_model)
+
+    def wrap_bert(self, bert_model: nn.Module, base_path: str) -> nn.Module:
+        ov_model = self.compile("bert", base_path)
+        return bert_model if ov_model is None else OVBertModel(bert_model, ov_model)
+
+    def wrap_cnhubert(self, hubert_model: nn.Module, base_path: str) -> nn.Module:
+        ov_model = self.compile("cnhubert", base_path)
+        return hubert_model if ov_model is None else OVHubertModel(hubert_model, ov_model)
+
+    def wrap_vocoder(self, vocoder: nn.Module, version: str) -> nn.Module:
+        ov_model = self.compile(f"vocoder_{version}")
+        return vocoder if ov_model is None else OVVocoder(vocoder, ov_model)
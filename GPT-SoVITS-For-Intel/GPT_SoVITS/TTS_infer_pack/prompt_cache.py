@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import torch
+
+
+def _to_device(value: Any, device) -> Any:
+    if isinstance(value, torch.Tensor):
+        return value.to(device)
+    if isinstance(value, list):
+        return [_to_device(item, device) for item in value]
+    if isinstance(value, dict):
+        return {k: _to_device(v, device) for k, v in value.items()}
+    return value
+
+
+class PromptCache:
+    """
+    LRU cache of reference-audio artifacts (refer spec, prompt_semantic) and
+    prompt-text features (phones, bert features), so that switching between
+    speakers is a lookup instead of re-running HuBERT / BERT.
+
+    Entries are keyed by the content hash of the reference audio (or the prompt
+    text) plus everything the artifact depends on (model weights, version,
+    precision, ...). An optional cache_dir persists entries with torch.save.
+
+    TextPreprocessor uses another instance for the text frontend results of
+    frequently synthesized segments.
+    """
+
+    def __init__(self, max_items: int = 8, cache_dir: Optional[str] = None):
+        self.max_items = max(1, int(max_items))
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def audio_digest(self, path: str) -> str:
+        """sha256 of the audio file, memoized by (path, size, mtime)"""
+        st = os.stat(path)
+        stat_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        digest = self._digests.get(stat_key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            self._digests[stat_key] = digest
+        return digest
+
+    @staticmethod
+    def make_key(kind: str, content: str, **params) -> str:
+        suffix = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        raw = f"{kind}:{content}:{suffix}"
+        return f"{kind}-{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".pt")
+
+    def get(self, key: str, device=None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.cache_dir and os.path.exists(self._disk_path(key)):
+            try:
+                value = torch.load(self._disk_path(key), map_location="cpu")
+            except Exception as e:
+                print(f"Failed to load prompt cache {key}: {e}")
+                value = None
+            if value is not None:
+                if device is not None:
+                    value = _to_device(value, device)
+                with self._lock:
+                    self.disk_hits += 1
+                    self._insert(key, value)
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._insert(key, value)
+        if self.cache_dir:
+            tmp_path = self._disk_path(key) + ".tmp"
+            try:
+                torch.save(_to_device(value, "cpu"), tmp_path)
+                os.replace(tmp_path, self._disk_path(key))
+            except Exception as e:
+                print(f"Failed to save prompt cache {key}: {e}")
+
+    def _insert(self, key: str, value: Dict[str, Any]):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def clear(self, disk: bool = False):
+        with self._lock:
+            self._items.clear()
+        if disk and self.cache_dir:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".pt"):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "max_items": self.max_items,
+                "cache_dir": self.cache_dir,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,207 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Generator, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    # api_v2 imports TTS as GPT_SoVITS.TTS_infer_pack.TTS, avoid loading it a second time
+    from TTS_infer_pack.TTS import TTS
+
+
+class TTSWorkerPool:
+    """
+    A pool of TTS workers sharing one set of (read-only) model weights.
+
+    Each worker is a TTS.clone_worker() of the primary pipeline with its own
+    prompt_cache, so concurrent requests no longer race on the selected reference
+    audio. Requests are routed with per-voice affinity: a voice goes back to the
+    worker that served it last when that worker is idle, so its prompt is still
+    selected; otherwise any idle worker takes it (the shared prompt_store makes the
+    switch a lookup). Weight changes drain the pool and rebuild the workers.
+    """
+
+    def __init__(self, primary: "TTS", num_workers: int = 1, max_affinity: int = 256):
+        self.primary = primary
+        self.num_workers = max(1, int(num_workers))
+        self.max_affinity = max_affinity
+        self._cond = threading.Condition()
+        self._affinity: "OrderedDict[str, int]" = OrderedDict()
+        self._exclusive = False
+        self._build_workers()
+
+        self.completed = 0
+        self.failed = 0
+        self.affinity_hits = 0
+        self.recent = deque(maxlen=100)
+
+    def _build_workers(self):
+        previous = getattr(self, "workers", [])
+        self.workers: List["TTS"] = [self.primary] + [self.primary.clone_worker() for _ in range(self.num_workers - 1)]
+        # the rebuilt clones keep the prompt they had selected, so the voice affinity stays valid
+        for worker, old in zip(self.workers[1:], previous[1:]):
+            worker.prompt_cache = old.prompt_cache
+        if self.num_workers > 1:
+            # weights are shared, a single worker must not reload them on error
+            for worker in self.workers:
+                worker.reload_on_error = False
+        self._idle = [True] * self.num_workers
+
+    @staticmethod
+    def voice_key(req: dict) -> str:
+        aux = req.get("aux_ref_audio_paths") or []
+        return "|".join([str(req.get("ref_audio_path"))] + [str(p) for p in aux])
+
+    def _acquire(self, voice_key: Optional[str]) -> int:
+        with self._cond:
+            while True:
+                if not self._exclusive and any(self._idle):
+                    preferred = self._affinity.get(voice_key)
+                    if preferred is not None and self._idle[preferred]:
+                        index = preferred
+                        self.affinity_hits += 1
+                    else:
+                        index = self._idle.index(True)
+                    self._idle[index] = False
+                    if voice_key is not None:
+                        self._affinity[voice_key] = index
+                        self._affinity.move_to_end(voice_key)
+                        while len(self._affinity) > self.max_affinity:
+                            self._affinity.popitem(last=False)
+                    return index
+                self._cond.wait()
+
+    def _release(self, index: int):
+        with self._cond:
+            self._idle[index] = True
+            self._cond.notify_all()
+
+    @contextmanager
+    def worker(self, voice_key: Optional[str] = None):
+        """
+        Hold an idle worker (the one affine to voice_key if possible) for direct use,
+        e.g. by TTSBatchScheduler.
+        """
+        index = self._acquire(voice_key)
+        try:
+            yield self.workers[index]
+        finally:
+            self._release(index)
+
+    def run(self, req: dict) -> Generator:
+        """
+        Same contract as TTS.run, executed on a pooled worker. The worker is held
+        until the generator is exhausted or closed.
+        Per-request metrics (wait, time to first audio, first chunk latency, total time,
+        audio seconds, RTF) are recorded and available from stats().
+        """
+        t_submit = time.perf_counter()
+        index = self._acquire(self.voice_key(req))
+        t_start = time.perf_counter()
+        t_first = None
+        audio_seconds = 0.0
+        ok = False
+        try:
+            for sr, chunk in self.workers[index].run(req):
+                if t_first is None:
+                    t_first = time.perf_counter()
+                audio_seconds += len(chunk) / float(sr)
+                yield sr, chunk
+            ok = True
+        except GeneratorExit:
+            # the caller stopped reading, e.g. a non-streaming request after its single chunk
+            ok = t_first is not None
+            raise
+        finally:
+            t_end = time.perf_counter()
+            self._release(index)
+            compute = t_end - t_start
+            metrics = {
+                "worker": index,
+                "wait_ms": round((t_start - t_submit) * 1000, 1),
+                # time to first audio: from submission (including the wait for a worker) to the first chunk
+                "ttfa_ms": round((t_first - t_submit) * 1000, 1) if t_first is not None else None,
+                "first_chunk_ms": round((t_first - t_start) * 1000, 1) if t_first is not None else None,
+                "total_ms": round(compute * 1000, 1),
+                "audio_s": round(audio_seconds, 3),
+                "rtf": round(compute / audio_seconds, 4) if audio_seconds > 0 else None,
+                "ok": ok,
+            }
+            with self._cond:
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.recent.append(metrics)
+            print(
+                "TTS worker %d: wait %.1fms, TTFA %sms, first chunk %sms, total %.1fms, audio %.2fs, RTF %s"
+                % (
+                    index,
+                    metrics["wait_ms"],
+                    metrics["ttfa_ms"],
+                    metrics["first_chunk_ms"],
+                    metrics["total_ms"],
+                    audio_seconds,
+                    metrics["rtf"],
+                )
+            )
+
+    @contextmanager
+    def _exclusive_section(self, rebuild: bool):
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            self._exclusive = True
+            while not all(self._idle):
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                if rebuild:
+                    self._build_workers()
+                self._exclusive = False
+                self._cond.notify_all()
+
+    def reconfigure(self, fn: Callable[["TTS"], None]):
+        """
+        Wait until every worker is idle, apply fn to the primary pipeline
+        (e.g. init_t2s_weights) and rebuild the workers from it. The workers
+        keep their selected prompts.
+        """
+        with self._exclusive_section(rebuild=True):
+            fn(self.primary)
+
+    def set_ref_audio(self, ref_audio_path: str):
+        """
+        Make ref_audio_path the default reference audio of every worker, as
+        TTS.set_ref_audio does for a single pipeline. Only the first worker
+        computes it, the others find it in the shared prompt_store.
+        """
+        with self._exclusive_section(rebuild=False):
+            for worker in self.workers:
+                worker.set_ref_audio(ref_audio_path)
+
+    def stats(self) -> dict:
+        with self._cond:
+            recent = [m for m in self.recent if m["ok"]]
+            rtfs = [m["rtf"] for m in recent if m["rtf"] is not None]
+            ttfas = [m["ttfa_ms"] for m in recent if m["ttfa_ms"] is not None]
+            text_cache = self.primary.text_preprocessor.cache
+            return {
+                "workers": self.num_workers,
+                "busy": self._idle.count(False),
+                "completed": self.completed,
+                "failed": self.failed,
+                "affinity_hits": self.affinity_hits,
+                "avg_wait_ms": float(np.mean([m["wait_ms"] for m in recent])) if recent else 0.0,
+                "avg_ttfa_ms": float(np.mean(ttfas)) if ttfas else None,
+                "p95_ttfa_ms": float(np.percentile(ttfas, 95)) if ttfas else None,
+                "avg_total_ms": float(np.mean([m["total_ms"] for m in recent])) if recent else 0.0,
+                "avg_rtf": float(np.mean(rtfs)) if rtfs else None,
+                "prompt_store": self.primary.prompt_store.stats(),
+                "text_cache": text_cache.stats() if text_cache is not None else None,
+                "recent": list(self.recent)[-10:],
+            }
@@ -0,0 +1,81 @@
+# TTS 推理后端基准测试
+# 用同一份 tts_infer.yaml 分别以 torch 和 openvino 后端构建 TTS，合成同一组文本，
+# 对比总耗时、音频时长与 RTF。openvino 模型需先用 ov_export.py 导出。
+#
+# 用法（在项目根目录下）:
+#   python GPT_SoVITS/benchmark_ov_tts.py --ref-audio ref.wav --prompt-text "参考音频的文本" --prompt-lang zh
+#   python GPT_SoVITS/benchmark_ov_tts.py --ref-audio ref.wav --prompt-text "..." --text-file texts.txt --text-lang zh
+import argparse
+import os
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+from TTS_infer_pack.TTS import TTS, TTS_Config
+
+default_texts = [
+    "先帝创业未半而中道崩殂，今天下三分，益州疲弊，此诚危急存亡之秋也。",
+    "然侍卫之臣不懈于内，忠志之士忘身于外者，盖追先帝之殊遇，欲报之于陛下也。",
+    "诚宜开张圣听，以光先帝遗德，恢弘志士之气，不宜妄自菲薄，引喻失义，以塞忠谏之路也。",
+]
+
+
+def synthesize(tts: TTS, req: dict, texts: list):
+    audio_seconds = 0.0
+    t0 = time.perf_counter()
+    for text in texts:
+        for sr, chunk in tts.run(dict(req, text=text)):
+            audio_seconds += len(chunk) / float(sr)
+    return time.perf_counter() - t0, audio_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTS torch / openvino backend benchmark")
+    parser.add_argument(
+        "-c", "--tts_config", type=str, default="GPT_SoVITS/configs/tts_infer.yaml", help="tts_infer路径"
+    )
+    parser.add_argument("--ref-audio", required=True, help="参考音频路径")
+    parser.add_argument("--prompt-text", default="", help="参考音频的文本")
+    parser.add_argument("--prompt-lang", default="zh")
+    parser.add_argument("--text-lang", default="zh")
+    parser.add_argument("--text-file", default=None, help="每行一条待合成文本，为空则使用内置文本")
+    parser.add_argument("--backends", nargs="+", choices=["torch", "openvino"], default=["torch", "openvino"])
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    texts = default_texts
+    if args.text_file:
+        with open(args.text_file, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    req = {
+        "text_lang": args.text_lang,
+        "ref_audio_path": args.ref_audio,
+        "prompt_text": args.prompt_text,
+        "prompt_lang": args.prompt_lang,
+        "text_split_method": "cut5",
+        "batch_size": 1,
+        # 固定随机种子，两种后端的采样结果可比
+        "seed": 42,
+    }
+
+    for backend in args.backends:
+        tts_config = TTS_Config(args.tts_config)
+        tts_config.backend = backend
+        tts = TTS(tts_config)
+        # 预热：参考音频特征提取、模型编译缓存
+        synthesize(tts, req, texts[:1])
+        best = None
+        for _ in range(args.repeat):
+            elapsed, audio_seconds = synthesize(tts, req, texts)
+            best = elapsed if best is None else min(best, elapsed)
+        print(
+            f"{backend:<9} {len(texts)} texts  total {best:7.2f} s  audio {audio_seconds:7.2f} s  RTF {best / audio_seconds:.4f}"
+        )
+        del tts
+
+
+if __name__ == "__main__":
+    main()
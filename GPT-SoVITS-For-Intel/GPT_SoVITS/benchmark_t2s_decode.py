@@ -0,0 +1,94 @@
+# T2S 自回归解码 KV cache 基准测试
+# 对比每步 torch.cat 拼接缓存（decode_next_token）与预分配原地写入（T2SKVCache）的 tokens/s，
+# 并校验两条路径的输出一致。默认使用随机初始化的权重，也可以指定 GPT 权重文件。
+#
+# 用法（在 GPT_SoVITS 目录下）:
+#   python benchmark_t2s_decode.py --tokens 500
+#   python benchmark_t2s_decode.py --gpt-path ../GPT_weights_v2/xxx.ckpt --threads 8
+import argparse
+import time
+
+import torch
+
+from AR.models.t2s_lightning_module import Text2SemanticLightningModule
+from AR.models.t2s_model import T2SKVCache, Text2SemanticDecoder
+
+default_model_config = {
+    "hidden_dim": 512,
+    "embedding_dim": 512,
+    "head": 16,
+    "n_layer": 24,
+    "vocab_size": 1025,
+    "phoneme_vocab_size": 732,
+    "dropout": 0,
+    "EOS": 1024,
+}
+
+
+def load_decoder(gpt_path=None):
+    if gpt_path:
+        dict_s1 = torch.load(gpt_path, map_location="cpu")
+        t2s_model = Text2SemanticLightningModule(dict_s1["config"], "****", is_train=False)
+        t2s_model.load_state_dict(dict_s1["weight"])
+        model = t2s_model.model
+    else:
+        torch.manual_seed(0)
+        model = Text2SemanticDecoder({"model": default_model_config}, top_k=3)
+    return model.eval()
+
+
+def run_decode(model, prompt, n_tokens, static):
+    transformer = model.t2s_transformer
+    src_len = prompt.shape[1]
+    attn_mask = torch.zeros(1, model.num_head, src_len, src_len, dtype=torch.bool)
+    step = prompt[:, -1:]
+    outputs = []
+    t0 = time.perf_counter()
+    xy_dec, k_cache, v_cache = transformer.process_prompt(prompt, attn_mask, None)
+    t1 = time.perf_counter()
+    kv_cache = T2SKVCache(k_cache, v_cache, src_len + n_tokens) if static else None
+    for _ in range(n_tokens):
+        if kv_cache is not None:
+            xy_dec = kv_cache.decode_next_token(transformer, step)
+        else:
+            xy_dec, k_cache, v_cache = transformer.decode_next_token(step, k_cache, v_cache)
+        outputs.append(xy_dec[:, -1])
+        # 用上一步的输出作为下一步输入，保持数值上的依赖关系
+        step = xy_dec
+    t2 = time.perf_counter()
+    return torch.cat(outputs, dim=0), t1 - t0, t2 - t1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="T2S KV cache decode benchmark")
+    parser.add_argument("--gpt-path", default=None, help="GPT 权重（.ckpt），为空则使用随机权重")
+    parser.add_argument("--prompt-len", type=int, default=300, help="文本 + 参考音频 token 数")
+    parser.add_argument("--tokens", type=int, default=500, help="解码 token 数")
+    parser.add_argument("--threads", type=int, default=0, help="torch 线程数，0 表示默认")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    model = load_decoder(args.gpt_path)
+    prompt = torch.randn(1, args.prompt_len, model.model_dim)
+
+    with torch.no_grad():
+        run_decode(model, prompt, 8, static=False)
+        run_decode(model, prompt, 8, static=True)
+        results = {}
+        for name, static in (("torch.cat", False), ("static", True)):
+            best = None
+            for _ in range(args.repeat):
+                out, prefill, decode = run_decode(model, prompt, args.tokens, static)
+                best = decode if best is None else min(best, decode)
+            results[name] = out
+            print(
+                f"{name:<10} prefill {prefill * 1000:8.1f} ms  decode {best:7.2f} s  {args.tokens / best:8.1f} tokens/s"
+            )
+        diff = (results["torch.cat"] - results["static"]).abs().max().item()
+        print(f"max abs diff between paths: {diff:.3e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+from typing import Dict, Optional, Set, Tuple
+
+import numpy as np
+import torch
+
+INDEX_NAME = "index.tsv"
+
+
+class FeatureStore:
+    """
+    Per-utterance features (BERT / HuBERT) of a training set, stored in a few
+    memory-mappable .npy shards instead of one torch.save file per utterance.
+
+    <root>/shard-00000.npy   array [frames, dim] of all utterances in the shard, concatenated along time
+    <root>/index.tsv         name \\t shard \\t offset \\t frames \\t shape (comma separated, without the time axis)
+
+    A shard is written (atomically) before its index lines are appended, so the
+    index only ever refers to complete shards; when a name appears more than once,
+    its last line wins. Features are returned with the shape they were put with,
+    time being the last axis, and stored as dtype (pass np.float16 only for
+    features that were computed in half precision).
+    """
+
+    def __init__(self, root: str, writable: bool = False, shard_frames: int = 1 << 20, dtype=np.float32):
+        self.root = root
+        self.writable = writable
+        self.shard_frames = shard_frames
+        self.dtype = dtype
+        self.index: Dict[str, Tuple[int, int, int, Tuple[int, ...]]] = {}
+        self._mmaps: Dict[int, np.ndarray] = {}
+        self._pending = []
+        self._pending_frames = 0
+        self._next_shard = 0
+
+        if writable:
+            os.makedirs(root, exist_ok=True)
+        index_path = os.path.join(root, INDEX_NAME)
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf8") as f:
+                for line in f.read().strip("\n").split("\n"):
+                    tmp = line.split("\t")
+                    if len(tmp) != 5:
+                        continue
+                    shape = tuple(int(i) for i in tmp[4].split(",") if i != "")
+                    self.index[tmp[0]] = (int(tmp[1]), int(tmp[2]), int(tmp[3]), shape)
+        if writable:
+            shards = [
+                int(name[6:-4]) for name in os.listdir(root) if name.startswith("shard-") and name.endswith(".npy")
+            ]
+            self._next_shard = max(shards) + 1 if shards else 0
+
+    @staticmethod
+    def exists(root: str) -> bool:
+        return os.path.exists(os.path.join(root, INDEX_NAME))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def names(self) -> Set[str]:
+        return set(self.index.keys())
+
+    def _shard_path(self, shard: int) -> str:
+        return os.path.join(self.root, "shard-%05d.npy" % shard)
+
+    def get(self, name: str) -> torch.Tensor:
+        shard, offset, frames, shape = self.index[name]
+        array = self._mmaps.get(shard)
+        if array is None:
+            array = np.load(self._shard_path(shard), mmap_mode="r")
+            self._mmaps[shard] = array
+        feature = np.array(array[offset : offset + frames]).T
+        return torch.from_numpy(feature.reshape(shape + (frames,)))
+
+    def put(self, name: str, feature):
+        assert self.writable
+        if isinstance(feature, torch.Tensor):
+            feature = feature.detach().cpu().float().numpy()
+        shape = tuple(feature.shape[:-1])
+        frames = feature.shape[-1]
+        self._pending.append((name, shape, feature.reshape(-1, frames).T.astype(self.dtype)))
+        self._pending_frames += frames
+        if self._pending_frames >= self.shard_frames:
+            self.flush()
+
+    def flush(self):
+        """write the pending features as a new shard and append them to the index"""
+        if not self._pending:
+            return
+        shard = self._next_shard
+        self._next_shard += 1
+        lines = []
+        offset = 0
+        for name, shape, array in self._pending:
+            lines.append("%s\t%s\t%s\t%s\t%s" % (name, shard, offset, array.shape[0], ",".join(str(i) for i in shape)))
+            self.index[name] = (shard, offset, array.shape[0], shape)
+            offset += array.shape[0]
+        tmp_path = self._shard_path(shard) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.concatenate([array for _, _, array in self._pending], axis=0))
+        os.replace(tmp_path, self._shard_path(shard))
+        with open(os.path.join(self.root, INDEX_NAME), "a", encoding="utf8") as f:
+            f.write("\n".join(lines) + "\n")
+        self._pending = []
+        self._pending_frames = 0
+
+    def __getstate__(self):
+        # DataLoader workers re-open the shards themselves
+        state = self.__dict__.copy()
+        state["_mmaps"] = {}
+        return state
+
+
+def open_feature_store(feature_dir: str) -> Optional[FeatureStore]:
+    """the FeatureStore written next to feature_dir (e.g. 4-cnhubert.store), if there is one"""
+    root = feature_dir + ".store"
+    return FeatureStore(root) if FeatureStore.exists(root) else None
+
+
+def feature_names(feature_dir: str, store: Optional[FeatureStore]) -> Set[str]:
+    names = set()
+    if os.path.exists(feature_dir):
+        names = set([name[:-3] for name in os.listdir(feature_dir) if name.endswith(".pt")])
+    if store is not None:
+        names |= store.names()
+    return names
+
+
+def has_feature(feature_dir: str, store: Optional[FeatureStore], name: str) -> bool:
+    return (store is not None and name in store) or os.path.exists("%s/%s.pt" % (feature_dir, name))
+
+
+def load_feature(feature_dir: str, store: Optional[FeatureStore], name: str) -> torch.Tensor:
+    if store is not None and name in store:
+        return store.get(name)
+    return torch.load("%s/%s.pt" % (feature_dir, name), map_location="cpu")
@@ -5,6 +5,7 @@ import torch
 import torch.utils.data
 from tqdm import tqdm
 
+from feature_store import feature_names, load_feature, open_feature_store
 from module.mel_processing import spectrogram_torch, spec_to_mel_torch
 from text import cleaned_text_to_sequence
 import torch.nn.functional as F
@@ -27,9 +28,10 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
         self.path4 = "%s/4-cnhubert" % exp_dir
         self.path5 = "%s/5-wav32k" % exp_dir
         assert os.path.exists(self.path2)
-        assert os.path.exists(self.path4)
+        self.ssl_store = open_feature_store(self.path4)
+        assert os.path.exists(self.path4) or self.ssl_store is not None
         assert os.path.exists(self.path5)
-        names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+        names4 = feature_names(self.path4, self.ssl_store)
         names5 = set(os.listdir(self.path5))
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
@@ -104,7 +106,7 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
         try:
             spec, wav = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                ssl = load_feature(self.path4, self.ssl_store, audiopath)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
@@ -246,9 +248,10 @@ class TextAudioSpeakerLoaderV3(torch.utils.data.Dataset):
         self.path4 = "%s/4-cnhubert" % exp_dir
         self.path5 = "%s/5-wav32k" % exp_dir
         assert os.path.exists(self.path2)
-        assert os.path.exists(self.path4)
+        self.ssl_store = open_feature_store(self.path4)
+        assert os.path.exists(self.path4) or self.ssl_store is not None
         assert os.path.exists(self.path5)
-        names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+        names4 = feature_names(self.path4, self.ssl_store)
         names5 = set(os.listdir(self.path5))
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
@@ -335,7 +338,7 @@ class TextAudioSpeakerLoaderV3(torch.utils.data.Dataset):
         try:
             spec, mel = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                ssl = load_feature(self.path4, self.ssl_store, audiopath)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
@@ -483,9 +486,10 @@ class TextAudioSpeakerLoaderV4(torch.utils.data.Dataset):
         self.path4 = "%s/4-cnhubert" % exp_dir
         self.path5 = "%s/5-wav32k" % exp_dir
         assert os.path.exists(self.path2)
-        assert os.path.exists(self.path4)
+        self.ssl_store = open_feature_store(self.path4)
+        assert os.path.exists(self.path4) or self.ssl_store is not None
         assert os.path.exists(self.path5)
-        names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+        names4 = feature_names(self.path4, self.ssl_store)
         names5 = set(os.listdir(self.path5))
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
@@ -572,7 +576,7 @@ class TextAudioSpeakerLoaderV4(torch.utils.data.Dataset):
         try:
             spec, mel = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                ssl = load_feature(self.path4, self.ssl_store, audiopath)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
@@ -694,9 +698,10 @@ class TextAudioSpeakerLoaderV3b(torch.utils.data.Dataset):
         self.path4 = "%s/4-cnhubert" % exp_dir
         self.path5 = "%s/5-wav32k" % exp_dir
         assert os.path.exists(self.path2)
-        assert os.path.exists(self.path4)
+        self.ssl_store = open_feature_store(self.path4)
+        assert os.path.exists(self.path4) or self.ssl_store is not None
         assert os.path.exists(self.path5)
-        names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+        names4 = feature_names(self.path4, self.ssl_store)
         names5 = set(os.listdir(self.path5))
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
@@ -783,7 +788,7 @@ class TextAudioSpeakerLoaderV3b(torch.utils.data.Dataset):
         try:
             spec, mel, wav = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                ssl = load_feature(self.path4, self.ssl_store, audiopath)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
@@ -0,0 +1,273 @@
+# 导出 OpenVINO 推理模型（TTS_Config 中 backend: openvino 时使用）
+# 先用 torch.onnx.export 导出 ONNX（T2S 使用 AR/models/t2s_model_onnx.py，VITS 使用 module/models_onnx.py），
+# 再转换为 OpenVINO IR，并在 manifest.json 中记录每个模型对应的权重路径；
+# 推理时只有与当前加载的权重一致的模型才会被使用，其余模型继续使用 torch。
+#
+# 用法（在项目根目录下）:
+#   python GPT_SoVITS/ov_export.py -c GPT_SoVITS/configs/tts_infer.yaml
+#   python GPT_SoVITS/ov_export.py -c GPT_SoVITS/configs/tts_infer.yaml --components t2s vits --fp32
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import openvino as ov
+import torch
+from torch import nn
+from transformers import AutoModelForMaskedLM, AutoTokenizer
+
+from AR.models.t2s_lightning_module_onnx import Text2SemanticLightningModule
+from feature_extractor.cnhubert import CNHubert
+from module.models_onnx import SynthesizerTrn
+from process_ckpt import load_sovits_new
+from TTS_infer_pack.ov_backend import MANIFEST_NAME
+from TTS_infer_pack.TTS import TTS, DictToAttrRecursive, TTS_Config
+
+COMPONENTS = ["t2s", "vits", "bert", "cnhubert", "vocoder"]
+
+
+class BertHiddenState(nn.Module):
+    """the hidden state TextPreprocessor.get_bert_feature reads (hidden_states[-3])"""
+
+    def __init__(self, bert):
+        super().__init__()
+        self.bert = bert
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        res = self.bert(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            token_type_ids=token_type_ids,
+            output_hidden_states=True,
+        )
+        return res["hidden_states"][-3]
+
+
+class HubertHiddenState(nn.Module):
+    def __init__(self, hubert):
+        super().__init__()
+        self.hubert = hubert
+
+    def forward(self, input_values):
+        return self.hubert(input_values)["last_hidden_state"]
+
+
+class VitsDecoder(nn.Module):
+    """SynthesizerTrn.decode with one reference spectrogram and speed 1.0"""
+
+    def __init__(self, vq_model):
+        super().__init__()
+        self.vq_model = vq_model
+
+    def forward(self, codes, text, refer):
+        return self.vq_model(codes, text, refer)
+
+
+class Exporter:
+    def __init__(self, output_dir: str, compress_to_fp16: bool = True):
+        self.output_dir = output_dir
+        self.compress_to_fp16 = compress_to_fp16
+        os.makedirs(output_dir, exist_ok=True)
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        self.tmp_dir = tempfile.mkdtemp(prefix="ov_export_")
+
+    def export(self, name, module, args, input_names, output_names, dynamic_axes, source=None, opset_version=16):
+        onnx_path = os.path.join(self.tmp_dir, f"{name}.onnx")
+        xml_name = f"{name}.xml"
+        print(f"############ 导出 {name} ############")
+        with torch.no_grad():
+            torch.onnx.export(
+                module,
+                args,
+                onnx_path,
+                input_names=input_names,
+                output_names=output_names,
+                dynamic_axes=dynamic_axes,
+                opset_version=opset_version,
+                verbose=False,
+            )
+        ov.save_model(
+            ov.convert_model(onnx_path),
+            os.path.join(self.output_dir, xml_name),
+            compress_to_fp16=self.compress_to_fp16,
+        )
+        self.manifest[name] = {"xml": xml_name, "source": source}
+        with open(self.manifest_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=4, ensure_ascii=False)
+
+    def close(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def export_t2s(exporter: Exporter, t2s_weights_path: str):
+    dict_s1 = torch.load(t2s_weights_path, map_location="cpu")
+    config = dict_s1["config"]
+    t2s_model = Text2SemanticLightningModule(config, "****", is_train=False)
+    t2s_model.load_state_dict(dict_s1["weight"])
+    model = t2s_model.eval().model
+    model.top_k = torch.LongTensor([config["inference"]["top_k"]])
+    model.early_stop_num = torch.LongTensor([50 * config["data"]["max_sec"]])
+    model.init_onnx()
+
+    phones = torch.randint(0, config["model"]["phoneme_vocab_size"], (1, 32))
+    bert_feature = torch.randn(1, 1024, 32)
+    prompts = torch.randint(0, config["model"]["vocab_size"] - 1, (1, 100))
+    exporter.export(
+        "t2s_encoder",
+        model.onnx_encoder,
+        (phones, bert_feature),
+        ["x", "bert_feature"],
+        ["x_enc"],
+        {"x": {1: "x_length"}, "bert_feature": {2: "x_length"}},
+        source=t2s_weights_path,
+    )
+    with torch.no_grad():
+        x = model.onnx_encoder(phones, bert_feature)
+    exporter.export(
+        "t2s_fsdec",
+        model.first_stage_decoder,
+        (x, prompts),
+        ["x", "prompts"],
+        ["y", "k", "v", "y_emb", "x_example"],
+        {"x": {1: "x_length"}, "prompts": {1: "prompts_length"}},
+        source=t2s_weights_path,
+    )
+    with torch.no_grad():
+        y, k, v, y_emb, x_example = model.first_stage_decoder(x, prompts)
+    exporter.export(
+        "t2s_sdec",
+        model.stage_decoder,
+        (y, k, v, y_emb, x_example),
+        ["iy", "ik", "iv", "iy_emb", "ix_example"],
+        ["y", "k", "v", "y_emb", "logits", "samples"],
+        {
+            "iy": {1: "iy_length"},
+            "ik": {1: "ik_length"},
+            "iv": {1: "iv_length"},
+            "iy_emb": {1: "iy_emb_length"},
+            "ix_example": {1: "ix_example_length"},
+        },
+        source=t2s_weights_path,
+    )
+
+
+def export_vits(exporter: Exporter, vits_weights_path: str):
+    dict_s2 = load_sovits_new(vits_weights_path)
+    if "enc_p.text_embedding.weight" not in dict_s2["weight"]:
+        print("SoVITS V3/V4 模型不导出 VITS，使用 torch 推理（vocoder 可单独导出）")
+        return
+    hps = dict_s2["config"]
+    hps["model"]["version"] = "v1" if dict_s2["weight"]["enc_p.text_embedding.weight"].shape[0] == 322 else "v2"
+    hps["model"]["semantic_frame_rate"] = "25hz"
+    hps = DictToAttrRecursive(hps)
+    vq_model = SynthesizerTrn(
+        hps.data.filter_length // 2 + 1,
+        hps.train.segment_size // hps.data.hop_length,
+        n_speakers=hps.data.n_speakers,
+        **hps.model,
+    )
+    vq_model.load_state_dict(dict_s2["weight"], strict=False)
+    vq_model.eval()
+
+    codes = torch.randint(0, 1024, (1, 1, 100))
+    text = torch.randint(0, 300, (1, 40))
+    refer = torch.randn(1, hps.data.filter_length // 2 + 1, 200)
+    exporter.export(
+        "vits",
+        VitsDecoder(vq_model),
+        (codes, text, refer),
+        ["codes", "text", "refer"],
+        ["audio"],
+        {"codes": {2: "codes_length"}, "text": {1: "text_length"}, "refer": {2: "refer_length"}},
+        source=vits_weights_path,
+        opset_version=17,
+    )
+
+
+def export_bert(exporter: Exporter, bert_base_path: str):
+    tokenizer = AutoTokenizer.from_pretrained(bert_base_path)
+    bert = AutoModelForMaskedLM.from_pretrained(bert_base_path).eval()
+    inputs = tokenizer("先帝创业未半而中道崩殂。", return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    exporter.export(
+        "bert",
+        BertHiddenState(bert),
+        tuple(inputs[name] for name in names),
+        names,
+        ["hidden_state"],
+        {name: {0: "batch", 1: "length"} for name in names},
+        source=bert_base_path,
+        opset_version=17,
+    )
+
+
+def export_cnhubert(exporter: Exporter, cnhubert_base_path: str):
+    hubert = CNHubert(cnhubert_base_path).eval()
+    exporter.export(
+        "cnhubert",
+        HubertHiddenState(hubert.model),
+        (torch.randn(1, 16000 * 5),),
+        ["input_values"],
+        ["last_hidden_state"],
+        {"input_values": {1: "length"}},
+        source=cnhubert_base_path,
+        opset_version=17,
+    )
+
+
+def export_vocoder(exporter: Exporter, version: str):
+    if version not in ["v3", "v4"]:
+        print(f"{version} 模型不使用 vocoder，跳过")
+        return
+    vocoder = TTS.build_vocoder(version).eval()
+    exporter.export(
+        f"vocoder_{version}",
+        vocoder,
+        (torch.randn(1, 100, 200),),
+        ["mel"],
+        ["wav"],
+        {"mel": {0: "batch", 2: "frames"}},
+        opset_version=17,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出 GPT-SoVITS 的 OpenVINO 模型")
+    parser.add_argument(
+        "-c", "--tts_config", type=str, default="GPT_SoVITS/configs/tts_infer.yaml", help="tts_infer路径"
+    )
+    parser.add_argument("-o", "--output-dir", default=None, help="输出目录，默认使用配置中的 ov_model_dir")
+    parser.add_argument("--components", nargs="+", choices=COMPONENTS, default=COMPONENTS)
+    parser.add_argument("--fp32", action="store_true", help="不把权重压缩为 fp16")
+    args = parser.parse_args()
+
+    tts_config = TTS_Config(args.tts_config)
+    exporter = Exporter(args.output_dir or tts_config.ov_model_dir, compress_to_fp16=not args.fp32)
+    try:
+        if "t2s" in args.components:
+            export_t2s(exporter, tts_config.t2s_weights_path)
+        if "vits" in args.components:
+            export_vits(exporter, tts_config.vits_weights_path)
+        if "bert" in args.components:
+            export_bert(exporter, tts_config.bert_base_path)
+        if "cnhubert" in args.components:
+            export_cnhubert(exporter, tts_config.cnhuhbert_base_path)
+        if "vocoder" in args.components:
+            export_vocoder(exporter, tts_config.version)
+    finally:
+        exporter.close()
+    print(f"已导出到 {exporter.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+# 训练集预处理一体化脚本：一次完成 1-get-text / 2-get-hubert-wav32k / 3-get-semantic 的工作
+#   - 文本清洗（G2P）、音频读取/归一化/重采样在有上限的进程池中并行，与模型推理流水线重叠
+#   - BERT 按文本长度分桶后批量推理；HuBERT 只对长度完全相同的音频组批（补零会改变特征），特征直接用于提取语义 token
+#   - 每处理完一批即写入进度（prep_progress.tsv），中断后重新运行会跳过已完成的条目
+#   - BERT / HuBERT 特征写入可内存映射的分片文件（3-bert.store / 4-cnhubert.store，见 feature_store.py），
+#     不再为每条音频单独保存 .pt；训练时数据集会优先读取分片文件
+# 输出的 2-name2text.txt、6-name2semantic.tsv、5-wav32k/ 与原脚本合并后的结果格式相同。
+#
+# 用法（在项目根目录下，参数默认取与原脚本相同的环境变量）:
+#   python GPT_SoVITS/prepare_datasets/prepare_all.py --inp_text list.txt --inp_wav_dir wavs --opt_dir logs/xxx \
+#       --bert_pretrained_dir GPT_SoVITS/pretrained_models/chinese-roberta-wwm-ext-large \
+#       --cnhubert_base_dir GPT_SoVITS/pretrained_models/chinese-hubert-base \
+#       --pretrained_s2G GPT_SoVITS/pretrained_models/s2G488k.pth --s2config_path GPT_SoVITS/configs/s2.json
+import argparse
+import os
+import sys
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import numpy as np
+
+PROGRESS_NAME = "prep_progress.tsv"
+SEMANTIC_HEADER = "item_name\tsemantic_audio"
+language_v1_to_language_v2 = {
+    "ZH": "zh",
+    "zh": "zh",
+    "JP": "ja",
+    "jp": "ja",
+    "JA": "ja",
+    "ja": "ja",
+    "EN": "en",
+    "en": "en",
+    "En": "en",
+    "KO": "ko",
+    "Ko": "ko",
+    "ko": "ko",
+    "yue": "yue",
+    "YUE": "yue",
+    "Yue": "yue",
+}
+maxx = 0.95
+alpha = 0.5
+
+
+def read_items(inp_text: str, inp_wav_dir: str) -> list:
+    from tools.my_utils import clean_path
+
+    with open(inp_text, "r", encoding="utf8") as f:
+        lines = f.read().strip("\n").split("\n")
+    items = []
+    names = set()
+    for line in lines:
+        try:
+            wav_name, spk_name, language, text = line.split("|")
+            wav_name = clean_path(wav_name)
+            if inp_wav_dir != "" and inp_wav_dir != None:
+                wav_name = os.path.basename(wav_name)
+                wav_path = "%s/%s" % (inp_wav_dir, wav_name)
+            else:
+                wav_path = wav_name
+                wav_name = os.path.basename(wav_name)
+            if language not in language_v1_to_language_v2.keys():
+                print(f"\033[33m[Waring] The {language = } of {wav_name} is not supported for training.\033[0m")
+                continue
+            if wav_name in names:
+                continue
+            names.add(wav_name)
+            items.append((wav_name, wav_path, text, language_v1_to_language_v2[language]))
+        except:
+            print(line, traceback.format_exc())
+    return items
+
+
+def prepare_item(wav_name: str, wav_path: str, text: str, lang: str, version: str) -> dict:
+    """CPU part of an utterance (runs in the process pool): text cleaning, audio loading and normalization"""
+    from text.cleaner import clean_text
+    from tools.my_utils import load_audio
+
+    res = {"name": wav_name, "lang": lang}
+    try:
+        phones, word2ph, norm_text = clean_text(text.replace("%", "-").replace("￥", ","), lang, version)
+        res.update({"phones": phones, "word2ph": word2ph, "norm_text": norm_text})
+
+        tmp_audio = load_audio(wav_path, 32000)
+        tmp_max = np.abs(tmp_audio).max()
+        if tmp_max > 2.2:
+            res["status"] = "filtered:%s" % tmp_max
+            return res
+        tmp_audio32 = (tmp_audio / tmp_max * (maxx * alpha * 32768)) + ((1 - alpha) * 32768) * tmp_audio
+        tmp_audio32b = (tmp_audio / tmp_max * (maxx * alpha * 1145.14)) + ((1 - alpha) * 1145.14) * tmp_audio
+        res["wav32"] = tmp_audio32.astype("int16")
+        res["wav16"] = resample_16k(tmp_audio32b)
+        res["status"] = "ok"
+    except:
+        print(wav_name, text, traceback.format_exc())
+        res["status"] = "error"
+    return res
+
+
+def resample_16k(audio32k: np.ndarray) -> np.ndarray:
+    import librosa
+
+    return librosa.resample(audio32k, orig_sr=32000, target_sr=16000).astype(np.float32)  # 不是重采样问题
+
+
+def get_s2_version(pretrained_s2G: str) -> str:
+    size = os.path.getsize(pretrained_s2G)
+    if size < 82978 * 1024:
+        return "v1"
+    elif size < 100 * 1024 * 1024:
+        return "v2"
+    elif size < 103520 * 1024:
+        return "v1"
+    elif size < 700 * 1024 * 1024:
+        return "v2"
+    return "v3"
+
+
+def read_progress(opt_dir: str) -> dict:
+    progress = {}
+    path = "%s/%s" % (opt_dir, PROGRESS_NAME)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf8") as f:
+            for line in f.read().strip("\n").split("\n"):
+                tmp = line.split("\t")
+                if len(tmp) == 2:
+                    progress[tmp[0]] = tmp[1]
+    return progress
+
+
+def keep_done_lines(path: str, done: set, header: str = None):
+    """drop lines of items that were not committed to the progress file (an interrupted batch), and duplicates"""
+    if not os.path.exists(path):
+        if header is not None:
+            with open(path, "w", encoding="utf8") as f:
+                f.write(header + "\n")
+        return
+    with open(path, "r", encoding="utf8") as f:
+        lines = f.read().strip("\n").split("\n")
+    kept = {}
+    for line in lines:
+        name = line.split("\t")[0]
+        if name in done:
+            kept[name] = line
+    opt = ([header] if header is not None else []) + list(kept.values())
+    with open(path, "w", encoding="utf8") as f:
+        f.write("\n".join(opt) + "\n")
+
+
+class Preparer:
+    """Model part of the pipeline: batched BERT, HuBERT and semantic token extraction, and the outputs."""
+
+    def __init__(self, args):
+        import torch
+        from feature_extractor import cnhubert
+        from transformers import AutoModelForMaskedLM, AutoTokenizer
+
+        import utils
+        from feature_store import FeatureStore
+
+        self.torch = torch
+        self.args = args
+        if torch.cuda.is_available():
+            self.device = "cuda:0"
+        elif hasattr(torch, "xpu") and torch.xpu.is_available():
+            self.device = "xpu"
+        else:
+            self.device = "cpu"
+        self.is_half = args.is_half and self.device != "cpu"
+        dtype = torch.float16 if self.is_half else torch.float32
+
+        opt_dir = args.opt_dir
+        self.wav32dir = "%s/5-wav32k" % opt_dir
+        os.makedirs(self.wav32dir, exist_ok=True)
+        # 与原脚本一致：半精度推理时保存 fp16 特征，否则保存 fp32
+        store_dtype = np.float16 if self.is_half else np.float32
+        self.bert_store = FeatureStore("%s/3-bert.store" % opt_dir, writable=True, dtype=store_dtype)
+        self.hubert_store = FeatureStore("%s/4-cnhubert.store" % opt_dir, writable=True, dtype=store_dtype)
+        self.text_path = "%s/2-name2text.txt" % opt_dir
+        self.semantic_path = "%s/6-name2semantic.tsv" % opt_dir
+        self.progress_path = "%s/%s" % (opt_dir, PROGRESS_NAME)
+
+        if not os.path.exists(args.bert_pretrained_dir):
+            raise FileNotFoundError(args.bert_pretrained_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(args.bert_pretrained_dir)
+        self.bert_model = AutoModelForMaskedLM.from_pretrained(args.bert_pretrained_dir).to(self.device, dtype)
+
+        cnhubert.cnhubert_base_path = args.cnhubert_base_dir
+        self.hubert = cnhubert.get_model().to(self.device, dtype)
+
+        if not os.path.exists(args.pretrained_s2G):
+            raise FileNotFoundError(args.pretrained_s2G)
+        s2_version = get_s2_version(args.pretrained_s2G)
+        if s2_version != "v3":
+            from module.models import SynthesizerTrn
+        else:
+            from module.models import SynthesizerTrnV3 as SynthesizerTrn
+        hps = utils.get_hparams_from_file(args.s2config_path)
+        self.vq_model = SynthesizerTrn(
+            hps.data.filter_length // 2 + 1,
+            hps.train.segment_size // hps.data.hop_length,
+            n_speakers=hps.data.n_speakers,
+            version=s2_version,
+            **hps.model,
+        )
+        print(
+            self.vq_model.load_state_dict(
+                torch.load(args.pretrained_s2G, map_location="cpu", weights_only=False)["weight"], strict=False
+            )
+        )
+        self.vq_model = self.vq_model.to(self.device, dtype).eval()
+        self.nan_fails = []
+        self.parity_checks = args.hubert_parity_checks
+
+    def get_bert_features(self, items: list) -> list:
+        """phone-level BERT features of (norm_text, word2ph), in batches of texts of similar length"""
+        torch = self.torch
+        features = [None] * len(items)
+        order = sorted(range(len(items)), key=lambda i: len(items[i][0]))
+        for start in range(0, len(order), self.args.bert_batch_size):
+            batch = order[start : start + self.args.bert_batch_size]
+            with torch.no_grad():
+                inputs = self.tokenizer([items[i][0] for i in batch], return_tensors="pt", padding=True)
+                for k in inputs:
+                    inputs[k] = inputs[k].to(self.device)
+                res = self.bert_model(**inputs, output_hidden_states=True)
+                hidden = torch.cat(res["hidden_states"][-3:-2], -1).cpu()
+            lengths = inputs["attention_mask"].sum(-1).tolist()
+            for row, i in enumerate(batch):
+                text, word2ph = items[i]
+                assert len(word2ph) == len(text)
+                res = hidden[row, 1 : int(lengths[row]) - 1]
+                features[i] = torch.repeat_interleave(res, torch.tensor(word2ph), dim=0).T
+        return features
+
+    def hubert_buckets(self, items: list) -> list:
+        """batches of utterances of exactly the same length, each with at most hubert_batch_seconds of audio"""
+        # chinese-hubert-base 卷积特征提取层的 GroupNorm 在整个时间轴上归一化，补零会改变特征，
+        # 因此只把长度完全相同的音频放进同一批，其余逐条推理
+        max_samples = int(self.args.hubert_batch_seconds * 16000)
+        by_length = {}
+        for item in items:
+            by_length.setdefault(len(item["wav16"]), []).append(item)
+        batches = []
+        for length, group in sorted(by_length.items()):
+            size = max(1, max_samples // max(1, length))
+            batches.extend(group[i : i + size] for i in range(0, len(group), size))
+        return batches
+
+    def run_hubert_and_semantic(self, batch: list, is_half: bool):
+        """HuBERT features and semantic tokens of an equal-length bucket; sets item["ssl"] and item["semantic"]"""
+        torch = self.torch
+        dtype = torch.float16 if is_half else torch.float32
+        assert len({len(item["wav16"]) for item in batch}) == 1
+        wav16 = torch.stack([torch.from_numpy(item["wav16"]) for item in batch]).to(self.device, dtype)
+        with torch.no_grad():
+            ssl = self.hubert.model(wav16)["last_hidden_state"].transpose(1, 2)  # [B, 768, T]
+            codes = self.vq_model.extract_latent(ssl)  # [B, 1, T']
+        ssl = ssl.cpu()
+        codes = codes.cpu()
+        for i, item in enumerate(batch):
+            item_ssl = ssl[i : i + 1]
+            if torch.isnan(item_ssl.float()).any():
+                item["status"] = "nan"
+                continue
+            item["ssl"] = item_ssl
+            item["semantic"] = codes[i, 0].tolist()
+
+    def check_hubert_parity(self, batch: list, is_half: bool):
+        """
+        rerun the items of a batched bucket one at a time and compare with the batched results;
+        on a mismatch the per-item results are kept and HuBERT batching is turned off
+        """
+        atol = 1e-2 if is_half else 1e-4
+        singles = [{"wav16": item["wav16"], "status": "ok"} for item in batch]
+        for single in singles:
+            self.run_hubert_and_semantic([single], is_half)
+        max_diff = 0.0
+        same_tokens = True
+        for item, single in zip(batch, singles):
+            if "ssl" in item and "ssl" in single:
+                max_diff = max(max_diff, (item["ssl"].float() - single["ssl"].float()).abs().max().item())
+                same_tokens = same_tokens and item["semantic"] == single["semantic"]
+        self.parity_checks -= 1
+        if max_diff <= atol and same_tokens:
+            print("HuBERT parity check: batch of %s ok (max diff %.2e)" % (len(batch), max_diff))
+            return
+        print(
+            "\033[33m[Warning] HuBERT parity check failed: max diff %.2e, same semantic tokens: %s; "
+            "falling back to per-item HuBERT\033[0m" % (max_diff, same_tokens)
+        )
+        self.args.hubert_batch_seconds = 0
+        for item, single in zip(batch, singles):
+            item.pop("ssl", None)
+            item.pop("semantic", None)
+            item.update(single)
+
+    def process(self, results: list):
+        """run the models on a batch of prepared items and commit their outputs and progress"""
+        from scipy.io import wavfile
+
+        ok = [item for item in results if item["status"] == "ok"]
+
+        bert_items = [item for item in ok if item["lang"] == "zh"]
+        for item, feature in zip(
+            bert_items, self.get_bert_features([(item["norm_text"], item["word2ph"]) for item in bert_items])
+        ):
+            assert feature.shape[-1] == len(item["phones"])
+            item["bert"] = feature
+
+        for batch in self.hubert_buckets(ok):
+            self.run_hubert_and_semantic(batch, self.is_half)
+            if len(batch) > 1 and self.parity_checks > 0:
+                self.check_hubert_parity(batch, self.is_half)
+        for item in ok:
+            if item["status"] == "nan":
+                if self.is_half:
+                    self.nan_fails.append(item)
+                else:
+                    print("nan filtered:%s" % item["name"])
+        self.commit([item for item in results if item["status"] != "nan" or not self.is_half], wavfile)
+
+    def retry_nan_fails(self):
+        """utterances whose HuBERT features were NaN in half precision, again in float32"""
+        if not self.nan_fails:
+            return
+        from scipy.io import wavfile
+
+        self.hubert = self.hubert.float()
+        self.vq_model = self.vq_model.float()
+        items = self.nan_fails
+        self.nan_fails = []
+        for item in items:
+            item["status"] = "ok"
+            self.run_hubert_and_semantic([item], False)
+            if item["status"] == "nan":
+                print("nan filtered:%s" % item["name"])
+        self.commit(items, wavfile)
+
+    def commit(self, items: list, wavfile):
+        text_lines = []
+        semantic_lines = []
+        for item in items:
+            if item["status"] != "ok":
+                continue
+            name = item["name"]
+            if "bert" in item:
+                self.bert_store.put(name, item["bert"])
+            self.hubert_store.put(name, item["ssl"])
+            wavfile.write("%s/%s" % (self.wav32dir, name), 32000, item["wav32"])
+            text_lines.append("%s\t%s\t%s\t%s" % (name, " ".join(item["phones"]), item["word2ph"], item["norm_text"]))
+            semantic_lines.append("%s\t%s" % (name, " ".join([str(i) for i in item["semantic"]])))
+        # 先写特征分片，再写文本，最后写进度：中断时未记入进度的条目会在下次运行时重做
+        self.bert_store.flush()
+        self.hubert_store.flush()
+        if text_lines:
+            with open(self.text_path, "a", encoding="utf8") as f:
+                f.write("\n".join(text_lines) + "\n")
+            with open(self.semantic_path, "a", encoding="utf8") as f:
+                f.write("\n".join(semantic_lines) + "\n")
+        # 出错的条目（如音频读取失败）不记入进度，下次运行时重试
+        finished = [item for item in items if item["status"] != "error"]
+        if finished:
+            with open(self.progress_path, "a", encoding="utf8") as f:
+                f.write("\n".join("%s\t%s" % (item["name"], item["status"]) for item in finished) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPT-SoVITS 训练集预处理（文本 / HuBERT / 语义 token）")
+    parser.add_argument("--inp_text", default=os.environ.get("inp_text"), help="标注文件 (wav|spk|lang|text)")
+    parser.add_argument("--inp_wav_dir", default=os.environ.get("inp_wav_dir"), help="音频目录，为空则使用标注中的路径")
+    parser.add_argument("--opt_dir", default=os.environ.get("opt_dir"), help="输出目录 (logs/实验名)")
+    parser.add_argument("--bert_pretrained_dir", default=os.environ.get("bert_pretrained_dir"))
+    parser.add_argument("--cnhubert_base_dir", default=os.environ.get("cnhubert_base_dir"))
+    parser.add_argument("--pretrained_s2G", default=os.environ.get("pretrained_s2G"))
+    parser.add_argument("--s2config_path", default=os.environ.get("s2config_path", "GPT_SoVITS/configs/s2.json"))
+    parser.add_argument("--version", default=os.environ.get("version", "v2"), help="文本清洗使用的版本")
+    parser.add_argument("--is_half", type=eval, default=eval(os.environ.get("is_half", "True")))
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1), help="文本清洗/音频读取进程数")
+    parser.add_argument("--chunk_size", type=int, default=256, help="每批（即每次提交进度）的条目数")
+    parser.add_argument("--bert_batch_size", type=int, default=16)
+    parser.add_argument(
+        "--hubert_batch_seconds",
+        type=float,
+        default=60,
+        help="HuBERT 每批的音频总时长，只有长度相同的音频会组批，0 为逐条推理",
+    )
+    parser.add_argument(
+        "--hubert_parity_checks",
+        type=int,
+        default=0,
+        help="对前 N 个 HuBERT 批次逐条重算并比对结果，不一致时改为逐条推理",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.opt_dir, exist_ok=True)
+    items = read_items(args.inp_text, args.inp_wav_dir)
+    progress = read_progress(args.opt_dir)
+    keep_done_lines("%s/2-name2text.txt" % args.opt_dir, set(progress))
+    keep_done_lines("%s/6-name2semantic.tsv" % args.opt_dir, set(progress), header=SEMANTIC_HEADER)
+    todo = [item for item in items if item[0] not in progress]
+    print("total: %s, done: %s, todo: %s" % (len(items), len(items) - len(todo), len(todo)))
+    if not todo:
+        return
+
+    preparer = Preparer(args)
+    chunks = iter([todo[i : i + args.chunk_size] for i in range(0, len(todo), args.chunk_size)])
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+
+        def submit_next():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                in_flight.append([pool.submit(prepare_item, *item, args.version) for item in chunk])
+
+        # 模型处理第 k 批时，进程池已在准备第 k+1 批
+        submit_next()
+        submit_next()
+        done = len(items) - len(todo)
+        while in_flight:
+            results = [future.result() for future in in_flight.popleft()]
+            submit_next()
+            preparer.process(results)
+            done += len(results)
+            print("%s/%s" % (done, len(items)))
+    preparer.retry_nan_fails()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,9 @@
     `-a` - `绑定地址, 默认"127.0.0.1"`
     `-p` - `绑定端口, 默认9880`
     `-c` - `TTS配置文件路径, 默认"GPT_SoVITS/configs/tts_infer.yaml"`
+    `-w` - `TTS worker 数量, 共享同一份模型权重并发推理, 默认按 CPU 核数估算 (每个 worker 约 8 个核)`
+    `-b` - `跨请求合批的最大分句数, 默认1 (不合批)。大于1时, 使用相同参考音频和采样参数的并发请求 (parallel_infer 且 seed 为 -1) 的分句会合并到同一批推理`
+    `--batch_wait_ms` - `合批时等待其他请求的最长时间, 默认20ms`
 
 ## 调用:
 
@@ -18,6 +21,8 @@ GET:
 http://127.0.0.1:9880/tts?text=先帝创业未半而中道崩殂，今天下三分，益州疲弊，此诚危急存亡之秋也。&text_lang=zh&ref_audio_path=archive_jingyuan_1.wav&prompt_lang=zh&prompt_text=我是「罗浮」云骑将军景元。不必拘谨，「将军」只是一时的身份，你称呼我景元便可&text_split_method=cut5&batch_size=1&media_type=wav&streaming_mode=true
 ```
 
+增量流式: `streaming_mode=true` 时再加上 `&stream_chunk_tokens=25`, 每预测出 25 个语义 token (约 1 秒音频) 就合成并返回一段音频, 不必等整句预测完; 下一句的语义 token 预测与当前句的音频合成并行进行。首包延迟 (TTFA) 见 `/pool_stats`。
+
 POST:
 ```json
 {
@@ -41,6 +46,7 @@ POST:
     "repetition_penalty": 1.35    # float. repetition penalty for T2S model.
     "sample_steps": 32,           # int. number of sampling steps for VITS model V3.
     "super_sampling": False,       # bool. whether to use super-sampling for audio when using VITS model V3.
+    "stream_chunk_tokens": 0,     # int. streaming_mode only: start vocoding every n semantic tokens instead of every sentence (0: off).
 }
 ```
 
@@ -96,6 +102,18 @@ RESP:
 成功: 返回"success", http code 200
 失败: 返回包含错误信息的 json, http code 400
 
+
+### worker 状态
+
+endpoint: `/pool_stats`
+
+GET:
+```
+http://127.0.0.1:9880/pool_stats
+```
+
+RESP: worker 数量、忙碌数、请求数、平均排队时间/首包延迟(TTFA)/耗时/RTF 以及最近请求的明细 (开启合批时还包括批次数与平均批大小), http code 200
+
 """
 
 import os
@@ -113,13 +131,17 @@ import wave
 import signal
 import numpy as np
 import soundfile as sf
+import torch
 from fastapi import FastAPI, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse, JSONResponse
 import uvicorn
 from io import BytesIO
 from tools.i18n.i18n import I18nAuto
 from GPT_SoVITS.TTS_infer_pack.TTS import TTS, TTS_Config
 from GPT_SoVITS.TTS_infer_pack.text_segmentation_method import get_method_names as get_cut_method_names
+from GPT_SoVITS.TTS_infer_pack.batch_scheduler import TTSBatchScheduler
+from GPT_SoVITS.TTS_infer_pack.worker_pool import TTSWorkerPool
 from pydantic import BaseModel
 
 # print(sys.path)
@@ -130,6 +152,13 @@ parser = argparse.ArgumentParser(description="GPT-SoVITS api")
 parser.add_argument("-c", "--tts_config", type=str, default="GPT_SoVITS/configs/tts_infer.yaml", help="tts_infer路径")
 parser.add_argument("-a", "--bind_addr", type=str, default="127.0.0.1", help="default: 127.0.0.1")
 parser.add_argument("-p", "--port", type=int, default="9880", help="default: 9880")
+parser.add_argument(
+    "-w", "--workers", type=int, default=max(1, (os.cpu_count() or 1) // 8), help="number of TTS workers sharing the model weights"
+)
+parser.add_argument(
+    "-b", "--max_batch_size", type=int, default=1, help="max text fragments batched across requests, 1 disables batching"
+)
+parser.add_argument("--batch_wait_ms", type=float, default=20, help="how long a batch waits for more requests")
 args = parser.parse_args()
 config_path = args.tts_config
 # device = args.device
@@ -143,6 +172,12 @@ if config_path in [None, ""]:
 tts_config = TTS_Config(config_path)
 print(tts_config)
 tts_pipeline = TTS(tts_config)
+num_workers = max(1, args.workers)
+if num_workers > 1 and str(tts_config.device).startswith("cpu"):
+    # 每个 worker 分到一部分核心，避免多个 worker 的 intra-op 线程互相争抢
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // num_workers))
+tts_pool = TTSWorkerPool(tts_pipeline, num_workers)
+tts_scheduler = TTSBatchScheduler(tts_pool, args.max_batch_size, args.batch_wait_ms) if args.max_batch_size > 1 else None
 
 APP = FastAPI()
 
@@ -170,6 +205,7 @@ class TTS_Request(BaseModel):
     repetition_penalty: float = 1.35
     sample_steps: int = 32
     super_sampling: bool = False
+    stream_chunk_tokens: int = 0
 
 
 ### modify from https://github.com/RVC-Boss/GPT-SoVITS/pull/894/files
@@ -326,6 +362,7 @@ async def tts_handle(req: dict):
                 "repetition_penalty": 1.35    # float.(optional) repetition penalty for T2S model.
                 "sample_steps": 32,           # int. number of sampling steps for VITS model V3.
                 "super_sampling": False,       # bool. whether to use super-sampling for audio when using VITS model V3.
+                "stream_chunk_tokens": 0,     # int. streaming_mode only: start vocoding every n semantic tokens instead of every sentence (0: off).
             }
     returns:
         StreamingResponse: audio stream response.
@@ -341,9 +378,15 @@ async def tts_handle(req: dict):
 
     if streaming_mode or return_fragment:
         req["return_fragment"] = True
+    if not streaming_mode:
+        # 非流式响应只取第一段音频
+        req["stream_chunk_tokens"] = 0
 
     try:
-        tts_generator = tts_pipeline.run(req)
+        if tts_scheduler is not None and tts_scheduler.accepts(req):
+            tts_generator = tts_scheduler.run(req)
+        else:
+            tts_generator = tts_pool.run(req)
 
         if streaming_mode:
 
@@ -366,7 +409,11 @@ async def tts_handle(req: dict):
             )
 
         else:
-            sr, audio_data = next(tts_generator)
+            try:
+                sr, audio_data = await run_in_threadpool(next, tts_generator)
+            finally:
+                # 释放 worker
+                await run_in_threadpool(tts_generator.close)
             audio_data = pack_audio(BytesIO(), audio_data, sr, media_type).getvalue()
             return Response(audio_data, media_type=f"audio/{media_type}")
     except Exception as e:
@@ -404,6 +451,7 @@ async def tts_get_endpoint(
     repetition_penalty: float = 1.35,
     sample_steps: int = 32,
     super_sampling: bool = False,
+    stream_chunk_tokens: int = 0,
 ):
     req = {
         "text": text,
@@ -428,6 +476,7 @@ async def tts_get_endpoint(
         "repetition_penalty": float(repetition_penalty),
         "sample_steps": int(sample_steps),
         "super_sampling": super_sampling,
+        "stream_chunk_tokens": stream_chunk_tokens,
     }
     return await tts_handle(req)
 
@@ -441,7 +490,7 @@ async def tts_post_endpoint(request: TTS_Request):
 @APP.get("/set_refer_audio")
 async def set_refer_aduio(refer_audio_path: str = None):
     try:
-        tts_pipeline.set_ref_audio(refer_audio_path)
+        await run_in_threadpool(tts_pool.set_ref_audio, refer_audio_path)
     except Exception as e:
         return JSONResponse(status_code=400, content={"message": "set refer audio failed", "Exception": str(e)})
     return JSONResponse(status_code=200, content={"message": "success"})
@@ -471,7 +520,7 @@ async def set_gpt_weights(weights_path: str = None):
     try:
         if weights_path in ["", None]:
             return JSONResponse(status_code=400, content={"message": "gpt weight path is required"})
-        tts_pipeline.init_t2s_weights(weights_path)
+        await run_in_threadpool(tts_pool.reconfigure, lambda tts: tts.init_t2s_weights(weights_path))
     except Exception as e:
         return JSONResponse(status_code=400, content={"message": "change gpt weight failed", "Exception": str(e)})
 
@@ -483,12 +532,20 @@ async def set_sovits_weights(weights_path: str = None):
     try:
         if weights_path in ["", None]:
             return JSONResponse(status_code=400, content={"message": "sovits weight path is required"})
-        tts_pipeline.init_vits_weights(weights_path)
+        await run_in_threadpool(tts_pool.reconfigure, lambda tts: tts.init_vits_weights(weights_path))
     except Exception as e:
         return JSONResponse(status_code=400, content={"message": "change sovits weight failed", "Exception": str(e)})
     return JSONResponse(status_code=200, content={"message": "success"})
 
 
+@APP.get("/pool_stats")
+async def pool_stats():
+    stats = tts_pool.stats()
+    if tts_scheduler is not None:
+        stats["batching"] = tts_scheduler.stats()
+    return JSONResponse(status_code=200, content=stats)
+
+
 if __name__ == "__main__":
     try:
         if host == "None":  # 在调用时使用 -a None 参数，可以让api监听双栈
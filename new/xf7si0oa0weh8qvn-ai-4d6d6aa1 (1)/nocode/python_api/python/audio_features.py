@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+音频特征提取（训练与预测共用）
+
+所有频谱类特征都由同一次 STFT 得到的幅度谱推导，不再为每种特征单独做 STFT；
+支持一次处理一批等长（已填充）的音频片段。
+特征顺序、维度与 extract_features_reference 完全一致，已训练的模型可直接使用。
+"""
+
+import io
+import os
+import tempfile
+import numpy as np
+import librosa
+
+SAMPLE_RATE = 22050
+DURATION = 3.0
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MFCC = 13
+
+# 特征定义（顺序、维度、算法）变化时递增，使训练特征缓存失效
+FEATURE_VERSION = 1
+
+# 需要 ffmpeg 解码、只能走临时文件的格式
+FFMPEG_SUFFIXES = ('.m4a', '.mp4', '.aac', '.amr', '.wma', '.webm', '.3gp')
+
+
+def load_clip(source, duration=DURATION, sr=SAMPLE_RATE):
+    """
+    加载音频并截断/填充到固定时长
+
+    Args:
+        source: 音频文件路径、bytes，或带 name 属性（用于判断格式）的 BytesIO
+        duration: 音频时长（秒）
+        sr: 采样率
+
+    Returns:
+        y: 一维波形
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if hasattr(source, 'read'):
+        y = _load_buffer(source, duration=duration, sr=sr)
+    else:
+        y, _ = librosa.load(source, duration=duration, sr=sr)
+    return pad_clip(y, duration=duration, sr=sr)
+
+
+def needs_temp_file(filename):
+    """m4a 等格式 libsndfile 无法解码，需要落盘后交给 ffmpeg/audioread"""
+    return os.path.splitext(filename or '')[1].lower() in FFMPEG_SUFFIXES
+
+
+def _load_buffer(buf, duration=DURATION, sr=SAMPLE_RATE):
+    name = getattr(buf, 'name', '') or ''
+    if not needs_temp_file(name):
+        try:
+            buf.seek(0)
+            y, _ = librosa.load(buf, duration=duration, sr=sr)
+            return y
+        except Exception:
+            # 内存解码失败（格式不受 libsndfile 支持）时退回临时文件
+            pass
+    suffix = os.path.splitext(name)[1] or '.m4a'
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        buf.seek(0)
+        tmp.write(buf.read())
+        tmp_path = tmp.name
+    try:
+        y, _ = librosa.load(tmp_path, duration=duration, sr=sr)
+        return y
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def pad_clip(y, duration=DURATION, sr=SAMPLE_RATE):
+    """音频太短时在末尾补零"""
+    if len(y) < sr * duration:
+        y = np.pad(y, (0, int(sr * duration - len(y))), mode='constant')
+    return y
+
+
+def stack_clips(clips, duration=DURATION, sr=SAMPLE_RATE):
+    """把多段波形填充后堆叠成 (batch, samples) 数组"""
+    return np.stack([pad_clip(y, duration=duration, sr=sr) for y in clips])
+
+
+def extract_features_batch(y_batch, sr=SAMPLE_RATE):
+    """
+    批量提取特征
+
+    Args:
+        y_batch: (batch, samples) 的等长波形数组，或单条一维波形
+        sr: 采样率
+
+    Returns:
+        features: (batch, feature_dim) 特征矩阵
+    """
+    y_batch = np.asarray(y_batch)
+    if y_batch.ndim == 1:
+        y_batch = y_batch[np.newaxis, :]
+    batch = y_batch.shape[0]
+
+    # 共享的 STFT：幅度谱与功率谱
+    mag = np.abs(librosa.stft(y_batch, n_fft=N_FFT, hop_length=HOP_LENGTH))
+    power = mag ** 2
+
+    # 1. MFCC（基于梅尔谱的 dB 值，top_db 按单条音频计算）
+    mel = librosa.feature.melspectrogram(S=power, sr=sr)
+    mel_db = np.stack([librosa.power_to_db(m) for m in mel])
+    mfccs = librosa.feature.mfcc(S=mel_db, n_mfcc=N_MFCC)
+
+    # 2. 色度特征（调音估计按单条音频进行）
+    chroma = np.stack([librosa.feature.chroma_stft(S=p, sr=sr) for p in power])
+
+    # 4-7. 谱质心 / 带宽 / 对比度 / 滚降
+    spectral_centroids = librosa.feature.spectral_centroid(S=mag, sr=sr)
+    spectral_bandwidth = librosa.feature.spectral_bandwidth(S=mag, sr=sr)
+    # 谱对比度内部的 power_to_db 按整个输入取最大值，需逐条计算
+    spectral_contrast = np.stack([librosa.feature.spectral_contrast(S=m, sr=sr) for m in mag])
+    spectral_rolloff = librosa.feature.spectral_rolloff(S=mag, sr=sr)
+
+    # 8. 零交叉率（时域）
+    zcr = librosa.feature.zero_crossing_rate(y_batch)
+
+    # 9. 基频：每帧取幅度最大的频点
+    pitches, magnitudes = librosa.piptrack(S=mag, sr=sr)
+    index = magnitudes.argmax(axis=-2)
+    frame_pitch = np.take_along_axis(pitches, index[:, np.newaxis, :], axis=-2)[:, 0, :]
+
+    # 10. 能量
+    energy = np.sum(y_batch ** 2, axis=-1) / y_batch.shape[-1]
+
+    def stats(x, *funcs):
+        return [f(x, axis=(1, 2))[:, np.newaxis] for f in funcs]
+
+    columns = [
+        np.mean(mfccs, axis=-1), np.std(mfccs, axis=-1), np.max(mfccs, axis=-1), np.min(mfccs, axis=-1),
+        np.mean(chroma, axis=-1), np.std(chroma, axis=-1),
+        np.mean(mel, axis=-1), np.std(mel, axis=-1),
+        *stats(spectral_centroids, np.mean, np.std),
+        *stats(spectral_bandwidth, np.mean, np.std),
+        np.mean(spectral_contrast, axis=-1), np.std(spectral_contrast, axis=-1),
+        *stats(spectral_rolloff, np.mean, np.std),
+        *stats(zcr, np.mean, np.std),
+    ]
+
+    pitch_stats = np.zeros((batch, 4))
+    for i in range(batch):
+        pitch_values = frame_pitch[i][frame_pitch[i] > 0]
+        if pitch_values.size:
+            pitch_stats[i] = [
+                np.mean(pitch_values),
+                np.std(pitch_values),
+                np.max(pitch_values),
+                np.min(pitch_values)
+            ]
+    columns.extend([pitch_stats, energy[:, np.newaxis]])
+
+    return np.concatenate([np.asarray(c, dtype=np.float64) for c in columns], axis=1)
+
+
+def feature_signature():
+    """特征配置签名：版本号与提取参数，作为特征缓存键的一部分"""
+    return f"v{FEATURE_VERSION}-sr{SAMPLE_RATE}-dur{DURATION}-fft{N_FFT}-hop{HOP_LENGTH}-mfcc{N_MFCC}"
+
+
+def fit_feature_dim(features, target_dim):
+    """
+    截断或补零到模型期望的特征维度
+
+    Args:
+        features: 一维特征向量或 (batch, dim) 特征矩阵
+        target_dim: 目标维度
+
+    Returns:
+        调整后的特征
+    """
+    dim = features.shape[-1]
+    if dim < target_dim:
+        pad = [(0, 0)] * (features.ndim - 1) + [(0, target_dim - dim)]
+        return np.pad(features, pad, mode='constant')
+    return features[..., :target_dim]
+
+
+def extract_features_reference(y, sr=SAMPLE_RATE):
+    """
+    逐项调用 librosa 的原始特征提取实现（每种特征各做一次 STFT）
+
+    仅用于校验 extract_features_batch 的结果一致性。
+
+    Args:
+        y: 已填充的一维波形
+        sr: 采样率
+
+    Returns:
+        features: 特征向量
+    """
+    features = []
+
+    # 1. MFCC特征
+    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
+    features.extend([
+        np.mean(mfccs, axis=1),
+        np.std(mfccs, axis=1),
+        np.max(mfccs, axis=1),
+        np.min(mfccs, axis=1)
+    ])
+
+    # 2. 色度特征
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
+    features.extend([
+        np.mean(chroma, axis=1),
+        np.std(chroma, axis=1)
+    ])
+
+    # 3. 梅尔频谱特征
+    mel = librosa.feature.melspectrogram(y=y, sr=sr)
+    features.extend([
+        np.mean(mel, axis=1),
+        np.std(mel, axis=1)
+    ])
+
+    # 4. 谱质心
+    spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)
+    features.extend([
+        np.mean(spectral_centroids),
+        np.std(spectral_centroids)
+    ])
+
+    # 5. 谱带宽
+    spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)
+    features.extend([
+        np.mean(spectral_bandwidth),
+        np.std(spectral_bandwidth)
+    ])
+
+    # 6. 谱对比度
+    spectral_contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
+    features.extend([
+        np.mean(spectral_contrast, axis=1),
+        np.std(spectral_contrast, axis=1)
+    ])
+
+    # 7. 谱滚降
+    spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)
+    features.extend([
+        np.mean(spectral_rolloff),
+        np.std(spectral_rolloff)
+    ])
+
+    # 8. 零交叉率
+    zcr = librosa.feature.zero_crossing_rate(y)
+    features.extend([
+        np.mean(zcr),
+        np.std(zcr)
+    ])
+
+    # 9. 基频特征
+    pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
+    pitch_values = []
+    for t in range(pitches.shape[1]):
+        index = magnitudes[:, t].argmax()
+        pitch = pitches[index, t]
+        if pitch > 0:
+            pitch_values.append(pitch)
+
+    if pitch_values:
+        features.extend([
+            np.mean(pitch_values),
+            np.std(pitch_values),
+            np.max(pitch_values),
+            np.min(pitch_values)
+        ])
+    else:
+        features.extend([0, 0, 0, 0])
+
+    # 10. 能量特征
+    energy = np.sum(y ** 2) / len(y)
+    features.append(energy)
+
+    # 展平所有特征
+    flattened_features = []
+    for feature in features:
+        if isinstance(feature, np.ndarray):
+            flattened_features.extend(feature.flatten())
+        else:
+            flattened_features.append(feature)
+
+    return np.array(flattened_features)
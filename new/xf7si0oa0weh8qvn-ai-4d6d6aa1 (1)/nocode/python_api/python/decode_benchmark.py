@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传音频解码路径基准测试
+
+对比两种处理上传内容的方式的 p50/p99 延迟：
+  - tempfile: 写入 NamedTemporaryFile，按路径解码，再删除（旧路径）
+  - memory:   直接从 BytesIO 解码（新路径）
+
+用法:
+  python decode_benchmark.py                       # 使用生成的 3 秒 wav
+  python decode_benchmark.py --file cat.wav -n 200 # 使用指定音频
+  python decode_benchmark.py --predict             # 计入特征提取与模型预测
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from audio_features import load_clip
+from predict import AudioEmotionPredictor
+
+
+def _synthetic_wav(duration=3.0, sample_rate=22050):
+    t = np.linspace(0, duration, int(sample_rate * duration))
+    signal = 0.5 * np.sin(2 * np.pi * 440 * t) + 0.1 * np.random.randn(len(t))
+    buf = io.BytesIO()
+    sf.write(buf, signal * 0.8 / np.max(np.abs(signal)), sample_rate, format='WAV')
+    return buf.getvalue()
+
+
+def _tempfile_route(contents, suffix, run):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(contents)
+        tmp_path = tmp.name
+    try:
+        return run(tmp_path)
+    finally:
+        os.remove(tmp_path)
+
+
+def _memory_route(contents, suffix, run):
+    buf = io.BytesIO(contents)
+    buf.name = 'upload' + suffix
+    return run(buf)
+
+
+def _measure(route, contents, suffix, run, iterations):
+    route(contents, suffix, run)  # 预热
+    latencies = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        route(contents, suffix, run)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='上传音频解码路径基准测试')
+    parser.add_argument('--file', help='音频文件路径（默认生成 3 秒 wav）')
+    parser.add_argument('-n', '--iterations', type=int, default=100, help='每种路径的测量次数')
+    parser.add_argument('--predict', action='store_true', help='测量完整的 predict_emotion 而不只是解码')
+    parser.add_argument('--model-dir', default='../models', help='模型目录路径')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'rb') as f:
+            contents = f.read()
+        suffix = os.path.splitext(args.file)[1] or '.wav'
+    else:
+        contents = _synthetic_wav()
+        suffix = '.wav'
+
+    if args.predict:
+        predictor = AudioEmotionPredictor(args.model_dir)
+        if not predictor.load_model():
+            raise SystemExit(f"模型加载失败: {args.model_dir}")
+        run = predictor.predict_emotion
+    else:
+        run = load_clip
+
+    print(f"输入: {args.file or 'synthetic.wav'} ({len(contents) / 1024:.1f} KB), 迭代 {args.iterations} 次")
+    for name, route in (('tempfile', _tempfile_route), ('memory', _memory_route)):
+        p50, p99 = _measure(route, contents, suffix, run, args.iterations)
+        print(f"  {name:<8}  p50 {p50:8.2f} ms  p99 {p99:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理专用线程池
+
+重计算不再占用 Starlette 默认线程池（否则 /health、/audio 等轻量接口会在
+VLM 生成期间排不上队）：异步接口把工作交给按用途划分、大小可配置的执行器，
+执行器在运行中 + 排队的任务达到上限时立即拒绝，由接口返回 429。
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class InferenceExecutor:
+    def __init__(self, name, max_workers, max_queue):
+        """
+        Args:
+            name: 执行器名称（线程名前缀）
+            max_workers: 工作线程数
+            max_queue: 允许排队等待的任务数，超出时 submit 抛出 QueueFullError
+        """
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, name, default_workers, default_queue):
+        """从 {NAME}_POOL_SIZE / {NAME}_QUEUE_SIZE 环境变量读取大小"""
+        prefix = name.upper()
+        workers = int(os.environ.get(f"{prefix}_POOL_SIZE", "0")) or default_workers
+        queue_size = int(os.environ.get(f"{prefix}_QUEUE_SIZE", str(default_queue)))
+        return cls(name, workers, queue_size)
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError(f"{self.name} executor busy")
+        with self._lock:
+            self.in_flight += 1
+            self.submitted += 1
+        try:
+            future = self.pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """在执行器中运行 fn 并异步等待结果"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - self.max_workers),
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+            }
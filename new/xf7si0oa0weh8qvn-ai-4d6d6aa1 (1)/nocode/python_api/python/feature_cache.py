@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+训练特征缓存
+
+以 npz 列式存储（文件内容哈希数组 + 特征矩阵），键为音频内容的 sha256，
+并记录特征配置签名；签名变化（FEATURE_VERSION 或提取参数改变）时整个缓存失效。
+重新训练时只需为新增或内容改变的音频提取特征。
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+from audio_features import feature_signature
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """音频文件内容的 sha256"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, path):
+        """
+        Args:
+            path: npz 缓存文件路径
+        """
+        self.path = path
+        self.signature = feature_signature()
+        self._features = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data['signature']) != self.signature:
+                    print(f"特征配置已变化，忽略旧缓存: {self.path}")
+                    return
+                for digest, features in zip(data['digests'], data['features']):
+                    self._features[str(digest)] = features
+        except Exception as e:
+            print(f"读取特征缓存失败 {self.path}: {e}")
+            self._features = {}
+
+    def __len__(self):
+        return len(self._features)
+
+    def get(self, digest):
+        features = self._features.get(digest)
+        if features is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return features
+
+    def put(self, digest, features):
+        self._features[digest] = np.asarray(features, dtype=np.float64)
+
+    def save(self, keep=None):
+        """
+        写回缓存文件
+
+        Args:
+            keep: 只保留这些哈希对应的条目（通常是本次数据集中的文件），为空时全部保留
+        """
+        digests = [d for d in self._features if keep is None or d in keep]
+        dims = {self._features[d].shape for d in digests}
+        if not digests or len(dims) != 1:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp.npz'
+        np.savez_compressed(
+            tmp_path,
+            signature=np.array(self.signature),
+            digests=np.array(digests),
+            features=np.stack([self._features[d] for d in digests]),
+        )
+        os.replace(tmp_path, self.path)
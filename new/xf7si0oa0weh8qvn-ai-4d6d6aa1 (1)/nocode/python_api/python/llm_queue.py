@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/expert_query 的 NPU 请求队列
+
+NPU 上的 LLMPipeline 同一时间只能执行一个 generate，因此所有请求由单个工作线程串行执行：
+- 有界队列，满时由调用方返回 429
+- 按客户端轮转出队，避免单个客户端连续占满 NPU
+- 通过 openvino_genai 的 streamer 回调逐段推送输出，客户端断开后在下一个 token 处停止生成
+- 统计排队时间、首 token 时延（TTFT）与生成速度
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from executors import QueueFullError
+
+
+class LLMJob:
+    def __init__(self, client, prompt, gen_kwargs, on_event=None):
+        self.client = client
+        self.prompt = prompt
+        self.gen_kwargs = gen_kwargs
+        self.on_event = on_event
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.answer = None
+        self.error = None
+        self.tokens = 0
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def emit(self, kind, data=None):
+        if self.on_event is not None:
+            try:
+                self.on_event(kind, data)
+            except Exception:
+                pass
+
+    def metrics(self):
+        """排队时间、首 token 时延与生成速度（毫秒 / token 每秒）"""
+        end = self.finished_at or time.monotonic()
+        queue_wait = ((self.started_at or end) - self.enqueued_at) * 1000
+        ttft = ((self.first_token_at - self.started_at) * 1000) if self.first_token_at and self.started_at else None
+        decode_s = (end - self.first_token_at) if self.first_token_at else 0
+        tps = ((self.tokens - 1) / decode_s) if self.tokens > 1 and decode_s > 0 else None
+        return {
+            "queue_wait_ms": int(queue_wait),
+            "ttft_ms": int(ttft) if ttft is not None else None,
+            "generate_ms": int((end - self.started_at) * 1000) if self.started_at else 0,
+            "generated_tokens": self.tokens,
+            "tokens_per_second": round(tps, 2) if tps is not None else None,
+        }
+
+
+class LLMRequestQueue:
+    def __init__(self, pipe, max_pending=None):
+        """
+        Args:
+            pipe: openvino_genai.LLMPipeline
+            max_pending: 最多排队的请求数，默认读取 EXPERT_QUEUE_SIZE（16）
+        """
+        if max_pending is None:
+            max_pending = int(os.environ.get("EXPERT_QUEUE_SIZE", "16"))
+        self.pipe = pipe
+        self.max_pending = max(1, max_pending)
+        self._clients = OrderedDict()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="expert-llm", daemon=True)
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_queue_wait_ms = 0
+        self.total_ttft_ms = 0
+        self.ttft_samples = 0
+        self.total_tokens = 0
+        self.total_decode_s = 0.0
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def submit(self, client, prompt, gen_kwargs, on_event=None):
+        """
+        加入队列
+
+        Args:
+            client: 客户端标识（用于轮转公平调度），如客户端 IP
+            prompt: 完整提示词
+            gen_kwargs: 传给 pipe.generate 的生成参数
+            on_event: 事件回调 on_event(kind, data)，kind 为 token / done / error / cancelled
+
+        Returns:
+            LLMJob
+        """
+        job = LLMJob(client, prompt, gen_kwargs, on_event)
+        with self._cond:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(f"expert queue full ({self._pending} pending)")
+            self._clients.setdefault(client, deque()).append(job)
+            self._pending += 1
+            self._cond.notify()
+        return job
+
+    def _next_job(self):
+        with self._cond:
+            while self._pending == 0 and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                return None
+            # 取队首客户端的最早请求，该客户端若还有请求则移到队尾
+            client, jobs = next(iter(self._clients.items()))
+            job = jobs.popleft()
+            del self._clients[client]
+            if jobs:
+                self._clients[client] = jobs
+            self._pending -= 1
+            return job
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._execute(job)
+
+    def _execute(self, job):
+        job.started_at = time.monotonic()
+        if job.cancelled.is_set():
+            self._finish(job, "cancelled")
+            return
+
+        def streamer(subword):
+            if job.first_token_at is None:
+                job.first_token_at = time.monotonic()
+            job.tokens += 1
+            job.emit("token", subword)
+            # 返回 True 时 openvino_genai 停止生成
+            return job.cancelled.is_set()
+
+        try:
+            job.answer = str(self.pipe.generate(job.prompt, streamer=streamer, **job.gen_kwargs) or "")
+        except Exception as e:
+            job.error = e
+            self._finish(job, "error")
+            return
+        self._finish(job, "cancelled" if job.cancelled.is_set() else "done")
+
+    def _finish(self, job, kind):
+        job.finished_at = time.monotonic()
+        metrics = job.metrics()
+        with self._cond:
+            if kind == "done":
+                self.completed += 1
+            elif kind == "cancelled":
+                self.cancelled += 1
+            else:
+                self.failed += 1
+            self.total_queue_wait_ms += metrics["queue_wait_ms"]
+            if metrics["ttft_ms"] is not None:
+                self.total_ttft_ms += metrics["ttft_ms"]
+                self.ttft_samples += 1
+            if job.first_token_at:
+                self.total_tokens += max(0, job.tokens - 1)
+                self.total_decode_s += job.finished_at - job.first_token_at
+        job.done.set()
+        job.emit(kind, job.error if kind == "error" else metrics)
+
+    def pending(self):
+        with self._cond:
+            return self._pending
+
+    def stats(self):
+        with self._cond:
+            finished = self.completed + self.cancelled + self.failed
+            return {
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "clients_waiting": len(self._clients),
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_queue_wait_ms": (self.total_queue_wait_ms / finished) if finished else 0.0,
+                "avg_ttft_ms": (self.total_ttft_ms / self.ttft_samples) if self.ttft_samples else 0.0,
+                "tokens_per_second": (self.total_tokens / self.total_decode_s) if self.total_decode_s > 0 else 0.0,
+            }
@@ -10,21 +10,33 @@ Docs:  http://127.0.0.1:8000/docs
 Form:  http://127.0.0.1:8000/
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.responses import JSONResponse, HTMLResponse, FileResponse, StreamingResponse, Response
 from fastapi import Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
 import tempfile
+import asyncio
+import io
+import json
+import time
 import os
 import traceback
 import base64
+from urllib.parse import quote
 from PIL import Image
-from openvino.runtime import Core
 
 # 确保 predict.py 和本文件同目录，并且包含 AudioEmotionPredictor
 from predict import AudioEmotionPredictor
+from audio_features import needs_temp_file
+from vision_registry import VisionModelRegistry
+from micro_batcher import MicroBatcher
+from result_cache import ResultCache, make_key
+from llm_queue import LLMRequestQueue
+from executors import InferenceExecutor, QueueFullError
+from voice_index import VoiceIndex
 
 app = FastAPI(title="Cat & Dog Voice Emotion API", version="0.1.1")
 app.add_middleware(
@@ -33,25 +45,74 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache", "X-Cache-Tier"],
 )
 
 predictor: Optional[AudioEmotionPredictor] = None
+predict_batcher: Optional[MicroBatcher] = None
 asr_pipeline = None
 asr_model = None
 asr_ms_pipeline = None
 ov_llm_pipe = None
-ov_llm_lock = None
+expert_queue: Optional[LLMRequestQueue] = None
+vision_registry = VisionModelRegistry()
+voice_index = VoiceIndex()
+# 推理专用线程池：CPU 特征提取/ASR 与单飞的 GPU/NPU 视觉推理，均不占用 Starlette 默认线程池
+cpu_executor = InferenceExecutor.from_env("cpu", os.cpu_count() or 1, 64)
+accel_executor = InferenceExecutor.from_env("accel", 1, 8)
+# 结果缓存默认关闭，设置 RESULT_CACHE=1 启用
+result_cache: Optional[ResultCache] = ResultCache() if os.environ.get("RESULT_CACHE", "0") == "1" else None
+
+DEFAULT_VISION_MODEL_ID = "OpenVINO/Phi-3.5-vision-instruct-int4-ov"
+
+def _resolve_vision_model(model_id: Optional[str] = None) -> str:
+    """把 model_id / OV_VISION_MODEL_DIR / 默认模型解析为实际加载路径（优先本地 modelscope 缓存）"""
+    model_dir = os.environ.get("OV_VISION_MODEL_DIR")
+    cache_root = os.path.join(os.path.expanduser("~"), ".cache", "modelscope", "hub", "models")
+    if model_id:
+        if os.path.isdir(model_id):
+            return model_id
+        cached = os.path.join(cache_root, model_id.replace("/", os.sep))
+        return cached if os.path.isdir(cached) else model_id
+    if model_dir and os.path.isdir(model_dir):
+        return model_dir
+    cached_def = os.path.join(cache_root, DEFAULT_VISION_MODEL_ID.replace("/", os.sep))
+    return cached_def if os.path.isdir(cached_def) else DEFAULT_VISION_MODEL_ID
+
+def _select_vision_device(device: Optional[str] = None, strict_device: Optional[bool] = False):
+    requested_device = (device or os.environ.get("OV_DEVICE") or "GPU").upper()
+    available = vision_registry.available_devices()
+    selected = requested_device if requested_device in available else "CPU"
+    strict = strict_device or (os.environ.get("OV_STRICT_DEVICE", "0") == "1")
+    if strict and selected != requested_device:
+        raise RuntimeError(f"Requested device {requested_device} not available: {available}")
+    return selected, available
+
+def _prewarm_vision_model():
+    """后台预加载默认视觉模型，仅在本地已有模型时执行，避免启动时触发在线下载"""
+    try:
+        chosen_model = _resolve_vision_model()
+        if not os.path.isdir(chosen_model):
+            return
+        selected, _ = _select_vision_device()
+        vision_registry.get(chosen_model, selected)
+    except Exception:
+        traceback.print_exc()
 
 @app.on_event("startup")
 def _load_model_once():
-    global predictor
-    global ov_llm_pipe, ov_llm_lock
+    global predictor, predict_batcher
+    global ov_llm_pipe, expert_queue
     try:
         predictor = AudioEmotionPredictor()
         predictor.load_model()  # 默认从 ../models 读取
     except Exception as e:
         traceback.print_exc()
         raise RuntimeError(f"Failed to initialize predictor: {e}")
+    voice_index.refresh(force=True)
+    if predictor.is_loaded and os.environ.get("PREDICT_MICRO_BATCH", "1") == "1":
+        predict_batcher = MicroBatcher(predictor, executor=cpu_executor)
+        predict_batcher.start()
     try:
         import openvino_genai as ov_genai
         model_dir = os.environ.get("QWEN3_NPU_MODEL_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "..", "qwen3-8b-int4-cw-ov")
@@ -60,17 +121,111 @@ def _load_model_once():
             alt_dir = os.path.join(os.path.expanduser("~"), "Desktop", "new", "qwen3-8b-int4-cw-ov")
             model_dir = alt_dir if os.path.exists(alt_dir) else model_dir
         ov_llm_pipe = ov_genai.LLMPipeline(model_dir, device="NPU")
-        import threading
-        ov_llm_lock = threading.Lock()
+        # NPU 同时只执行一个 generate，请求经有界队列串行调度
+        expert_queue = LLMRequestQueue(ov_llm_pipe)
+        expert_queue.start()
     except Exception:
         # 不抛出启动错误，接口内返回明确错误
         ov_llm_pipe = None
-        ov_llm_lock = None
+        expert_queue = None
+    if os.environ.get("OV_VISION_PREWARM", "1") == "1":
+        # 在视觉推理执行器中预热，首个请求会排在预热之后而不是重复加载
+        accel_executor.submit(_prewarm_vision_model)
+
+@app.on_event("shutdown")
+def _stop_workers():
+    if predict_batcher is not None:
+        predict_batcher.stop()
+    if expert_queue is not None:
+        expert_queue.stop()
+    cpu_executor.shutdown()
+    accel_executor.shutdown()
+
+def _busy(e: Exception) -> HTTPException:
+    return HTTPException(status_code=429, detail=f"服务繁忙，请稍后再试: {e}", headers={"Retry-After": "1"})
+
+async def _predict_emotion(source):
+    """并发请求经微批调度器合并预测；未启用时在 CPU 执行器中单独预测"""
+    if predict_batcher is not None:
+        return await asyncio.wrap_future(predict_batcher.submit(source))
+    return await cpu_executor.run(predictor.predict_emotion, source)
+
+def _cache_headers(tier: Optional[str]) -> dict:
+    if result_cache is None:
+        return {}
+    if tier is None:
+        return {"X-Cache": "MISS"}
+    return {"X-Cache": "HIT", "X-Cache-Tier": tier}
+
+async def _predict_emotion_cached(contents: bytes, suffix: str):
+    """
+    带结果缓存的情绪预测，/predict 与 /translate 共用同一份缓存
+
+    Returns:
+        tuple: (预测结果 dict, 命中层；未命中为 None)
+    """
+    key = None
+    # 模型加载后才能确定实际使用的分类器后端（openvino 不可用时回退到 sklearn）
+    if result_cache is not None and predictor.is_loaded:
+        backend = 'openvino' if predictor.ov_classifier is not None else 'sklearn'
+        key = make_key(
+            "emotion",
+            contents,
+            model_dir=os.path.abspath(predictor.model_dir),
+            backend=backend,
+            device=predictor.device,
+        )
+        cached, tier = await run_in_threadpool(result_cache.get, key)
+        if cached is not None:
+            return cached, tier
+    # 直接在内存中解码，m4a 等需要 ffmpeg 的格式才会落盘
+    result = await _predict_emotion(_upload_buffer(contents, "upload" + suffix))
+    if key is not None and result.get('success', False):
+        await run_in_threadpool(result_cache.put, key, result)
+    return result, None
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
+@app.get("/admin/vision_models")
+def vision_models_stats():
+    return vision_registry.stats()
+
+@app.post("/admin/vision_models/evict")
+def vision_models_evict(model_id: Optional[str] = None, device: Optional[str] = None):
+    model_path = _resolve_vision_model(model_id) if model_id else None
+    evicted = vision_registry.evict(model_path, device.upper() if device else None)
+    return {"evicted": evicted, "stats": vision_registry.stats()}
+
+@app.get("/admin/result_cache")
+def result_cache_stats():
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+@app.post("/admin/result_cache/clear")
+def result_cache_clear():
+    if result_cache is not None:
+        result_cache.clear()
+    return result_cache_stats()
+
+@app.get("/admin/expert_queue")
+def expert_queue_stats():
+    if expert_queue is None:
+        return {"enabled": False}
+    return {"enabled": True, **expert_queue.stats()}
+
+@app.get("/admin/executors")
+def executors_stats():
+    return {"cpu": cpu_executor.stats(), "accel": accel_executor.stats()}
+
+@app.get("/admin/predict_batcher")
+def predict_batcher_stats():
+    if predict_batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **predict_batcher.stats()}
+
 @app.get("/labels")
 def labels():
     global predictor
@@ -271,6 +426,12 @@ def cat_vision_page():
     """
     return HTMLResponse(content=html)
 
+def _upload_buffer(contents: bytes, filename: str) -> io.BytesIO:
+    """上传内容的内存视图，name 保留原文件名后缀，供解码时判断是否需要落盘"""
+    buf = io.BytesIO(contents)
+    buf.name = filename
+    return buf
+
 def _normalize_output(res):
     """
     把任意返回值转成 JSON 友好结构：
@@ -295,14 +456,14 @@ def _normalize_output(res):
     return {"result": jsonable_encoder(res)}
 
 @app.post("/predict")
-def predict_api(file: UploadFile = File(...)):
+async def predict_api(file: UploadFile = File(...)):
     global predictor
     if predictor is None:
         raise HTTPException(status_code=503, detail="Model not ready")
 
     MAX_SIZE = 20 * 1024 * 1024  # 20MB
     try:
-        contents = file.file.read()
+        contents = await file.read()
         if len(contents) > MAX_SIZE:
             raise HTTPException(status_code=413, detail="File too large")
     except Exception:
@@ -313,28 +474,61 @@ def predict_api(file: UploadFile = File(...)):
         suffix = ".m4a"
 
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(contents)
-            tmp_path = tmp.name
-
         # 注意：不再传 return_json / top_k
-        raw_result = predictor.predict_emotion(tmp_path)
+        raw_result, cache_tier = await _predict_emotion_cached(contents, suffix)
         result = _normalize_output(raw_result)
-        return JSONResponse(content=result)
+        return JSONResponse(content=result, headers=_cache_headers(cache_tier))
     except HTTPException:
         raise
+    except QueueFullError as e:
+        raise _busy(e)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
-    finally:
+
+async def _next_expert_event(request: Request, job, events: asyncio.Queue):
+    """等待下一个生成事件；客户端断开时取消任务并返回 None"""
+    while True:
         try:
-            if 'tmp_path' in locals() and os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            pass
+            return await asyncio.wait_for(events.get(), timeout=0.5)
+        except asyncio.TimeoutError:
+            if await request.is_disconnected():
+                job.cancel()
+                return None
+
+def _sse(kind: str, data) -> str:
+    return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _expert_stream(request: Request, job, events: asyncio.Queue, position: int, model_dir: str):
+    try:
+        yield _sse("queued", {"position": position})
+        while True:
+            event = await _next_expert_event(request, job, events)
+            if event is None:
+                return
+            kind, data = event
+            if kind == "token":
+                yield _sse("token", {"text": data})
+            elif kind == "done":
+                yield _sse("done", {
+                    "success": True,
+                    "model_dir": model_dir,
+                    "device": "NPU",
+                    "metrics": data,
+                })
+                return
+            elif kind == "error":
+                yield _sse("error", {"success": False, "detail": f"NPU推理失败: {data}"})
+                return
+            else:
+                return
+    finally:
+        # 生成器被关闭（客户端断开）时停止仍在进行的生成
+        if not job.done.is_set():
+            job.cancel()
 
 @app.post("/expert_query")
-def expert_query(payload: dict = Body(...)):
+async def expert_query(request: Request, payload: dict = Body(...)):
     try:
         question = str(payload.get("question") or "").strip()
         if not question:
@@ -343,26 +537,53 @@ def expert_query(payload: dict = Body(...)):
         temperature = float(payload.get("temperature") or 0.7)
         top_p = float(payload.get("top_p") or 0.9)
         top_k = int(payload.get("top_k") or 50)
-        global ov_llm_pipe, ov_llm_lock
-        if ov_llm_pipe is None:
+        stream = bool(payload.get("stream"))
+        if ov_llm_pipe is None or expert_queue is None:
             raise HTTPException(status_code=503, detail="NPU模型未就绪，请检查 QWEN3_NPU_MODEL_DIR 或本地模型目录")
         system_prompt = (
             "你是一位宠物专家，擅长猫狗行为、训练、健康与安全。"
             "只回答与宠物相关的问题，给出可操作建议；如问题与宠物无关，请礼貌提醒并引导到宠物主题。"
         )
         prompt = f"{system_prompt}\n用户: {question}\n专家:"
-        import time
+        gen_kwargs = {"max_length": max_length, "temperature": temperature, "top_p": top_p, "top_k": top_k}
+
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+
+        def on_event(kind, data):
+            loop.call_soon_threadsafe(events.put_nowait, (kind, data))
+
+        client = request.client.host if request.client else "anonymous"
         t0 = time.time()
+        position = expert_queue.pending()
         try:
-            if ov_llm_lock:
-                with ov_llm_lock:
-                    answer = ov_llm_pipe.generate(prompt, max_length=max_length, temperature=temperature, top_p=top_p, top_k=top_k)
-            else:
-                answer = ov_llm_pipe.generate(prompt, max_length=max_length, temperature=temperature, top_p=top_p, top_k=top_k)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"NPU推理失败: {e}")
-        latency_ms = int((time.time() - t0) * 1000)
+            job = expert_queue.submit(client, prompt, gen_kwargs, on_event)
+        except QueueFullError:
+            raise HTTPException(status_code=429, detail="专家咨询排队已满，请稍后再试")
         model_dir = getattr(ov_llm_pipe, "model_path", None) or "qwen3-8b-int4-cw-ov"
+
+        if stream:
+            return StreamingResponse(
+                _expert_stream(request, job, events, position, model_dir),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        while True:
+            event = await _next_expert_event(request, job, events)
+            if event is None:
+                raise HTTPException(status_code=499, detail="client disconnected")
+            kind, data = event
+            if kind == "token":
+                continue
+            if kind == "error":
+                raise HTTPException(status_code=500, detail=f"NPU推理失败: {data}")
+            if kind == "cancelled":
+                raise HTTPException(status_code=499, detail="client disconnected")
+            metrics = data
+            break
+        answer = job.answer
+        latency_ms = int((time.time() - t0) * 1000)
         return JSONResponse(content={
             "success": True,
             "answer": str(answer or ""),
@@ -370,6 +591,7 @@ def expert_query(payload: dict = Body(...)):
             "device": "NPU",
             "usage": {"prompt_tokens": len(prompt), "output_tokens": len(str(answer or ""))},
             "latency_ms": latency_ms,
+            "metrics": metrics,
         })
     except HTTPException:
         raise
@@ -378,7 +600,7 @@ def expert_query(payload: dict = Body(...)):
         raise HTTPException(status_code=500, detail=f"Expert query failed: {e}")
 
 @app.post("/translate")
-def translate_api(file: UploadFile = File(...)):
+async def translate_api(file: UploadFile = File(...)):
     """翻译接口：识别输入音频的动物类型和情绪，返回对应的翻译音频文件路径"""
     global predictor
     if predictor is None:
@@ -386,7 +608,7 @@ def translate_api(file: UploadFile = File(...)):
 
     MAX_SIZE = 20 * 1024 * 1024  # 20MB
     try:
-        contents = file.file.read()
+        contents = await file.read()
         if len(contents) > MAX_SIZE:
             raise HTTPException(status_code=413, detail="File too large")
     except Exception:
@@ -397,12 +619,8 @@ def translate_api(file: UploadFile = File(...)):
         suffix = ".m4a"
 
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(contents)
-            tmp_path = tmp.name
-
         # 预测情绪
-        prediction_result = predictor.predict_emotion(tmp_path)
+        prediction_result, cache_tier = await _predict_emotion_cached(contents, suffix)
         
         if not prediction_result.get('success', False):
             raise HTTPException(status_code=500, detail=prediction_result.get('error', 'Prediction failed'))
@@ -416,52 +634,8 @@ def translate_api(file: UploadFile = File(...)):
         target_animal = 'dog' if animal == 'cat' else 'cat'
         target_animal_cn = '狗' if animal == 'cat' else '猫'
         
-        # 构建音频文件路径
-        voice_dir = os.path.join('..', '..', 'voice(1)')
-        if target_animal == 'cat':
-            audio_folder = 'Catvoice'
-        else:
-            audio_folder = 'Dogvoice'
-        
-        audio_filename = f"{target_animal_cn}_{emotion}.m4a"
-        audio_path = os.path.join(voice_dir, audio_folder, audio_filename)
-        
-        # 检查音频文件是否存在
-        if not os.path.exists(audio_path):
-            # 如果找不到对应情绪的音频，尝试一些通用的情绪映射
-            emotion_mapping = {
-                '兴奋捕猎': ['兴奋', '捕猎', '活跃'],
-                '友好呼唤': ['友好', '呼唤', '打招呼'],
-                '撒娇': ['撒娇', '可爱', '亲昵'],
-                '警告': ['警告', '威胁', '生气'],
-                '饿了': ['饿了', '要食物', '饥饿'],
-                '着急': ['着急', '焦虑', '不安'],
-                '求偶': ['求偶', '发情'],
-                '哀求': ['哀求', '请求', '委屈']
-            }
-            
-            # 尝试找到相似的情绪
-            found_audio = None
-            for available_emotion, similar_emotions in emotion_mapping.items():
-                if emotion in similar_emotions:
-                    test_filename = f"{target_animal_cn}_{available_emotion}.m4a"
-                    test_path = os.path.join(voice_dir, audio_folder, test_filename)
-                    if os.path.exists(test_path):
-                        audio_path = test_path
-                        audio_filename = test_filename
-                        found_audio = available_emotion
-                        break
-            
-            if not found_audio:
-                # 如果还是找不到，使用默认音频（如果存在）
-                default_emotions = ['打招呼', '撒娇', '友好呼唤']
-                for default_emotion in default_emotions:
-                    default_filename = f"{target_animal_cn}_{default_emotion}.m4a"
-                    default_path = os.path.join(voice_dir, audio_folder, default_filename)
-                    if os.path.exists(default_path):
-                        audio_path = default_path
-                        audio_filename = default_filename
-                        break
+        # 从预先建立的索引中查找音频（已包含相似情绪与默认音频的回退）
+        audio_filename, audio_path = await run_in_threadpool(voice_index.resolve, target_animal, emotion)
         
         # 构建返回结果
         result = {
@@ -478,45 +652,71 @@ def translate_api(file: UploadFile = File(...)):
             'description': f"检测到{animal}的{emotion}情绪（置信度：{confidence:.2f}），为您播放对应的{target_animal_cn}语音频"
         }
         
-        return JSONResponse(content=result)
+        return JSONResponse(content=result, headers=_cache_headers(cache_tier))
         
     except HTTPException:
         raise
+    except QueueFullError as e:
+        raise _busy(e)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Translation failed: {e}")
-    finally:
-        try:
-            if 'tmp_path' in locals() and os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            pass
+
+def _parse_range(range_header: str, size: int):
+    """解析单段 Range 头，返回 (start, end)；无法满足时返回 None"""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_s, _, end_s = spec.strip().partition("-")
+    try:
+        if start_s == "":
+            length = int(end_s)
+            if length <= 0:
+                return None
+            start, end = max(0, size - length), size - 1
+        else:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        return None
+    return start, end
 
 @app.get("/audio/{filename}")
-def get_audio_file(filename: str):
-    """获取音频文件"""
+def get_audio_file(filename: str, request: Request):
+    """获取音频文件（内存中的小文件支持 ETag 与 Range）；索引可能需要重扫目录，因此不在事件循环上运行"""
     try:
-        # 构建音频文件路径
-        voice_dir = os.path.join('..', '..', 'voice(1)')
-        
         # 根据文件名判断是猫还是狗的音频
-        if filename.startswith('猫_'):
-            audio_folder = 'Catvoice'
-        elif filename.startswith('狗_'):
-            audio_folder = 'Dogvoice'
-        else:
+        if not (filename.startswith('猫_') or filename.startswith('狗_')):
             raise HTTPException(status_code=404, detail="Audio file not found")
         
-        audio_path = os.path.join(voice_dir, audio_folder, filename)
-        
-        if not os.path.exists(audio_path):
+        clip = voice_index.get(filename)
+        if clip is None:
             raise HTTPException(status_code=404, detail="Audio file not found")
+        if clip.data is None:
+            return FileResponse(path=clip.path, media_type="audio/m4a", filename=filename)
         
-        return FileResponse(
-            path=audio_path,
-            media_type="audio/m4a",
-            filename=filename
-        )
+        headers = {
+            "ETag": clip.etag,
+            "Accept-Ranges": "bytes",
+            "Cache-Control": "no-cache",
+            "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+        }
+        if clip.etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+        
+        range_header = request.headers.get("range")
+        if range_header and request.headers.get("if-range", clip.etag) == clip.etag:
+            byte_range = _parse_range(range_header, len(clip.data))
+            if byte_range is None:
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{len(clip.data)}"})
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(clip.data)}"
+            return Response(content=clip.data[start:end + 1], status_code=206, media_type="audio/m4a", headers=headers)
+        
+        return Response(content=clip.data, media_type="audio/m4a", headers=headers)
         
     except HTTPException:
         raise
@@ -524,50 +724,260 @@ def get_audio_file(filename: str):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to serve audio file: {e}")
 
+@app.get("/admin/voice_index")
+def voice_index_stats():
+    return voice_index.stats()
+
+@app.post("/admin/voice_index/reload")
+def voice_index_reload():
+    voice_index.refresh(force=True)
+    return voice_index.stats()
+
+def _run_asr(contents: bytes, suffix: str, asr_model_id: Optional[str] = None) -> str:
+    global asr_model
+    if asr_model is None or asr_model_id:
+        model_sel = asr_model_id or os.environ.get("ASR_MODEL_DIR") or "paraformer-zh"
+        try:
+            from funasr import AutoModel
+            asr_model = AutoModel(model=model_sel)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"ASR init failed: {e}")
+    try:
+        import soundfile as sf
+        res = None
+        if not needs_temp_file(suffix):
+            try:
+                waveform, sr = sf.read(io.BytesIO(contents))
+                res = asr_model.generate(input=waveform, fs=sr, batch_size_s=60)
+            except Exception:
+                res = None
+        if res is None:
+            # libsndfile 无法解码的格式交给 funasr 内部的 ffmpeg 读取文件
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+                tmp.write(contents)
+                tmp_path = tmp.name
+            try:
+                res = asr_model.generate(input=tmp_path, batch_size_s=60)
+            finally:
+                try:
+                    os.remove(tmp_path)
+                except Exception:
+                    pass
+        text = ""
+        if isinstance(res, list) and res and isinstance(res[0], dict):
+            text = str(res[0].get("text") or "")
+        elif isinstance(res, dict):
+            text = res.get("text") or res.get("output") or ""
+        else:
+            text = str(res)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"ASR run failed: {e}")
+    return text
+
 @app.post("/asr_transcribe")
-def asr_transcribe(file: UploadFile = File(...), asr_model_id: Optional[str] = None):
+async def asr_transcribe(file: UploadFile = File(...), asr_model_id: Optional[str] = None):
     try:
-        contents = file.file.read()
+        contents = await file.read()
         if len(contents) > 30 * 1024 * 1024:
             raise HTTPException(status_code=413, detail="File too large")
         suffix = os.path.splitext(file.filename or "upload")[1]
         if suffix == "":
             suffix = ".wav"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(contents)
-            tmp_path = tmp.name
-        global asr_model
-        if asr_model is None or asr_model_id:
-            model_sel = asr_model_id or os.environ.get("ASR_MODEL_DIR") or "paraformer-zh"
-            try:
-                from funasr import AutoModel
-                asr_model = AutoModel(model=model_sel)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"ASR init failed: {e}")
-        try:
-            import soundfile as sf
-            try:
-                waveform, sr = sf.read(tmp_path)
-                res = asr_model.generate(input=waveform, fs=sr, batch_size_s=60)
-            except Exception:
-                res = asr_model.generate(input=tmp_path, batch_size_s=60)
-            text = ""
-            if isinstance(res, list) and res and isinstance(res[0], dict):
-                text = str(res[0].get("text") or "")
-            elif isinstance(res, dict):
-                text = res.get("text") or res.get("output") or ""
-            else:
-                text = str(res)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"ASR run failed: {e}")
+        text = await cpu_executor.run(_run_asr, contents, suffix, asr_model_id)
         return JSONResponse(content={"success": True, "text": text})
     except HTTPException:
         raise
+    except QueueFullError as e:
+        raise _busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ASR failed: {e}")
 
+def _run_vision_model(contents: bytes, chosen_model: str, device: str, available, mode: Optional[str]) -> dict:
+    """在常驻模型上执行一次 VLM 生成，并把输出解析为接口返回的 JSON 结构"""
+    entry = vision_registry.get(chosen_model, device)
+    processor = entry.processor
+    ov_model = entry.model
+    img = Image.open(io.BytesIO(contents)).convert("RGB")
+    labels = [
+        "兴奋捕猎","友好呼唤","吵架","好吃","委屈","想玩耍","打招呼","打架预备",
+        "撒娇","无聊","求偶","求救","满足","着急","舒服","警告","走开","饿了"
+    ]
+    if mode == "raw":
+        prompt = "<|image_1|>\nWhat is unusual on this picture?"
+    else:
+        prompt = (
+            "<|image_1|>\n"
+            + "请分析这张猫咪图片，从以下18个标签中选择一个最匹配的："
+            + ",".join(labels)
+            + "。仅输出一个不带任何代码块标记和反引号的纯JSON对象，不得输出额外文字或数组。"
+            + "JSON字段要求：{"
+            + "\"emotion\": 以上标签之一,"
+            + "\"confidence\": 0-100 的整数,"
+            + "\"description\": 用中文简要说明(不超过40字),"
+            + "\"tips\": [3条中文建议，每条不超过12字]"
+            + "}."
+        )
+    with entry.lock:
+        inputs = ov_model.preprocess_inputs(text=prompt, image=img, processor=processor)
+        generate_ids = ov_model.generate(
+            **inputs,
+            eos_token_id=processor.tokenizer.eos_token_id,
+            max_new_tokens=120,
+            temperature=0.0,
+            do_sample=False,
+        )
+    generate_ids = generate_ids[:, inputs['input_ids'].shape[1]:]
+    text = processor.batch_decode(generate_ids, skip_special_tokens=True, clean_up_tokenization_spaces=False)[0]
+    if mode == "raw":
+        return {
+            "response": text,
+            "model_dir": chosen_model,
+            "device": device,
+            "available_devices": available
+        }
+    parsed = None
+    parsed_list = None
+    try:
+        import re, json
+        clean = re.sub(r"```[\s\S]*?```", "", text)
+        m_arr = re.search(r"\[[\s\S]*?\]", clean)
+        if m_arr:
+            parsed_list = json.loads(m_arr.group(0))
+        else:
+            m_obj = re.search(r"\{[\s\S]*?\}", clean)
+            if m_obj:
+                parsed = json.loads(m_obj.group(0))
+    except Exception:
+        parsed = None
+    if parsed_list:
+        candidate = None
+        try:
+            for item in parsed_list:
+                if isinstance(item, dict) and ("emotion" in item or "confidence" in item):
+                    candidate = item
+                    break
+            if candidate is None:
+                for item in parsed_list:
+                    if isinstance(item, dict):
+                        candidate = item
+                        break
+        except Exception:
+            candidate = None
+        if candidate:
+            emo = candidate.get("emotion") or "满足"
+            conf = candidate.get("confidence") or 0
+            try:
+                conf = int(conf)
+            except Exception:
+                conf = 0
+            if conf < 0:
+                conf = 0
+            if conf > 100:
+                conf = 100
+            desc = candidate.get("description") or ""
+            desc = str(desc).strip()[:40]
+            tips = candidate.get("tips") or []
+            if isinstance(tips, list):
+                tips = [str(t).strip()[:12] for t in tips][:3]
+            else:
+                tips = []
+            if emo not in labels:
+                for l in labels:
+                    if l in text:
+                        emo = l
+                        break
+            return {
+                "emotion": emo,
+                "confidence": conf,
+                "description": desc,
+                "tips": tips,
+                "model_dir": chosen_model,
+                "device": device,
+                "available_devices": available,
+                "raw_text": text
+            }
+    if parsed:
+        emo = parsed.get("emotion") or "满足"
+        conf = parsed.get("confidence") or 0
+        try:
+            conf = int(conf)
+        except Exception:
+            conf = 0
+        if conf < 0:
+            conf = 0
+        if conf > 100:
+            conf = 100
+        desc = parsed.get("description") or ""
+        desc = str(desc).strip()[:40]
+        tips = parsed.get("tips") or []
+        if isinstance(tips, list):
+            tips = [str(t).strip()[:12] for t in tips][:3]
+        else:
+            tips = []
+        if emo not in labels:
+            for l in labels:
+                if l in text:
+                    emo = l
+                    break
+        return {
+            "emotion": emo,
+            "confidence": conf,
+            "description": desc,
+            "tips": tips,
+            "model_dir": chosen_model,
+            "device": device,
+            "available_devices": available,
+            "raw_text": text
+        }
+    chosen = None
+    import re
+    mc = re.search(r"confidence[^0-9]*(\d{1,3})", text, re.IGNORECASE)
+    conf_val = 0
+    if mc:
+        try:
+            conf_val = int(mc.group(1))
+        except Exception:
+            conf_val = 0
+    if conf_val < 0:
+        conf_val = 0
+    if conf_val > 100:
+        conf_val = 100
+    for l in labels:
+        if l in text:
+            chosen = l
+            break
+    if not chosen:
+        emo_from_text = None
+        try:
+            import re
+            m_emo = re.search(r"\"emotion\"\s*:\s*\"([^\"]+)\"", text)
+            if m_emo:
+                emo_from_text = m_emo.group(1)
+        except Exception:
+            emo_from_text = None
+        return {
+            "emotion": emo_from_text or "满足",
+            "confidence": conf_val,
+            "description": text,
+            "tips": [],
+            "model_dir": chosen_model,
+            "device": device,
+            "available_devices": available,
+            "raw_text": text
+        }
+    return {
+        "emotion": chosen,
+        "confidence": conf_val,
+        "description": text,
+        "tips": [],
+        "model_dir": chosen_model,
+        "device": device,
+        "available_devices": available,
+        "raw_text": text
+    }
+
 @app.post("/vision_analyze")
-def vision_analyze(
+async def vision_analyze(
     file: UploadFile = File(...),
     device: Optional[str] = None,
     strict_device: Optional[bool] = False,
@@ -576,34 +986,12 @@ def vision_analyze(
 ):
     try:
         MAX_SIZE = 10 * 1024 * 1024
-        contents = file.file.read()
+        contents = await file.read()
         if len(contents) > MAX_SIZE:
             raise HTTPException(status_code=413, detail="File too large")
 
-        suffix = os.path.splitext(file.filename or "upload")[1].lower()
-        if suffix == "":
-            suffix = ".jpg"
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(contents)
-            tmp_path = tmp.name
-
-
         model_dir = os.environ.get("OV_VISION_MODEL_DIR")
-        cache_root = os.path.join(os.path.expanduser("~"), ".cache", "modelscope", "hub", "models")
-        chosen_model = None
-        if model_id:
-            if os.path.isdir(model_id):
-                chosen_model = model_id
-            else:
-                cached = os.path.join(cache_root, model_id.replace("/", os.sep))
-                chosen_model = cached if os.path.isdir(cached) else model_id
-        elif model_dir and os.path.isdir(model_dir):
-            chosen_model = model_dir
-        else:
-            default_id = "OpenVINO/Phi-3.5-vision-instruct-int4-ov"
-            cached_def = os.path.join(cache_root, default_id.replace("/", os.sep))
-            chosen_model = cached_def if os.path.isdir(cached_def) else default_id
+        chosen_model = _resolve_vision_model(model_id)
         if not model_id:
             has_model = False
             try:
@@ -624,195 +1012,20 @@ def vision_analyze(
                 })
 
         try:
-            from optimum.intel.openvino import OVModelForVisualCausalLM
-            from modelscope import AutoProcessor
-            from PIL import Image
-            requested_device = (device or os.environ.get("OV_DEVICE") or "GPU").upper()
-            core = Core()
-            available = core.available_devices
-            device = requested_device if requested_device in available else "CPU"
-            strict = strict_device or (os.environ.get("OV_STRICT_DEVICE", "0") == "1")
-            if strict and device != requested_device:
-                raise RuntimeError(f"Requested device {requested_device} not available: {available}")
-            processor = AutoProcessor.from_pretrained(chosen_model, trust_remote_code=True)
-            ov_model = OVModelForVisualCausalLM.from_pretrained(chosen_model, trust_remote_code=True, device=device)
-            img = Image.open(tmp_path).convert("RGB")
-            labels = [
-                "兴奋捕猎","友好呼唤","吵架","好吃","委屈","想玩耍","打招呼","打架预备",
-                "撒娇","无聊","求偶","求救","满足","着急","舒服","警告","走开","饿了"
-            ]
-            if mode == "raw":
-                prompt = "<|image_1|>\nWhat is unusual on this picture?"
-            else:
-                prompt = (
-                    "<|image_1|>\n"
-                    + "请分析这张猫咪图片，从以下18个标签中选择一个最匹配的："
-                    + ",".join(labels)
-                    + "。仅输出一个不带任何代码块标记和反引号的纯JSON对象，不得输出额外文字或数组。"
-                    + "JSON字段要求：{"
-                    + "\"emotion\": 以上标签之一,"
-                    + "\"confidence\": 0-100 的整数,"
-                    + "\"description\": 用中文简要说明(不超过40字),"
-                    + "\"tips\": [3条中文建议，每条不超过12字]"
-                    + "}."
-                )
-            inputs = ov_model.preprocess_inputs(text=prompt, image=img, processor=processor)
-            generate_ids = ov_model.generate(
-                **inputs,
-                eos_token_id=processor.tokenizer.eos_token_id,
-                max_new_tokens=120,
-                temperature=0.0,
-                do_sample=False,
-            )
-            generate_ids = generate_ids[:, inputs['input_ids'].shape[1]:]
-            text = processor.batch_decode(generate_ids, skip_special_tokens=True, clean_up_tokenization_spaces=False)[0]
-            if mode == "raw":
-                return JSONResponse(content={
-                    "response": text,
-                    "model_dir": chosen_model,
-                    "device": device,
-                    "available_devices": available
-                })
-            parsed = None
-            parsed_list = None
-            try:
-                import re, json
-                clean = re.sub(r"```[\s\S]*?```", "", text)
-                m_arr = re.search(r"\[[\s\S]*?\]", clean)
-                if m_arr:
-                    parsed_list = json.loads(m_arr.group(0))
-                else:
-                    m_obj = re.search(r"\{[\s\S]*?\}", clean)
-                    if m_obj:
-                        parsed = json.loads(m_obj.group(0))
-            except Exception:
-                parsed = None
-            if parsed_list:
-                candidate = None
-                try:
-                    for item in parsed_list:
-                        if isinstance(item, dict) and ("emotion" in item or "confidence" in item):
-                            candidate = item
-                            break
-                    if candidate is None:
-                        for item in parsed_list:
-                            if isinstance(item, dict):
-                                candidate = item
-                                break
-                except Exception:
-                    candidate = None
-                if candidate:
-                    emo = candidate.get("emotion") or "满足"
-                    conf = candidate.get("confidence") or 0
-                    try:
-                        conf = int(conf)
-                    except Exception:
-                        conf = 0
-                    if conf < 0:
-                        conf = 0
-                    if conf > 100:
-                        conf = 100
-                    desc = candidate.get("description") or ""
-                    desc = str(desc).strip()[:40]
-                    tips = candidate.get("tips") or []
-                    if isinstance(tips, list):
-                        tips = [str(t).strip()[:12] for t in tips][:3]
-                    else:
-                        tips = []
-                    if emo not in labels:
-                        for l in labels:
-                            if l in text:
-                                emo = l
-                                break
-                    return JSONResponse(content={
-                        "emotion": emo,
-                        "confidence": conf,
-                        "description": desc,
-                        "tips": tips,
-                        "model_dir": chosen_model,
-                        "device": device,
-                        "available_devices": available,
-                        "raw_text": text
-                    })
-            if parsed:
-                emo = parsed.get("emotion") or "满足"
-                conf = parsed.get("confidence") or 0
-                try:
-                    conf = int(conf)
-                except Exception:
-                    conf = 0
-                if conf < 0:
-                    conf = 0
-                if conf > 100:
-                    conf = 100
-                desc = parsed.get("description") or ""
-                desc = str(desc).strip()[:40]
-                tips = parsed.get("tips") or []
-                if isinstance(tips, list):
-                    tips = [str(t).strip()[:12] for t in tips][:3]
-                else:
-                    tips = []
-                if emo not in labels:
-                    for l in labels:
-                        if l in text:
-                            emo = l
-                            break
-                return JSONResponse(content={
-                    "emotion": emo,
-                    "confidence": conf,
-                    "description": desc,
-                    "tips": tips,
-                    "model_dir": chosen_model,
-                    "device": device,
-                    "available_devices": available,
-                    "raw_text": text
-                })
-            chosen = None
-            import re
-            mc = re.search(r"confidence[^0-9]*(\d{1,3})", text, re.IGNORECASE)
-            conf_val = 0
-            if mc:
-                try:
-                    conf_val = int(mc.group(1))
-                except Exception:
-                    conf_val = 0
-            if conf_val < 0:
-                conf_val = 0
-            if conf_val > 100:
-                conf_val = 100
-            for l in labels:
-                if l in text:
-                    chosen = l
-                    break
-            if not chosen:
-                emo_from_text = None
-                try:
-                    import re
-                    m_emo = re.search(r"\"emotion\"\s*:\s*\"([^\"]+)\"", text)
-                    if m_emo:
-                        emo_from_text = m_emo.group(1)
-                except Exception:
-                    emo_from_text = None
-                return JSONResponse(content={
-                    "emotion": emo_from_text or "满足",
-                    "confidence": conf_val,
-                    "description": text,
-                    "tips": [],
-                    "model_dir": chosen_model,
-                    "device": device,
-                    "available_devices": available,
-                    "raw_text": text
-                })
-            return JSONResponse(content={
-                "emotion": chosen,
-                "confidence": conf_val,
-                "description": text,
-                "tips": [],
-                "model_dir": chosen_model,
-                "device": device,
-                "available_devices": available,
-                "raw_text": text
-            })
+            # 枚举设备会创建 openvino Core，不在事件循环上执行
+            device, available = await run_in_threadpool(_select_vision_device, device, strict_device)
+            key = None
+            if result_cache is not None:
+                key = make_key("vision", contents, model_dir=chosen_model, device=device, mode=mode)
+                cached, tier = await run_in_threadpool(result_cache.get, key)
+                if cached is not None:
+                    return JSONResponse(content=cached, headers=_cache_headers(tier))
+            result = await accel_executor.run(_run_vision_model, contents, chosen_model, device, available, mode)
+            if key is not None:
+                await run_in_threadpool(result_cache.put, key, result)
+            return JSONResponse(content=result, headers=_cache_headers(None))
+        except QueueFullError as e:
+            raise _busy(e)
         except Exception as e:
             return JSONResponse(content={
                 "emotion": "分析失败",
@@ -829,9 +1042,3 @@ def vision_analyze(
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Vision analyze failed: {e}")
-    finally:
-        try:
-            if 'tmp_path' in locals() and os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            pass
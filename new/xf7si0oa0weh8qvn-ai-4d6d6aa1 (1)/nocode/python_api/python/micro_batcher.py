@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+情绪预测微批处理调度器
+
+把并发到达的 /predict、/translate 请求在一个很短的时间窗口内攒成一批：
+音频解码在线程池中并行执行，随后对堆叠后的波形做一次批量特征提取
+和一次 scaler + predict_proba，再把结果分发回各请求的 Future。
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+import numpy as np
+
+from executors import QueueFullError
+
+
+def _fail(future, exc):
+    """把异常交给尚未完成的 Future；已完成或已被调用方取消的跳过"""
+    try:
+        if not future.done():
+            future.set_exception(exc)
+    except InvalidStateError:
+        pass
+
+
+class _PendingRequest:
+    def __init__(self, source):
+        self.source = source
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class MicroBatcher:
+    def __init__(self, predictor, max_batch_size=None, window_ms=None, workers=None, executor=None, max_queue=None):
+        """
+        Args:
+            predictor: 已加载模型的 AudioEmotionPredictor
+            max_batch_size: 单批最大请求数，默认读取 PREDICT_BATCH_SIZE（16）
+            window_ms: 攒批等待窗口（毫秒），默认读取 PREDICT_BATCH_WINDOW_MS（5）
+            workers: 音频解码线程数，默认读取 PREDICT_FEATURE_WORKERS（CPU 核数）；传入 executor 时取其线程数
+            executor: 共享的 InferenceExecutor，解码任务占用它的槽位，满载时对应请求以 QueueFullError 失败；
+                为空时按 workers 自建线程池
+            max_queue: 最多排队的请求数，默认读取 PREDICT_QUEUE_SIZE（64），超出时 submit 抛出 QueueFullError
+        """
+        if max_batch_size is None:
+            max_batch_size = int(os.environ.get("PREDICT_BATCH_SIZE", "16"))
+        if window_ms is None:
+            window_ms = float(os.environ.get("PREDICT_BATCH_WINDOW_MS", "5"))
+        if workers is None and executor is not None:
+            workers = executor.max_workers
+        if workers is None:
+            workers = int(os.environ.get("PREDICT_FEATURE_WORKERS", "0")) or (os.cpu_count() or 1)
+        if max_queue is None:
+            max_queue = int(os.environ.get("PREDICT_QUEUE_SIZE", "64"))
+        self.predictor = predictor
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000.0
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self._queue = queue.Queue()
+        self._shared_pool = executor
+        self._pool = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.batch_size_hist = {}
+        self.total_queue_wait_ms = 0.0
+        self.total_batch_ms = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._pool = self._shared_pool or ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="feature")
+        self._thread = threading.Thread(target=self._run, name="predict-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._pool is not None and self._pool is not self._shared_pool:
+            self._pool.shutdown(wait=False)
+        self._pool = None
+        # 停止后仍在排队的请求直接失败，避免调用方永久等待
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            _fail(item.future, RuntimeError("predict batcher stopped"))
+
+    def submit(self, source):
+        """
+        提交一个预测请求
+
+        Args:
+            source: 传给 predictor.load_audio 的音频（文件路径或 BytesIO）
+
+        Returns:
+            Future: 结果为 predict_emotion 同格式的 dict
+        """
+        if self._thread is None:
+            raise RuntimeError("predict batcher not started")
+        if self._queue.qsize() >= self.max_queue:
+            with self._stats_lock:
+                self.rejected += 1
+            raise QueueFullError("predict queue full")
+        item = _PendingRequest(source)
+        self._queue.put(item)
+        with self._stats_lock:
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return item.future
+
+    def predict(self, source, timeout=None):
+        """提交请求并阻塞等待结果"""
+        return self.submit(source).result(timeout=timeout)
+
+    def _collect(self):
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                self._process(batch)
+            except Exception as e:
+                # 单批出错不能让调度线程退出，否则之后的请求都会永久等待
+                print(f"预测批处理失败: {e}")
+                for item in batch:
+                    _fail(item.future, e)
+
+    def _load_all(self, items):
+        """在线程池中并行解码；共享执行器满载时该项返回 QueueFullError"""
+        pending = []
+        for item in items:
+            try:
+                pending.append(self._pool.submit(self.predictor.load_audio, item.source))
+            except QueueFullError as e:
+                pending.append(e)
+        return [p if isinstance(p, QueueFullError) else p.result() for p in pending]
+
+    def _process(self, batch):
+        t0 = time.monotonic()
+        # 先占住每个 Future；调用方已取消（客户端断开、超时）的请求直接跳过，之后也不会再被取消
+        items = [item for item in batch if item.future.set_running_or_notify_cancel()]
+        try:
+            clips = self._load_all(items)
+            ok = [i for i, y in enumerate(clips) if isinstance(y, np.ndarray)]
+            results = [{'success': False, 'error': '音频特征提取失败'} for _ in items]
+            if ok:
+                # 解码结果堆叠后只做一次共享 STFT 的批量特征提取
+                features = self.predictor.extract_audio_features_batch(np.stack([clips[i] for i in ok]))
+                predicted = self.predictor.predict_features(features)
+                for i, res in zip(ok, predicted):
+                    results[i] = res
+            for item, y, res in zip(items, clips, results):
+                if isinstance(y, QueueFullError):
+                    item.future.set_exception(y)
+                else:
+                    item.future.set_result(res)
+        except Exception as e:
+            for item in items:
+                _fail(item.future, e)
+        t1 = time.monotonic()
+        with self._stats_lock:
+            self.batches += 1
+            self.batch_size_hist[len(batch)] = self.batch_size_hist.get(len(batch), 0) + 1
+            self.total_queue_wait_ms += sum((t0 - item.enqueued_at) * 1000 for item in batch)
+            self.total_batch_ms += (t1 - t0) * 1000
+            for item in batch:
+                if item.future.cancelled():
+                    self.cancelled += 1
+                elif item.future.done() and item.future.exception() is None and item.future.result().get('success'):
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def stats(self):
+        with self._stats_lock:
+            done = self.completed + self.failed + self.cancelled
+            return {
+                "max_batch_size": self.max_batch_size,
+                "window_ms": self.window * 1000,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "rejected": self.rejected,
+                "batches": self.batches,
+                "avg_batch_size": (done / self.batches) if self.batches else 0.0,
+                "batch_size_hist": {str(k): v for k, v in sorted(self.batch_size_hist.items())},
+                "avg_queue_wait_ms": (self.total_queue_wait_ms / done) if done else 0.0,
+                "avg_batch_ms": (self.total_batch_ms / self.batches) if self.batches else 0.0,
+            }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+把 StandardScaler + RandomForestClassifier 编译为 OpenVINO 模型
+
+OpenVINO 不支持 ONNX-ML 的 TreeEnsemble 算子，因此这里直接用基础算子构图：
+所有树的节点拼成一维表，按最大深度展开 Gather / GatherElements / Select 做逐层遍历，
+到达叶子后取出各类别概率并对所有树求平均（与 predict_proba 相同）。
+StandardScaler 折叠进每个节点的阈值，图的输入即为原始特征，输出为各类别概率，
+batch 维是动态的，可以一次推理一整批请求。
+
+用法:
+  python ov_classifier.py --model-dir ../models   # 生成 ../models/emotion_classifier.xml/.bin
+"""
+
+import argparse
+import os
+import pickle
+import threading
+
+import numpy as np
+import openvino as ov
+import openvino.runtime.opset13 as ops
+
+OV_MODEL_NAME = 'emotion_classifier.xml'
+
+
+def _forest_tables(model, scaler):
+    """
+    把所有树的节点拼成一维表
+
+    Returns:
+        tuple: (根节点下标, 特征下标, 阈值, 左子节点, 右子节点, 叶子概率, 最大深度)
+    """
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(scaler.n_features_in_)
+    scale = scaler.scale_ if scaler.with_std else np.ones(scaler.n_features_in_)
+    roots, features, thresholds, lefts, rights, values = [], [], [], [], [], []
+    offset = 0
+    depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        node_ids = np.arange(offset, offset + n)
+        is_leaf = tree.children_left == -1
+        feature = np.where(is_leaf, 0, tree.feature)
+        # scaled <= t  等价于  raw <= t * scale + mean（scale 恒为正）
+        threshold = np.where(is_leaf, 0.0, tree.threshold * scale[feature] + mean[feature])
+        roots.append(offset)
+        features.append(feature)
+        thresholds.append(threshold)
+        # 叶子节点的左右子节点指向自身，展开到最大深度后停留在叶子上
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+        rights.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+        value = tree.value[:, 0, :]
+        values.append(value / np.maximum(value.sum(axis=1, keepdims=True), np.finfo(np.float64).tiny))
+        depth = max(depth, tree.max_depth)
+        offset += n
+    return (
+        np.array(roots, dtype=np.int32),
+        np.concatenate(features).astype(np.int32),
+        np.concatenate(thresholds).astype(np.float32),
+        np.concatenate(lefts).astype(np.int32),
+        np.concatenate(rights).astype(np.int32),
+        np.concatenate(values).astype(np.float32),
+        depth,
+    )
+
+
+def build_forest_model(model, scaler):
+    """
+    构建 scaler + 随机森林的 OpenVINO 模型
+
+    Args:
+        model: 已训练的 RandomForestClassifier
+        scaler: 已拟合的 StandardScaler
+
+    Returns:
+        ov.Model: 输入 features (batch, feature_dim) f32，输出 probabilities (batch, n_classes)
+    """
+    roots, feature, threshold, left, right, values, depth = _forest_tables(model, scaler)
+    n_trees = len(roots)
+
+    x = ops.parameter([-1, scaler.n_features_in_], ov.Type.f32, name='features')
+    batch = ops.gather(ops.shape_of(x, ov.Type.i32), ops.constant(np.array([0], dtype=np.int32)), 0)
+    target_shape = ops.concat([batch, ops.constant(np.array([n_trees], dtype=np.int32))], 0)
+    idx = ops.broadcast(ops.constant(roots), target_shape)
+
+    feature_c, threshold_c = ops.constant(feature), ops.constant(threshold)
+    left_c, right_c = ops.constant(left), ops.constant(right)
+    for _ in range(depth):
+        x_val = ops.gather_elements(x, ops.gather(feature_c, idx, 0), 1)
+        go_left = ops.less_equal(x_val, ops.gather(threshold_c, idx, 0))
+        idx = ops.select(go_left, ops.gather(left_c, idx, 0), ops.gather(right_c, idx, 0))
+
+    leaf_values = ops.gather(ops.constant(values), idx, 0)
+    probabilities = ops.reduce_mean(leaf_values, ops.constant(np.array([1], dtype=np.int32)), False)
+    probabilities.output(0).get_tensor().set_names({'probabilities'})
+    return ov.Model([probabilities], [x], 'emotion_classifier')
+
+
+def export_classifier(model_dir='../models', output_path=None):
+    """
+    从 pickle 模型导出 OpenVINO IR
+
+    Args:
+        model_dir: 包含 emotion_classifier.pkl 与 scaler.pkl 的模型目录
+        output_path: 输出 xml 路径，默认 model_dir/emotion_classifier.xml
+
+    Returns:
+        str: 输出 xml 路径
+    """
+    with open(os.path.join(model_dir, 'emotion_classifier.pkl'), 'rb') as f:
+        model = pickle.load(f)
+    with open(os.path.join(model_dir, 'scaler.pkl'), 'rb') as f:
+        scaler = pickle.load(f)
+    output_path = output_path or os.path.join(model_dir, OV_MODEL_NAME)
+    # 阈值必须保持 f32，不能使用默认的 fp16 权重压缩
+    ov.save_model(build_forest_model(model, scaler), output_path, compress_to_fp16=False)
+    return output_path
+
+
+class OVEmotionClassifier:
+    def __init__(self, model_path, device='CPU'):
+        """
+        Args:
+            model_path: export_classifier 生成的 xml 路径
+            device: OpenVINO 设备名，如 CPU、GPU（NPU 不支持动态 batch）
+        """
+        self.model_path = model_path
+        self.device = device
+        # 阈值比较对精度敏感，禁止插件默认的 bf16/f16 推理精度
+        self._compiled = ov.Core().compile_model(model_path, device, {'INFERENCE_PRECISION_HINT': 'f32'})
+        self._request = self._compiled.create_infer_request()
+        self._lock = threading.Lock()
+
+    def predict_proba(self, features):
+        """
+        Args:
+            features: (batch, feature_dim) 原始（未标准化）特征矩阵
+
+        Returns:
+            np.ndarray: (batch, n_classes) 概率，列顺序与 model.classes_ 一致
+        """
+        x = np.ascontiguousarray(features, dtype=np.float32)
+        with self._lock:
+            result = self._request.infer({0: x})
+            return np.array(result[self._compiled.output(0)], dtype=np.float64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出情绪分类器为 OpenVINO 模型')
+    parser.add_argument('--model-dir', default='../models', help='模型目录路径')
+    parser.add_argument('--output', help='输出 xml 路径（默认写入模型目录）')
+    args = parser.parse_args()
+    print(f"已导出: {export_classifier(args.model_dir, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
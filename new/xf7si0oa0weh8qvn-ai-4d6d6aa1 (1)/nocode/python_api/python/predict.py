@@ -12,15 +12,26 @@ import sys
 import json
 import pickle
 import numpy as np
-import librosa
 import argparse
 from pathlib import Path
 import warnings
 warnings.filterwarnings('ignore')
 
+from audio_features import SAMPLE_RATE, load_clip, extract_features_batch, fit_feature_dim
+
 class AudioEmotionPredictor:
-    def __init__(self, model_dir='../models'):
+    def __init__(self, model_dir='../models', backend=None, device=None):
+        """
+        Args:
+            model_dir: 模型目录路径
+            backend: 分类器后端 'sklearn' 或 'openvino'，默认读取 PREDICT_BACKEND（sklearn）；
+                'openvino' 需要先用 ov_classifier.py 导出 emotion_classifier.xml
+            device: OpenVINO 设备，默认读取 PREDICT_DEVICE（CPU）
+        """
         self.model_dir = model_dir
+        self.backend = backend or os.environ.get("PREDICT_BACKEND", "sklearn")
+        self.device = device or os.environ.get("PREDICT_DEVICE", "CPU")
+        self.ov_classifier = None
         self.model = None
         self.scaler = None
         self.label_encoder = None
@@ -60,6 +71,9 @@ class AudioEmotionPredictor:
             with open(config_path, 'r', encoding='utf-8') as f:
                 self.config = json.load(f)
             
+            if self.backend == 'openvino':
+                self._load_ov_classifier()
+            
             self.is_loaded = True
             return True
             
@@ -67,135 +81,78 @@ class AudioEmotionPredictor:
             print(f"加载模型失败: {e}")
             return False
     
+    def _load_ov_classifier(self):
+        """加载导出的 OpenVINO 分类器，不可用时回退到 sklearn"""
+        try:
+            from ov_classifier import OV_MODEL_NAME, OVEmotionClassifier
+            ov_path = os.path.join(self.model_dir, OV_MODEL_NAME)
+            if not os.path.exists(ov_path):
+                print(f"未找到 OpenVINO 分类器 {ov_path}，使用 sklearn 后端")
+                return
+            self.ov_classifier = OVEmotionClassifier(ov_path, self.device)
+        except Exception as e:
+            print(f"加载 OpenVINO 分类器失败，使用 sklearn 后端: {e}")
+            self.ov_classifier = None
+    
+    def load_audio(self, audio_path, duration=3.0):
+        """
+        解码音频并截断/填充到固定时长，供批量特征提取使用
+        
+        Args:
+            audio_path: 音频文件路径，或上传内容的 BytesIO（name 属性用于判断格式）
+            duration: 音频时长（秒）
+            
+        Returns:
+            y: 一维波形，解码失败时为 None
+        """
+        try:
+            return load_clip(audio_path, duration=duration, sr=SAMPLE_RATE)
+        except Exception as e:
+            print(f"加载音频失败 {audio_path}: {e}")
+            return None
+    
     def extract_audio_features(self, audio_path, duration=3.0):
         """
         提取音频特征（与训练时保持一致）
         
         Args:
-            audio_path: 音频文件路径
+            audio_path: 音频文件路径，或上传内容的 BytesIO（name 属性用于判断格式）
             duration: 音频时长（秒）
             
         Returns:
             features: 特征向量
         """
+        y = self.load_audio(audio_path, duration=duration)
+        if y is None:
+            return None
         try:
-            # 加载音频文件
-            y, sr = librosa.load(audio_path, duration=duration, sr=22050)
-            
-            # 如果音频太短，进行填充
-            if len(y) < sr * duration:
-                y = np.pad(y, (0, int(sr * duration - len(y))), mode='constant')
-            
-            features = []
-            
-            # 1. MFCC特征
-            mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-            features.extend([
-                np.mean(mfccs, axis=1),
-                np.std(mfccs, axis=1),
-                np.max(mfccs, axis=1),
-                np.min(mfccs, axis=1)
-            ])
-            
-            # 2. 色度特征
-            chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-            features.extend([
-                np.mean(chroma, axis=1),
-                np.std(chroma, axis=1)
-            ])
-            
-            # 3. 梅尔频谱特征
-            mel = librosa.feature.melspectrogram(y=y, sr=sr)
-            features.extend([
-                np.mean(mel, axis=1),
-                np.std(mel, axis=1)
-            ])
-            
-            # 4. 谱质心
-            spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)
-            features.extend([
-                np.mean(spectral_centroids),
-                np.std(spectral_centroids)
-            ])
-            
-            # 5. 谱带宽
-            spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)
-            features.extend([
-                np.mean(spectral_bandwidth),
-                np.std(spectral_bandwidth)
-            ])
-            
-            # 6. 谱对比度
-            spectral_contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-            features.extend([
-                np.mean(spectral_contrast, axis=1),
-                np.std(spectral_contrast, axis=1)
-            ])
-            
-            # 7. 谱滚降
-            spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)
-            features.extend([
-                np.mean(spectral_rolloff),
-                np.std(spectral_rolloff)
-            ])
-            
-            # 8. 零交叉率
-            zcr = librosa.feature.zero_crossing_rate(y)
-            features.extend([
-                np.mean(zcr),
-                np.std(zcr)
-            ])
-            
-            # 9. 基频特征
-            pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
-            pitch_values = []
-            for t in range(pitches.shape[1]):
-                index = magnitudes[:, t].argmax()
-                pitch = pitches[index, t]
-                if pitch > 0:
-                    pitch_values.append(pitch)
-            
-            if pitch_values:
-                features.extend([
-                    np.mean(pitch_values),
-                    np.std(pitch_values),
-                    np.max(pitch_values),
-                    np.min(pitch_values)
-                ])
-            else:
-                features.extend([0, 0, 0, 0])
-            
-            # 10. 能量特征
-            energy = np.sum(y ** 2) / len(y)
-            features.append(energy)
-            
-            # 展平所有特征
-            flattened_features = []
-            for feature in features:
-                if isinstance(feature, np.ndarray):
-                    flattened_features.extend(feature.flatten())
-                else:
-                    flattened_features.append(feature)
-            
-            # 确保特征维度与训练时一致
-            target_dim = self.config.get('feature_dim', 200)
-            if len(flattened_features) < target_dim:
-                flattened_features.extend([0] * (target_dim - len(flattened_features)))
-            elif len(flattened_features) > target_dim:
-                flattened_features = flattened_features[:target_dim]
-            
-            return np.array(flattened_features)
+            return self.extract_audio_features_batch(y[np.newaxis, :])[0]
             
         except Exception as e:
             print(f"提取特征失败 {audio_path}: {e}")
             return None
     
+    def extract_audio_features_batch(self, clips):
+        """
+        批量提取音频特征，所有频谱特征共用一次 STFT
+        
+        Args:
+            clips: (batch, samples) 的已填充波形数组
+            
+        Returns:
+            features: (batch, feature_dim) 特征矩阵
+        """
+        features = extract_features_batch(clips, sr=SAMPLE_RATE)
+        # 确保特征维度与训练时一致
+        target_dim = self.config.get('feature_dim', 200)
+        return fit_feature_dim(features, target_dim)
+    
     def predict_emotion(self, audio_path, animal_type=None):
         """
         预测音频的情绪
         
         Args:
-            audio_path: 音频文件路径
+            audio_path: 音频文件路径，或上传内容的 BytesIO
             animal_type: 动物类型 ('cat' 或 'dog')，如果为None则自动检测
             
         Returns:
@@ -216,55 +173,75 @@ class AudioEmotionPredictor:
                 'error': '音频特征提取失败'
             }
         
-        try:
-            # 预处理特征
-            features_scaled = self.scaler.transform([features])
-            
-            # 预测
-            prediction = self.model.predict(features_scaled)[0]
-            probabilities = self.model.predict_proba(features_scaled)[0]
-            
-            # 解码预测结果
-            predicted_label = self.label_encoder.inverse_transform([prediction])[0]
+        return self.predict_features(features[np.newaxis, :])[0]
+    
+    def predict_features(self, features):
+        """
+        对已提取的特征矩阵批量预测，只调用一次 scaler 与 predict_proba
+        
+        Args:
+            features: (batch, feature_dim) 特征矩阵
             
-            # 解析动物类型和情绪
-            if '_' in predicted_label:
-                pred_animal, pred_emotion = predicted_label.split('_', 1)
+        Returns:
+            list: 每行对应一个预测结果 dict
+        """
+        try:
+            if self.ov_classifier is not None:
+                # 标准化已折叠进 OpenVINO 图，一次推理得到整批概率
+                probabilities = self.ov_classifier.predict_proba(features)
             else:
-                pred_animal = 'unknown'
-                pred_emotion = predicted_label
-            
-            # 获取置信度
-            confidence = float(np.max(probabilities))
-            
-            # 获取所有可能的情绪及其概率
-            all_emotions = {}
-            for i, prob in enumerate(probabilities):
-                label = self.label_encoder.inverse_transform([i])[0]
-                if '_' in label:
-                    animal, emotion = label.split('_', 1)
-                    if animal == pred_animal:  # 只显示同类动物的情绪
-                        # 直接使用中文情绪名称
-                        all_emotions[emotion] = float(prob)
+                # 预处理特征
+                features_scaled = self.scaler.transform(features)
+                
+                # 预测（predict 等价于取 predict_proba 的最大类别）
+                probabilities = self.model.predict_proba(features_scaled)
+            predictions = self.model.classes_[np.argmax(probabilities, axis=1)]
             
-            # 情绪名称就是中文名称
-            emotion_name = pred_emotion
-            
-            return {
-                'success': True,
-                'animal': pred_animal,
-                'emotion': pred_emotion,
-                'emotion_name': emotion_name,
-                'confidence': confidence,
-                'all_emotions': all_emotions,
-                'raw_prediction': predicted_label
-            }
+            return [self._format_prediction(pred, prob) for pred, prob in zip(predictions, probabilities)]
             
         except Exception as e:
-            return {
+            return [{
                 'success': False,
                 'error': f'预测失败: {str(e)}'
-            }
+            } for _ in range(len(features))]
+    
+    def _format_prediction(self, prediction, probabilities):
+        # 解码预测结果
+        labels = self.label_encoder.classes_
+        predicted_label = labels[prediction]
+        
+        # 解析动物类型和情绪
+        if '_' in predicted_label:
+            pred_animal, pred_emotion = predicted_label.split('_', 1)
+        else:
+            pred_animal = 'unknown'
+            pred_emotion = predicted_label
+        
+        # 获取置信度
+        confidence = float(np.max(probabilities))
+        
+        # 获取所有可能的情绪及其概率
+        all_emotions = {}
+        for i, prob in enumerate(probabilities):
+            label = labels[i]
+            if '_' in label:
+                animal, emotion = label.split('_', 1)
+                if animal == pred_animal:  # 只显示同类动物的情绪
+                    # 直接使用中文情绪名称
+                    all_emotions[emotion] = float(prob)
+        
+        # 情绪名称就是中文名称
+        emotion_name = pred_emotion
+        
+        return {
+            'success': True,
+            'animal': pred_animal,
+            'emotion': pred_emotion,
+            'emotion_name': emotion_name,
+            'confidence': confidence,
+            'all_emotions': all_emotions,
+            'raw_prediction': str(predicted_label)
+        }
     
     def get_available_emotions(self, animal_type=None):
         """
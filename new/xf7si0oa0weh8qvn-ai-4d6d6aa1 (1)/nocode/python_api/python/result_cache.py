@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按上传内容寻址的推理结果缓存
+
+同一段音频/同一张图片反复上传（重试、分享、演示循环）时直接返回之前的结果。
+缓存键 = 上传内容的 sha256 + 模型/设备/模式等参数；
+内存 LRU 为第一层，可选的 sqlite 文件为第二层，两层都有 TTL 与容量上限。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_key(kind, contents, **params):
+    """
+    生成缓存键
+
+    Args:
+        kind: 结果类型，如 'emotion'、'vision'
+        contents: 上传内容 bytes
+        params: 影响结果的参数（模型、设备、模式等）
+
+    Returns:
+        str: 缓存键
+    """
+    digest = hashlib.sha256(contents).hexdigest()
+    suffix = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{kind}:{digest}:{hashlib.sha1(suffix.encode('utf-8')).hexdigest()}"
+
+
+class _SqliteTier:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results(accessed)")
+        self._conn.commit()
+
+    def get(self, key, ttl):
+        """返回 (value, created)，不存在或已过期时为 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if ttl > 0 and now - row[1] > ttl:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0], row[1]
+
+    def put(self, key, value, created):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), created, created),
+            )
+            self._trim_locked()
+            self._conn.commit()
+
+    def _trim_locked(self):
+        if self.max_bytes <= 0:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 按最近访问时间从旧到新删除，直到回到上限以内
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+
+class ResultCache:
+    def __init__(self, ttl=None, max_items=None, max_mb=None, db_path=None, db_max_mb=None):
+        """
+        Args:
+            ttl: 过期时间（秒），默认读取 RESULT_CACHE_TTL（86400），0 表示不过期
+            max_items: 内存层最多条目数，默认读取 RESULT_CACHE_MAX_ITEMS（1024）
+            max_mb: 内存层容量上限（MB），默认读取 RESULT_CACHE_MAX_MB（64）
+            db_path: sqlite 文件路径，默认读取 RESULT_CACHE_DB，为空则不启用磁盘层
+            db_max_mb: 磁盘层容量上限（MB），默认读取 RESULT_CACHE_DB_MAX_MB（512）
+        """
+        self.ttl = float(os.environ.get("RESULT_CACHE_TTL", "86400") if ttl is None else ttl)
+        self.max_items = int(os.environ.get("RESULT_CACHE_MAX_ITEMS", "1024") if max_items is None else max_items)
+        max_mb = float(os.environ.get("RESULT_CACHE_MAX_MB", "64") if max_mb is None else max_mb)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        db_path = os.environ.get("RESULT_CACHE_DB") if db_path is None else db_path
+        db_max_mb = float(os.environ.get("RESULT_CACHE_DB_MAX_MB", "512") if db_max_mb is None else db_max_mb)
+        self._disk = _SqliteTier(db_path, int(db_max_mb * 1024 * 1024)) if db_path else None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key):
+        """
+        查询缓存
+
+        Returns:
+            tuple: (结果 dict, 命中层 'memory' / 'disk')，未命中时为 (None, None)
+        """
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                value, created = item
+                if self.ttl > 0 and now - created > self.ttl:
+                    self._remove_locked(key)
+                    self.expired += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return json.loads(value), "memory"
+        if self._disk is not None:
+            row = self._disk.get(key, self.ttl)
+            if row is not None:
+                value, created = row
+                with self._lock:
+                    self.disk_hits += 1
+                    # 沿用磁盘记录的创建时间，提升到内存层不会延长 TTL
+                    self._insert_locked(key, value, created)
+                return json.loads(value), "disk"
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def put(self, key, result):
+        """写入两层缓存，result 需可 JSON 序列化"""
+        value = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._insert_locked(key, value, now)
+            self.stores += 1
+        if self._disk is not None:
+            self._disk.put(key, value, now)
+
+    def _insert_locked(self, key, value, created):
+        if key in self._entries:
+            self._remove_locked(key)
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = (value, created)
+        self._bytes += len(value)
+        while len(self._entries) > self.max_items or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove_locked(oldest)
+            self.evictions += 1
+
+    def _remove_locked(self, key):
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            stats = {
+                "ttl": self.ttl,
+                "memory_items": len(self._entries),
+                "memory_mb": round(self._bytes / (1024 * 1024), 3),
+                "max_items": self.max_items,
+                "max_mb": self.max_bytes / (1024 * 1024),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": ((self.memory_hits + self.disk_hits) / lookups) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+        if self._disk is not None:
+            items, size = self._disk.count()
+            stats.update({
+                "disk_path": self._disk.path,
+                "disk_items": items,
+                "disk_mb": round(size / (1024 * 1024), 3),
+                "disk_max_mb": self._disk.max_bytes / (1024 * 1024),
+            })
+        return stats
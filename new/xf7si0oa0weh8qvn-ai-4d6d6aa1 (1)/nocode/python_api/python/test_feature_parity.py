@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+特征提取一致性测试
+
+校验共享 STFT 的批量特征提取与原始逐项 librosa 实现结果一致，
+并确认已保存的 RandomForest 模型在两种特征下给出相同预测。
+
+运行: python -m pytest -q test_feature_parity.py
+"""
+
+import os
+import numpy as np
+
+from audio_features import (
+    SAMPLE_RATE, DURATION, stack_clips, extract_features_batch, extract_features_reference, fit_feature_dim
+)
+from predict import AudioEmotionPredictor
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models')
+
+
+def _make_clips():
+    """生成几段模拟叫声：不同基频的谐波 + 噪声，以及一段偏短的静音"""
+    rng = np.random.RandomState(0)
+    t = np.linspace(0, DURATION, int(SAMPLE_RATE * DURATION))
+    clips = []
+    for base_freq in (220, 440, 880):
+        signal = (
+            0.5 * np.sin(2 * np.pi * base_freq * t) +
+            0.3 * np.sin(2 * np.pi * base_freq * 2 * t) +
+            0.1 * rng.randn(len(t))
+        ) * np.exp(-t / (DURATION * 0.3))
+        clips.append(signal.astype(np.float32))
+    clips.append(np.zeros(int(SAMPLE_RATE * 1.5), dtype=np.float32))
+    return stack_clips(clips)
+
+
+def test_batch_features_match_reference():
+    clips = _make_clips()
+    batch = extract_features_batch(clips)
+    reference = np.stack([extract_features_reference(y) for y in clips])
+    assert batch.shape == reference.shape
+    np.testing.assert_allclose(batch, reference, rtol=1e-5, atol=1e-6)
+
+
+def test_single_clip_matches_batch_row():
+    clips = _make_clips()
+    batch = extract_features_batch(clips)
+    single = extract_features_batch(clips[1])
+    np.testing.assert_allclose(single[0], batch[1], rtol=1e-5, atol=1e-6)
+
+
+def test_saved_model_predictions_unchanged():
+    predictor = AudioEmotionPredictor(MODEL_DIR)
+    assert predictor.load_model()
+    clips = _make_clips()
+    target_dim = predictor.config['feature_dim']
+    reference = fit_feature_dim(np.stack([extract_features_reference(y) for y in clips]), target_dim)
+    batch = predictor.extract_audio_features_batch(clips)
+    assert batch.shape == (len(clips), target_dim)
+    np.testing.assert_allclose(
+        predictor.model.predict_proba(predictor.scaler.transform(batch)),
+        predictor.model.predict_proba(predictor.scaler.transform(reference)),
+        atol=1e-6
+    )
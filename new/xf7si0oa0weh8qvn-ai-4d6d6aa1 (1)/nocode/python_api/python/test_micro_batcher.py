@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+微批调度器测试
+
+用不加载模型的假预测器校验：调用方取消、批处理异常、共享执行器满载
+都只影响对应请求，调度线程继续服务后续请求。
+
+运行: python -m pytest -q test_micro_batcher.py
+"""
+
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from executors import InferenceExecutor, QueueFullError
+from micro_batcher import MicroBatcher
+
+
+class FakePredictor:
+    """source 为数字时返回该值的波形；'bad' 解码失败；'slow' 等待 release 后才返回"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.fail_predict = False
+
+    def load_audio(self, source):
+        if source == 'bad':
+            return None
+        if source == 'slow':
+            self.started.set()
+            assert self.release.wait(5)
+            source = 0
+        return np.full(4, source, dtype=np.float32)
+
+    def extract_audio_features_batch(self, clips):
+        return clips[:, :2]
+
+    def predict_features(self, features):
+        if self.fail_predict:
+            raise RuntimeError("predict failed")
+        return [{'success': True, 'value': float(row[0])} for row in features]
+
+
+@pytest.fixture
+def predictor():
+    return FakePredictor()
+
+
+def _start(predictor, **kwargs):
+    batcher = MicroBatcher(predictor, **{'window_ms': 50, 'workers': 2, **kwargs})
+    batcher.start()
+    return batcher
+
+
+def test_batch_results(predictor):
+    batcher = _start(predictor)
+    try:
+        futures = [batcher.submit(s) for s in (1, 'bad', 3, 'bad')]
+        results = [f.result(timeout=5) for f in futures]
+        assert [r.get('value') for r in results] == [1.0, None, 3.0, None]
+        assert results[1] == results[3] and results[1] is not results[3]
+    finally:
+        batcher.stop()
+
+
+def test_cancel_queued_waiter(predictor):
+    batcher = _start(predictor, window_ms=0)
+    try:
+        # 第一批卡在解码上，后面三个请求在队列中等待下一批
+        first = batcher.submit('slow')
+        assert predictor.started.wait(5)
+        queued = [batcher.submit(s) for s in (1, 2, 3)]
+        assert queued[1].cancel()
+        predictor.release.set()
+        assert first.result(timeout=5)['value'] == 0.0
+        assert queued[0].result(timeout=5)['value'] == 1.0
+        assert queued[2].result(timeout=5)['value'] == 3.0
+        # 调度线程仍然存活
+        assert batcher.submit(4).result(timeout=5)['value'] == 4.0
+        assert batcher.stats()['cancelled'] == 1
+    finally:
+        predictor.release.set()
+        batcher.stop()
+
+
+def test_cancel_waiter_mid_batch(predictor):
+    batcher = _start(predictor, window_ms=200)
+
+    async def client(source, timeout):
+        return await asyncio.wait_for(asyncio.wrap_future(batcher.submit(source)), timeout)
+
+    async def run():
+        tasks = [asyncio.ensure_future(client(s, 5)) for s in ('slow', 1, 2)]
+        # 客户端在批处理进行中超时断开
+        impatient = asyncio.ensure_future(client(3, 0.3))
+        with pytest.raises(asyncio.TimeoutError):
+            await impatient
+        predictor.release.set()
+        return await asyncio.gather(*tasks)
+
+    try:
+        results = asyncio.run(run())
+        assert [r['value'] for r in results] == [0.0, 1.0, 2.0]
+        assert batcher.submit(5).result(timeout=5)['value'] == 5.0
+    finally:
+        predictor.release.set()
+        batcher.stop()
+
+
+def test_failed_batch_keeps_thread(predictor):
+    batcher = _start(predictor)
+    try:
+        predictor.fail_predict = True
+        with pytest.raises(RuntimeError):
+            batcher.submit(1).result(timeout=5)
+        predictor.fail_predict = False
+        assert batcher.submit(2).result(timeout=5)['value'] == 2.0
+    finally:
+        batcher.stop()
+
+
+def test_shared_executor_accounting(predictor):
+    executor = InferenceExecutor('cpu-test', 1, 0)
+    batcher = _start(predictor, executor=executor)
+    try:
+        assert batcher.submit(1).result(timeout=5)['value'] == 1.0
+        assert executor.stats()['submitted'] == 1
+        # 占满执行器唯一的槽位后，解码任务被拒绝，请求以 QueueFullError 失败
+        blocker = executor.submit(predictor.release.wait, 5)
+        with pytest.raises(QueueFullError):
+            batcher.submit(2).result(timeout=5)
+        predictor.release.set()
+        blocker.result(timeout=5)
+        assert batcher.submit(3).result(timeout=5)['value'] == 3.0
+    finally:
+        predictor.release.set()
+        batcher.stop()
+        executor.shutdown()
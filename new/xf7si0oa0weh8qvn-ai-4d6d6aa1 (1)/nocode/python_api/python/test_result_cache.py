@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+结果缓存测试
+
+校验磁盘层命中提升到内存层时沿用原始创建时间，条目按首次写入时间过期。
+
+运行: python -m pytest -q test_result_cache.py
+"""
+
+import time
+
+from result_cache import ResultCache, make_key
+
+
+def test_disk_hit_keeps_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    db_path = str(tmp_path / 'results.db')
+    key = make_key('emotion', b'audio', backend='sklearn')
+
+    ResultCache(ttl=100, db_path=db_path).put(key, {'success': True})
+    # 新进程只有磁盘层，命中后提升到内存层
+    cache = ResultCache(ttl=100, db_path=db_path)
+    now[0] += 60
+    assert cache.get(key) == ({'success': True}, 'disk')
+    now[0] += 30
+    assert cache.get(key) == ({'success': True}, 'memory')
+    # 距首次写入已超过 TTL，两层都不再返回
+    now[0] += 20
+    assert cache.get(key) == (None, None)
+    assert cache.stats()['expired'] == 1
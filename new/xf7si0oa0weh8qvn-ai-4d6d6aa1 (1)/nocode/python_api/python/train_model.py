@@ -10,8 +10,12 @@
 import os
 import sys
 import json
+import time
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 import numpy as np
-import librosa
 import pickle
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split, cross_val_score
@@ -20,9 +24,40 @@ from sklearn.metrics import classification_report, confusion_matrix
 import warnings
 warnings.filterwarnings('ignore')
 
+from audio_features import SAMPLE_RATE, load_clip, extract_features_batch
+from feature_cache import FeatureCache, file_digest
+
+
+def _extract_file_features(audio_path, duration=3.0):
+    """进程池工作函数：加载单个音频并提取特征，失败时返回 None"""
+    try:
+        y = load_clip(audio_path, duration=duration, sr=SAMPLE_RATE)
+        return extract_features_batch(y[np.newaxis, :], sr=SAMPLE_RATE)[0]
+    except Exception as e:
+        print(f"提取特征失败 {audio_path}: {e}")
+        return None
+
+
 class AudioEmotionTrainer:
-    def __init__(self, data_dir='../audio_data'):
+    def __init__(self, data_dir='../audio_data', n_jobs=None, workers=None, cache_path=None):
+        """
+        Args:
+            data_dir: 数据目录
+            n_jobs: 随机森林训练的并行数，默认读取 TRAIN_N_JOBS（-1，使用全部核心）
+            workers: 特征提取进程数，默认读取 TRAIN_WORKERS（CPU 核数），1 表示在当前进程中提取
+            cache_path: 特征缓存 npz 路径，默认读取 TRAIN_FEATURE_CACHE（../feature_cache/train_features.npz），空字符串表示不使用缓存
+        """
+        if n_jobs is None:
+            n_jobs = int(os.environ.get("TRAIN_N_JOBS", "-1"))
+        if workers is None:
+            workers = int(os.environ.get("TRAIN_WORKERS", "0")) or (os.cpu_count() or 1)
+        if cache_path is None:
+            cache_path = os.environ.get("TRAIN_FEATURE_CACHE", os.path.join('..', 'feature_cache', 'train_features.npz'))
         self.data_dir = data_dir
+        self.n_jobs = n_jobs
+        self.workers = max(1, workers)
+        self.cache_path = cache_path
+        self.timings = OrderedDict()
         self.model = None
         self.scaler = StandardScaler()
         self.label_encoder = LabelEncoder()
@@ -73,110 +108,60 @@ class AudioEmotionTrainer:
         Returns:
             features: 特征向量
         """
+        return _extract_file_features(audio_path, duration)
+    
+    @contextmanager
+    def _timed(self, stage):
+        t0 = time.perf_counter()
         try:
-            # 加载音频文件
-            y, sr = librosa.load(audio_path, duration=duration, sr=22050)
-            
-            # 如果音频太短，进行填充
-            if len(y) < sr * duration:
-                y = np.pad(y, (0, int(sr * duration - len(y))), mode='constant')
-            
-            features = []
-            
-            # 1. MFCC特征 (梅尔频率倒谱系数)
-            mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-            features.extend([
-                np.mean(mfccs, axis=1),
-                np.std(mfccs, axis=1),
-                np.max(mfccs, axis=1),
-                np.min(mfccs, axis=1)
-            ])
-            
-            # 2. 色度特征
-            chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-            features.extend([
-                np.mean(chroma, axis=1),
-                np.std(chroma, axis=1)
-            ])
-            
-            # 3. 梅尔频谱特征
-            mel = librosa.feature.melspectrogram(y=y, sr=sr)
-            features.extend([
-                np.mean(mel, axis=1),
-                np.std(mel, axis=1)
-            ])
-            
-            # 4. 谱质心
-            spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)
-            features.extend([
-                np.mean(spectral_centroids),
-                np.std(spectral_centroids)
-            ])
-            
-            # 5. 谱带宽
-            spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)
-            features.extend([
-                np.mean(spectral_bandwidth),
-                np.std(spectral_bandwidth)
-            ])
-            
-            # 6. 谱对比度
-            spectral_contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-            features.extend([
-                np.mean(spectral_contrast, axis=1),
-                np.std(spectral_contrast, axis=1)
-            ])
-            
-            # 7. 谱滚降
-            spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)
-            features.extend([
-                np.mean(spectral_rolloff),
-                np.std(spectral_rolloff)
-            ])
-            
-            # 8. 零交叉率
-            zcr = librosa.feature.zero_crossing_rate(y)
-            features.extend([
-                np.mean(zcr),
-                np.std(zcr)
-            ])
-            
-            # 9. 基频特征
-            pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
-            pitch_values = []
-            for t in range(pitches.shape[1]):
-                index = magnitudes[:, t].argmax()
-                pitch = pitches[index, t]
-                if pitch > 0:
-                    pitch_values.append(pitch)
-            
-            if pitch_values:
-                features.extend([
-                    np.mean(pitch_values),
-                    np.std(pitch_values),
-                    np.max(pitch_values),
-                    np.min(pitch_values)
-                ])
-            else:
-                features.extend([0, 0, 0, 0])
-            
-            # 10. 能量特征
-            energy = np.sum(y ** 2) / len(y)
-            features.append(energy)
-            
-            # 展平所有特征
-            flattened_features = []
-            for feature in features:
-                if isinstance(feature, np.ndarray):
-                    flattened_features.extend(feature.flatten())
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - t0
+    
+    def print_timings(self):
+        """打印各阶段耗时"""
+        print("\n各阶段耗时:")
+        for stage, seconds in self.timings.items():
+            print(f"  {stage:<10} {seconds:8.2f} s")
+    
+    def _list_training_files(self):
+        """
+        扫描数据目录，按文件名格式 动物_情绪.m4a 解析标签
+        
+        Returns:
+            list: [(音频路径, 标签, 动物类型, 文件名, 英文情绪)]
+        """
+        entries = []
+        base_dir = os.path.dirname(os.path.dirname(__file__))
+        for animal, folder, animal_cn in (('cat', 'Catvoice', '猫咪'), ('dog', 'Dogvoice', '狗狗')):
+            animal_dir = os.path.join(base_dir, folder)
+            if not os.path.exists(animal_dir):
+                print(f"警告: {animal_cn}音频目录不存在: {animal_dir}")
+                continue
+            print(f"处理{animal_cn}音频...")
+            for audio_file in sorted(os.listdir(animal_dir)):
+                if not audio_file.lower().endswith(('.wav', '.mp3', '.m4a', '.flac')) or '_' not in audio_file:
+                    continue
+                # 解析文件名：猫_情绪.m4a
+                parts = audio_file.split('_')
+                if len(parts) < 2:
+                    continue
+                emotion_cn = parts[1].split('.')[0]  # 去掉扩展名
+                
+                # 检查情绪是否在映射表中
+                if emotion_cn in self.emotion_mapping[animal]:
+                    emotion_en = self.emotion_mapping[animal][emotion_cn]
+                    entries.append((os.path.join(animal_dir, audio_file), f"{animal}_{emotion_en}", animal, audio_file, emotion_en))
                 else:
-                    flattened_features.append(feature)
-            
-            return np.array(flattened_features)
-            
-        except Exception as e:
-            print(f"提取特征失败 {audio_path}: {e}")
-            return None
+                    print(f"  跳过未知情绪: {audio_file} (情绪: {emotion_cn})")
+        return entries
+    
+    def _extract_all(self, paths):
+        """并行提取特征；workers 为 1 或只有一个文件时在当前进程中提取"""
+        if self.workers == 1 or len(paths) <= 1:
+            return [self.extract_audio_features(p) for p in paths]
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(paths))) as pool:
+            return list(pool.map(_extract_file_features, paths, chunksize=max(1, len(paths) // (self.workers * 4))))
     
     def load_training_data(self):
         """
@@ -192,62 +177,32 @@ class AudioEmotionTrainer:
         animal_types = []
         
         print("开始加载训练数据...")
-        
-        # 处理猫咪音频
-        cat_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Catvoice')
-        if os.path.exists(cat_dir):
-            print("处理猫咪音频...")
-            for audio_file in os.listdir(cat_dir):
-                if audio_file.lower().endswith(('.wav', '.mp3', '.m4a', '.flac')):
-                    # 解析文件名：猫_情绪.m4a
-                    if '_' in audio_file:
-                        parts = audio_file.split('_')
-                        if len(parts) >= 2:
-                            emotion_cn = parts[1].split('.')[0]  # 去掉扩展名
-                            
-                            # 检查情绪是否在映射表中
-                            if emotion_cn in self.emotion_mapping['cat']:
-                                emotion_en = self.emotion_mapping['cat'][emotion_cn]
-                                audio_path = os.path.join(cat_dir, audio_file)
-                                features = self.extract_audio_features(audio_path)
-                                
-                                if features is not None:
-                                    X.append(features)
-                                    y.append(f"cat_{emotion_en}")
-                                    animal_types.append('cat')
-                                    print(f"  加载猫咪音频: {audio_file} -> {emotion_en}")
-                            else:
-                                print(f"  跳过未知情绪: {audio_file} (情绪: {emotion_cn})")
-        else:
-            print(f"警告: 猫咪音频目录不存在: {cat_dir}")
-        
-        # 处理狗狗音频
-        dog_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Dogvoice')
-        if os.path.exists(dog_dir):
-            print("处理狗狗音频...")
-            for audio_file in os.listdir(dog_dir):
-                if audio_file.lower().endswith(('.wav', '.mp3', '.m4a', '.flac')):
-                    # 解析文件名：狗_情绪.m4a
-                    if '_' in audio_file:
-                        parts = audio_file.split('_')
-                        if len(parts) >= 2:
-                            emotion_cn = parts[1].split('.')[0]  # 去掉扩展名
-                            
-                            # 检查情绪是否在映射表中
-                            if emotion_cn in self.emotion_mapping['dog']:
-                                emotion_en = self.emotion_mapping['dog'][emotion_cn]
-                                audio_path = os.path.join(dog_dir, audio_file)
-                                features = self.extract_audio_features(audio_path)
-                                
-                                if features is not None:
-                                    X.append(features)
-                                    y.append(f"dog_{emotion_en}")
-                                    animal_types.append('dog')
-                                    print(f"  加载狗狗音频: {audio_file} -> {emotion_en}")
-                            else:
-                                print(f"  跳过未知情绪: {audio_file} (情绪: {emotion_cn})")
-        else:
-            print(f"警告: 狗狗音频目录不存在: {dog_dir}")
+        with self._timed('scan'):
+            entries = self._list_training_files()
+        
+        # 按内容哈希查缓存，只为新增或改变的音频提取特征
+        cache = FeatureCache(self.cache_path) if self.cache_path else None
+        with self._timed('hash'):
+            digests = [file_digest(entry[0]) for entry in entries] if cache is not None else [None] * len(entries)
+        features_list = [cache.get(d) if cache is not None else None for d in digests]
+        missing = [i for i, f in enumerate(features_list) if f is None]
+        if cache is not None:
+            print(f"特征缓存: 命中 {len(entries) - len(missing)} 个，需提取 {len(missing)} 个")
+        with self._timed('extract'):
+            for i, features in zip(missing, self._extract_all([entries[i][0] for i in missing])):
+                features_list[i] = features
+                if cache is not None and features is not None:
+                    cache.put(digests[i], features)
+        if cache is not None and missing:
+            with self._timed('cache'):
+                cache.save(keep=set(digests))
+        
+        for (audio_path, label, animal, audio_file, emotion_en), features in zip(entries, features_list):
+            if features is not None:
+                X.append(features)
+                y.append(label)
+                animal_types.append(animal)
+                print(f"  加载{'猫咪' if animal == 'cat' else '狗狗'}音频: {audio_file} -> {emotion_en}")
         
         if len(X) == 0:
             raise ValueError("没有找到有效的训练数据")
@@ -316,6 +271,7 @@ class AudioEmotionTrainer:
             y: 标签向量
         """
         print("开始训练模型...")
+        t0 = time.perf_counter()
         
         # 数据预处理
         X_scaled = self.scaler.fit_transform(X)
@@ -343,10 +299,12 @@ class AudioEmotionTrainer:
             n_estimators=100,
             max_depth=10,
             random_state=42,
-            n_jobs=-1
+            n_jobs=self.n_jobs
         )
         
         self.model.fit(X_train, y_train)
+        self.timings['fit'] = time.perf_counter() - t0
+        t0 = time.perf_counter()
         
         # 评估模型
         train_score = self.model.score(X_train, y_train)
@@ -379,6 +337,7 @@ class AudioEmotionTrainer:
             print(classification_report(y_test, y_pred, labels=unique_test_labels, target_names=test_class_names))
         else:
             print("\n测试集为空，跳过分类报告")
+        self.timings['evaluate'] = time.perf_counter() - t0
         
         return train_score, test_score
     
@@ -427,11 +386,22 @@ def main():
     """
     主函数
     """
+    parser = argparse.ArgumentParser(description='猫狗叫声情绪识别模型训练')
+    parser.add_argument('--workers', type=int, default=None, help='特征提取进程数（默认 CPU 核数）')
+    parser.add_argument('--n-jobs', type=int, default=None, help='随机森林训练并行数（默认 -1）')
+    parser.add_argument('--cache', default=None, help='特征缓存 npz 路径')
+    parser.add_argument('--no-cache', action='store_true', help='不读写特征缓存')
+    args = parser.parse_args()
+    
     print("=" * 50)
     print("猫狗叫声情绪识别模型训练")
     print("=" * 50)
     
-    trainer = AudioEmotionTrainer()
+    trainer = AudioEmotionTrainer(
+        n_jobs=args.n_jobs,
+        workers=args.workers,
+        cache_path='' if args.no_cache else args.cache,
+    )
     
     try:
         # 尝试加载真实数据
@@ -451,7 +421,9 @@ def main():
     train_acc, test_acc = trainer.train_model(X, y)
     
     # 保存模型
-    trainer.save_model()
+    with trainer._timed('save'):
+        trainer.save_model()
+    trainer.print_timings()
     
     print("\n=" * 50)
     print("训练完成！")
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视觉大模型（VLM）常驻注册表
+
+按 (model_id, device) 缓存已编译的 processor 与 OpenVINO 模型，
+避免 /vision_analyze 每次请求都重新加载、编译模型。
+超出内存预算或数量上限时按 LRU 淘汰。
+"""
+
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from openvino.runtime import Core
+
+
+def _load_ov_vision_model(model_path, device):
+    """
+    默认加载函数：加载 processor 与 OVModelForVisualCausalLM
+
+    Args:
+        model_path: 本地模型目录或在线模型ID
+        device: OpenVINO 推理设备
+
+    Returns:
+        tuple: (processor, ov_model)
+    """
+    from optimum.intel.openvino import OVModelForVisualCausalLM
+    from modelscope import AutoProcessor
+    processor = AutoProcessor.from_pretrained(model_path, trust_remote_code=True)
+    ov_model = OVModelForVisualCausalLM.from_pretrained(model_path, trust_remote_code=True, device=device)
+    return processor, ov_model
+
+
+def _estimate_size_mb(model_path):
+    """按模型目录在磁盘上的大小估算常驻内存（MB），在线模型ID无法估算时返回 0"""
+    if not os.path.isdir(model_path):
+        return 0.0
+    total = 0
+    for root, _, files in os.walk(model_path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total / (1024 * 1024)
+
+
+class VisionModelEntry:
+    def __init__(self, model_path, device, processor, model, size_mb, load_ms):
+        self.model_path = model_path
+        self.device = device
+        self.processor = processor
+        self.model = model
+        self.size_mb = size_mb
+        self.load_ms = load_ms
+        self.uses = 0
+        self.last_used = time.time()
+        # OpenVINO 模型的 generate 不是线程安全的，同一模型的推理需串行
+        self.lock = threading.Lock()
+
+    def info(self):
+        return {
+            "model_dir": self.model_path,
+            "device": self.device,
+            "size_mb": round(self.size_mb, 1),
+            "load_ms": self.load_ms,
+            "uses": self.uses,
+            "last_used": self.last_used,
+        }
+
+
+class VisionModelRegistry:
+    def __init__(self, max_entries=None, budget_mb=None, loader=None):
+        """
+        Args:
+            max_entries: 最多常驻的模型数量，默认读取 OV_VISION_CACHE_SIZE（2）
+            budget_mb: 常驻模型的内存预算（MB），默认读取 OV_VISION_CACHE_MB，0 表示不限
+            loader: 加载函数 loader(model_path, device) -> (processor, model)
+        """
+        if max_entries is None:
+            max_entries = int(os.environ.get("OV_VISION_CACHE_SIZE", "2"))
+        if budget_mb is None:
+            budget_mb = float(os.environ.get("OV_VISION_CACHE_MB", "0"))
+        self.max_entries = max(1, max_entries)
+        self.budget_mb = budget_mb
+        self.loader = loader or _load_ov_vision_model
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._core = None
+        self._available = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+        self.total_load_ms = 0
+
+    def available_devices(self):
+        """返回 OpenVINO 可用设备列表（进程内只探测一次）"""
+        if self._available is None:
+            with self._lock:
+                if self._available is None:
+                    self._core = Core()
+                    self._available = list(self._core.available_devices)
+        return self._available
+
+    def get(self, model_path, device):
+        """
+        获取常驻模型，未命中时加载并按 LRU 淘汰旧模型
+
+        同一 key 的并发加载只会执行一次，其余请求等待其完成。
+
+        Args:
+            model_path: 本地模型目录或在线模型ID
+            device: OpenVINO 推理设备
+
+        Returns:
+            VisionModelEntry: 模型条目
+        """
+        key = (model_path, device)
+        with self._lock:
+            entry = self._touch(key)
+            if entry is not None:
+                return entry
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            try:
+                with self._lock:
+                    entry = self._touch(key)
+                    if entry is not None:
+                        return entry
+                    self.misses += 1
+                t0 = time.time()
+                try:
+                    processor, model = self.loader(model_path, device)
+                except Exception:
+                    with self._lock:
+                        self.load_failures += 1
+                    raise
+                load_ms = int((time.time() - t0) * 1000)
+                entry = VisionModelEntry(model_path, device, processor, model, _estimate_size_mb(model_path), load_ms)
+                entry.uses = 1
+                with self._lock:
+                    self._entries[key] = entry
+                    self.loads += 1
+                    self.total_load_ms += load_ms
+                    self._evict_locked(keep=key)
+            finally:
+                # 加载成功或失败都释放该 key 的锁，失败的 key 不会一直留在 _key_locks 中
+                with self._lock:
+                    if self._key_locks.get(key) is key_lock:
+                        self._key_locks.pop(key)
+        return entry
+
+    def _touch(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        entry.uses += 1
+        entry.last_used = time.time()
+        self.hits += 1
+        return entry
+
+    def _used_mb(self):
+        return sum(e.size_mb for e in self._entries.values())
+
+    def _evict_locked(self, keep=None):
+        evicted = False
+        while len(self._entries) > 1:
+            over_count = len(self._entries) > self.max_entries
+            over_budget = self.budget_mb > 0 and self._used_mb() > self.budget_mb
+            if not (over_count or over_budget):
+                break
+            victim = next((k for k in self._entries if k != keep), None)
+            if victim is None:
+                break
+            self._entries.pop(victim)
+            self.evictions += 1
+            evicted = True
+        if evicted:
+            gc.collect()
+
+    def evict(self, model_path=None, device=None):
+        """
+        手动淘汰模型，参数为空时匹配全部
+
+        Returns:
+            int: 被淘汰的模型数量
+        """
+        with self._lock:
+            victims = [
+                k for k in self._entries
+                if (model_path is None or k[0] == model_path) and (device is None or k[1] == device)
+            ]
+            for k in victims:
+                self._entries.pop(k)
+            self.evictions += len(victims)
+        if victims:
+            gc.collect()
+        return len(victims)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "max_entries": self.max_entries,
+                "budget_mb": self.budget_mb,
+                "used_mb": round(self._used_mb(), 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "loads": self.loads,
+                "load_failures": self.load_failures,
+                "evictions": self.evictions,
+                "avg_load_ms": int(self.total_load_ms / self.loads) if self.loads else 0,
+                "entries": [e.info() for e in reversed(self._entries.values())],
+            }
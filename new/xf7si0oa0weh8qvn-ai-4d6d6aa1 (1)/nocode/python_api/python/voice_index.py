@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+翻译音频索引
+
+启动时扫描 voice(1)/Catvoice 与 voice(1)/Dogvoice，预先算好 情绪 → 音频文件 的映射
+（包括相似情绪与默认音频的回退），并把这些小文件整体读入内存，
+/translate 与 /audio 不再逐次探测、读取磁盘。目录内容变化时自动重建索引。
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+# 目标动物 → (子目录, 文件名前缀)
+VOICE_FOLDERS = {
+    'cat': ('Catvoice', '猫'),
+    'dog': ('Dogvoice', '狗'),
+}
+
+# 找不到对应情绪的音频时，按相似情绪回退
+EMOTION_MAPPING = {
+    '兴奋捕猎': ['兴奋', '捕猎', '活跃'],
+    '友好呼唤': ['友好', '呼唤', '打招呼'],
+    '撒娇': ['撒娇', '可爱', '亲昵'],
+    '警告': ['警告', '威胁', '生气'],
+    '饿了': ['饿了', '要食物', '饥饿'],
+    '着急': ['着急', '焦虑', '不安'],
+    '求偶': ['求偶', '发情'],
+    '哀求': ['哀求', '请求', '委屈']
+}
+
+# 相似情绪也找不到时使用的默认音频
+DEFAULT_EMOTIONS = ['打招呼', '撒娇', '友好呼唤']
+
+
+class VoiceClip:
+    def __init__(self, filename, path, size, mtime_ns, data=None):
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.data = data
+        if data is not None:
+            self.etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        else:
+            self.etag = '"%x-%x"' % (size, mtime_ns)
+
+
+class VoiceIndex:
+    def __init__(self, voice_dir=None, max_mb=None, check_interval=None):
+        """
+        Args:
+            voice_dir: 音频根目录，默认读取 VOICE_DIR（../../voice(1)）
+            max_mb: 读入内存的音频总大小上限（MB），默认读取 VOICE_CACHE_MB（32），超出部分按路径读取
+            check_interval: 检查目录变化的最短间隔（秒），默认读取 VOICE_INDEX_CHECK_S（2），0 表示每次访问都检查
+        """
+        if voice_dir is None:
+            voice_dir = os.environ.get("VOICE_DIR", os.path.join('..', '..', 'voice(1)'))
+        if max_mb is None:
+            max_mb = float(os.environ.get("VOICE_CACHE_MB", "32"))
+        if check_interval is None:
+            check_interval = float(os.environ.get("VOICE_INDEX_CHECK_S", "2"))
+        self.voice_dir = voice_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.check_interval = max(0.0, check_interval)
+        self._lock = threading.Lock()
+        self._signature = None
+        self._checked_at = 0.0
+        self._clips = {}
+        self._resolved = {}
+        self._fallback = {}
+        self.reloads = 0
+        self.memory_bytes = 0
+
+    def _scan_signature(self):
+        signature = []
+        for folder, prefix in VOICE_FOLDERS.values():
+            folder_path = os.path.join(self.voice_dir, folder)
+            try:
+                entries = list(os.scandir(folder_path))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_file() and entry.name.startswith(prefix + '_'):
+                    st = entry.stat()
+                    signature.append((folder, entry.name, st.st_size, st.st_mtime_ns))
+        return tuple(sorted(signature))
+
+    def _build(self, signature):
+        clips = {}
+        budget = self.max_bytes
+        memory_bytes = 0
+        for folder, filename, size, mtime_ns in signature:
+            path = os.path.join(self.voice_dir, folder, filename)
+            data = None
+            if size <= budget:
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    budget -= len(data)
+                    memory_bytes += len(data)
+                except OSError:
+                    continue
+            clips[filename] = VoiceClip(filename, path, size, mtime_ns, data)
+
+        resolved = {}
+        fallback = {}
+        for animal, (folder, prefix) in VOICE_FOLDERS.items():
+            table = {}
+            for available_emotion, similar_emotions in EMOTION_MAPPING.items():
+                filename = f"{prefix}_{available_emotion}.m4a"
+                if filename in clips:
+                    for emotion in similar_emotions:
+                        table.setdefault(emotion, filename)
+            resolved[animal] = table
+            fallback[animal] = next(
+                (f"{prefix}_{e}.m4a" for e in DEFAULT_EMOTIONS if f"{prefix}_{e}.m4a" in clips), None)
+
+        self._clips = clips
+        self._resolved = resolved
+        self._fallback = fallback
+        self.memory_bytes = memory_bytes
+        self._signature = signature
+        self.reloads += 1
+
+    def refresh(self, force=False):
+        """目录内容（文件名、大小、修改时间）变化时重建索引"""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._signature is not None and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            signature = self._scan_signature()
+            if force or signature != self._signature:
+                self._build(signature)
+
+    def resolve(self, target_animal, emotion):
+        """
+        查找翻译音频
+
+        Args:
+            target_animal: 目标动物 'cat' / 'dog'
+            emotion: 识别出的情绪
+
+        Returns:
+            tuple: (音频文件名, 相对路径)；都找不到时返回按情绪拼出的文件名（文件不存在）
+        """
+        self.refresh()
+        folder, prefix = VOICE_FOLDERS[target_animal]
+        filename = f"{prefix}_{emotion}.m4a"
+        if filename not in self._clips:
+            filename = (self._resolved.get(target_animal, {}).get(emotion)
+                        or self._fallback.get(target_animal)
+                        or filename)
+        return filename, os.path.join(self.voice_dir, folder, filename)
+
+    def get(self, filename):
+        """按文件名取音频，不存在时返回 None"""
+        self.refresh()
+        return self._clips.get(filename)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "voice_dir": self.voice_dir,
+                "clips": len(self._clips),
+                "in_memory": sum(1 for c in self._clips.values() if c.data is not None),
+                "memory_mb": round(self.memory_bytes / (1024 * 1024), 3),
+                "max_mb": self.max_bytes / (1024 * 1024),
+                "reloads": self.reloads,
+            }